@@ -1,37 +1,138 @@
-from datetime import datetime
 import logging
 import threading
-import time
-from typing import List
-from openant.easy.node import Node
+from typing import Callable, List, Optional
+
 from openant.devices import ANTPLUS_NETWORK_KEY
 from openant.devices.bike_speed_cadence import (
-    BikeSpeedData,
     BikeCadenceData,
+    BikeSpeedData,
 )
+from openant.devices.common import AntPlusDevice, BatteryData, DeviceData, DeviceType
 from openant.devices.heart_rate import HeartRateData
 from openant.devices.power_meter import PowerData
-from openant.devices.common import AntPlusDevice, BatteryData, DeviceData
-from openant.devices.common import DeviceType
 from openant.devices.scanner import Scanner
-
 from openant.devices.utilities import auto_create_device
 
-from app.model import MetricsModel, MetricsSettingsModel, DeviceModel, SportZone
-from app.util import CumulativeSumMap, MetricsKey, TimedMap, TimedMovingAverage
+from app.broadcast import SampleBroadcaster
+from app.channels import Backoff, ChannelManager, ChannelNode
+from app.clock import SYSTEM_CLOCK, Clock
+from app.core import PACKET_LOGGER
+from app.energy import EnergyAccumulator
+from app.filters import FilterMap
+from app.hrv import DEFAULT_WINDOW_S, HrvAccumulator
+from app.model import (
+    DeviceModel,
+    IngestStatsModel,
+    LifecycleState,
+    MetricsModel,
+    MetricsSettingsModel,
+    SportZone,
+)
+from app.pairing import PairingCache
+from app.util import DistanceAccumulator, MetricsKey, TimedMap, TimedMovingAverage
+
+# channels without data for this long are closed and left to the scanner
+CHANNEL_IDLE_TIMEOUT_SECONDS = 30
+HOUSEKEEPING_SECONDS = 5
+# the node and housekeeping threads are woken on stop, this only guards
+# against a hung USB read
+STOP_JOIN_TIMEOUT_SECONDS = 2
+# a node that ran this long before failing restarts with the shortest backoff
+STABLE_NODE_SECONDS = 60
+
+# memory caps for long runs at events with many sensors around
+MAX_PAGE_SIGNATURES = 256
+MAX_SCANNER_FOUND = 256
+
+SENSOR_DEVICE_TYPES = (
+    DeviceType.BikeCadence,
+    DeviceType.BikeSpeed,
+    DeviceType.BikeSpeedCadence,
+    DeviceType.HeartRate,
+    DeviceType.PowerMeter,
+    # smart trainers report power and take ERG commands, see app/trainer.py
+    DeviceType.FitnessEquipment,
+)
+
+
+class _IngestState:
+    """
+    Everything one collection run accumulates. Start and stop swap in a new
+    instance with a single reference assignment, ingest and readers take the
+    reference once per page or snapshot, so nobody sees a half reset state.
+    """
+
+    __slots__ = (
+        "time_map",
+        "timed_moving_average",
+        "distance",
+        "filter_map",
+        "hrv",
+        "energy",
+        "last_sensor_update",
+        "last_sensor_name",
+        "page_signatures",
+        "pages_received",
+        "pages_skipped",
+    )
+
+    def __init__(self, metrics_settings: MetricsSettingsModel, clock: Clock):
+        self.time_map = TimedMap(ttl=15, clock=clock)
+        self.timed_moving_average = TimedMovingAverage(ttl=40, clock=clock)
+        self.distance = DistanceAccumulator(clock=clock)
+        self.filter_map = FilterMap(metrics_settings.filters, clock=clock)
+        self.hrv = HrvAccumulator(
+            metrics_settings.hrv_window_s or DEFAULT_WINDOW_S, clock=clock
+        )
+        self.energy = EnergyAccumulator(
+            metrics_settings.cp or metrics_settings.ftp,
+            metrics_settings.w_prime,
+            clock=clock,
+        )
+
+        self.last_sensor_update = None
+        self.last_sensor_name = None
+
+        # raw event counters of the last page per (device_id, page_name),
+        # only touched from the node thread
+        self.page_signatures = {}
+        self.pages_received = 0
+        self.pages_skipped = 0
 
 
 class Metrics:
     def __init__(
         self,
         metrics_settings: MetricsSettingsModel = MetricsSettingsModel(),
+        clock: Clock = SYSTEM_CLOCK,
+        pairing_cache: Optional[PairingCache] = None,
+        broadcaster: Optional[SampleBroadcaster] = None,
     ):
         self._logger = logging.getLogger("app.metrics")
+        self._packet_logger = logging.getLogger(PACKET_LOGGER)
+        self._clock = clock
+        self.pairing_cache = pairing_cache or PairingCache(clock=clock)
+        self.broadcaster = broadcaster
 
         self._node = None
         self._node_thread = None
+        self._housekeeping_thread = None
+        self._stop_event = threading.Event()
+        self._backoff = Backoff()
+        # serializes start and stop, held while waiting for threads
+        self._lifecycle_lock = threading.Lock()
+        # node, devices and channels, only held briefly
         self._lock = threading.Lock()
+        self._lifecycle = LifecycleState.STOPPED
         self._devices: List[AntPlusDevice] = []
+        self.scanner = None
+        self.channel_manager = ChannelManager(
+            idle_timeout=CHANNEL_IDLE_TIMEOUT_SECONDS, clock=clock
+        )
+        self._sample_listeners: List[Callable[[MetricsKey, float, float], None]] = []
+        self._update_listeners: List[Callable[[int], None]] = []
+        self._seq = 0
+        self._seq_lock = threading.Lock()
 
         if metrics_settings is None:
             self._metrics_settings: MetricsSettingsModel = MetricsSettingsModel()
@@ -39,108 +140,275 @@ class Metrics:
             self._metrics_settings = metrics_settings
 
         self._reset_metrics()
-        self._is_running = False
 
     def is_running(self) -> bool:
-        return self._is_running
+        return self._lifecycle == LifecycleState.RUNNING
+
+    def get_lifecycle_state(self) -> LifecycleState:
+        return self._lifecycle
+
+    # the current run's state, for callers outside the ingest path
+    @property
+    def time_map(self) -> TimedMap:
+        return self._state.time_map
+
+    @property
+    def timed_moving_average(self) -> TimedMovingAverage:
+        return self._state.timed_moving_average
+
+    @property
+    def distance(self) -> DistanceAccumulator:
+        return self._state.distance
+
+    @property
+    def filter_map(self) -> FilterMap:
+        return self._state.filter_map
 
     def set_metrics_settings(self, metrics_settings: MetricsSettingsModel):
-        self._logger.debug(f"Setting metrics settings: {metrics_settings}")
+        """
+        Swaps the settings, also while running. Ingest reads the settings
+        once per page, accumulated values are kept. Filter chains restart
+        only when they changed, a changed device filter opens and closes
+        just the affected channels.
+        """
+        self._logger.debug("Setting metrics settings: %s", metrics_settings)
         if metrics_settings is None:
             self._logger.warning("Received None for metrics settings, ignoring update")
             raise ValueError(
                 "Metrics settings must be a valid MetricsSettingsModel object"
             )
-        self._metrics_settings = metrics_settings
-        self._logger.debug(f"Updating metrics_settings: {self._metrics_settings}")
+        with self._lock:
+            previous = self._metrics_settings
+            self._metrics_settings = metrics_settings
+            if metrics_settings.filters != previous.filters:
+                self._state.filter_map = FilterMap(
+                    metrics_settings.filters, clock=self._clock
+                )
+            self._state.hrv.window_s = metrics_settings.hrv_window_s or DEFAULT_WINDOW_S
+            self._state.energy.set_parameters(
+                metrics_settings.cp or metrics_settings.ftp, metrics_settings.w_prime
+            )
+            self.channel_manager.preferred = set(metrics_settings.device_ids or [])
+            if (
+                metrics_settings.device_ids != previous.device_ids
+                and self.is_running()
+                and self.scanner is not None
+            ):
+                self._apply_device_filter()
+
+    def _allows_device(self, device_id: int) -> bool:
+        filter_device_ids = self._metrics_settings.device_ids
+        return not filter_device_ids or device_id in filter_device_ids
+
+    def _apply_device_filter(self):
+        """
+        Closes channels the device filter excludes now and opens the ones it
+        newly allows, from the pairing cache or the scanner's found devices.
+        Called with lock held.
+        """
+        for dev in list(self._devices):
+            if not self._allows_device(dev.device_id):
+                self._logger.info("Closing filtered device_id: %s", dev.device_id)
+                self._close_device(dev.device_id)
+
+        self._open_paired_devices()
+        for device_tuple in list(self.scanner.found):
+            device_id = device_tuple[0]
+            if self._allows_device(device_id) and not self.channel_manager.is_open(
+                device_id
+            ):
+                self._open_device(device_tuple)
 
     def get_metrics_settings(self) -> MetricsSettingsModel:
         return self._metrics_settings
 
+    def add_sample_listener(self, listener: Callable[[MetricsKey, float, float], None]):
+        """
+        Register a callback that is called at ingest time for every metric
+        sample with (key, value, monotonic time).
+        """
+        self._sample_listeners.append(listener)
+
+    def _notify_sample(self, key: MetricsKey, value, device_id: int = 0):
+        if value is None:
+            return
+        if self.broadcaster is not None:
+            try:
+                self.broadcaster.send(
+                    key, device_id, self._clock.now().timestamp(), value
+                )
+            except Exception:
+                self._logger.warning("Error broadcasting sample", exc_info=True)
+        if not self._sample_listeners:
+            return
+        now = self._clock.monotonic()
+        for listener in self._sample_listeners:
+            try:
+                listener(key, value, now)
+            except Exception:
+                self._logger.warning("Error in sample listener", exc_info=True)
+
+    def add_update_listener(self, listener: Callable[[int], None]):
+        """
+        Register a callback that is called with the new sequence number
+        whenever the metrics snapshot changed.
+        """
+        self._update_listeners.append(listener)
+
+    def _publish_update(self):
+        with self._seq_lock:
+            self._seq += 1
+            seq = self._seq
+        for listener in self._update_listeners:
+            try:
+                listener(seq)
+            except Exception:
+                self._logger.warning("Error in update listener", exc_info=True)
+
     def start(self):
-        with self._lock:  # acquire and release automatically
-            if self._is_running:
+        with self._lifecycle_lock, self._lock:
+            if self._lifecycle != LifecycleState.STOPPED:
                 self._logger.warning("Metrics collection already running")
                 return
 
+            self._lifecycle = LifecycleState.STARTING
             try:
-                self._devices: list[AntPlusDevice] = []
-                self._node = Node()
-                self._node.set_network_key(0x00, ANTPLUS_NETWORK_KEY)
-
-                self.scanner = Scanner(self._node, device_id=0, device_type=0)
-                self.scanner.on_found = self._scanner_on_found
-
-            except Exception as e:
-                self._logger.warning(
-                    "Error initializing ANT+ node or scanner", exc_info=True
-                )
-                self._node.stop() if self._node else None
-                raise e
+                self._stop_event.clear()
+                self._backoff.reset()
+                self._create_node()
+            except Exception:
+                self._lifecycle = LifecycleState.STOPPED
+                raise
 
+            self._reset_metrics()
+            self._lifecycle = LifecycleState.RUNNING
+            self._open_paired_devices()
             self._node_thread = threading.Thread(target=self._run_node, daemon=True)
             self._node_thread.start()
-            self._is_running = True
+            self._housekeeping_thread = threading.Thread(
+                target=self._run_housekeeping, daemon=True
+            )
+            self._housekeeping_thread.start()
+        self._publish_update()
 
     def stop(self):
-        with self._lock:
-            if not self._is_running:
-                self._logger.warning("Metrics collection already stopped")
-                return
+        with self._lifecycle_lock:
+            with self._lock:
+                if self._lifecycle != LifecycleState.RUNNING:
+                    self._logger.warning("Metrics collection already stopped")
+                    return
+
+                self._lifecycle = LifecycleState.STOPPING
+                # wakes up a node restart backoff and the housekeeping thread
+                self._stop_event.set()
+                self._update_pairing_cache()
+                self._stop_node()
+
+            # Wait for threads without the lock so a callback in the node
+            # thread can finish, both are woken above and return promptly
+            self._join_threads(self._node_thread, self._housekeeping_thread)
+
+            self._reset_metrics()
+            self._lifecycle = LifecycleState.STOPPED
+        self._publish_update()
+        self.pairing_cache.save()
+
+    def _join_threads(self, *threads: Optional[threading.Thread]):
+        for thread in threads:
+            if thread and thread is not threading.current_thread():
+                thread.join(timeout=STOP_JOIN_TIMEOUT_SECONDS)
+                if thread.is_alive():
+                    self._logger.warning("Thread %s did not stop", thread.name)
+
+    def _create_node(self):
+        """Creates node and scanner, called with lock held."""
+        try:
+            self._devices: list[AntPlusDevice] = []
+            self._node = ChannelNode()
+            self._node.set_network_key(0x00, ANTPLUS_NETWORK_KEY)
+            self.channel_manager = ChannelManager(
+                capacity=self._node.max_channels,
+                idle_timeout=CHANNEL_IDLE_TIMEOUT_SECONDS,
+                preferred=self._metrics_settings.device_ids,
+                clock=self._clock,
+            )
 
-            self._is_running = False
-            self._cleanup_devices()
+            self.scanner = Scanner(self._node, device_id=0, device_type=0)
+            self.scanner.on_found = self._scanner_on_found
 
-            if self._node:
-                try:
-                    self._logger.debug("Stopping ANT+ node")
-                    self._node.stop()
-                except Exception:
-                    self._logger.warning("Error stopping ANT+ node", exc_info=True)
+        except Exception as e:
+            self._logger.warning(
+                "Error initializing ANT+ node or scanner", exc_info=True
+            )
+            self._node.stop() if self._node else None
+            raise e
 
-            # Wait for thread but don’t block forever
-            if self._node_thread and self._node_thread.is_alive():
-                self._node_thread.join(timeout=1)  # short timeout
+    def _stop_node(self):
+        """Closes all device channels and stops the node, called with lock held."""
+        self._cleanup_devices()
 
-            self._reset_metrics()
+        if self._node:
+            try:
+                self._logger.debug("Stopping ANT+ node")
+                self._node.stop()
+            except Exception:
+                self._logger.warning("Error stopping ANT+ node", exc_info=True)
+
+    def get_seq(self) -> int:
+        return self._seq
 
     def get_metrics(self) -> MetricsModel:
+        # read first, the snapshot below contains at least this update
+        seq = self._seq
 
-        if self._is_running is False:
+        if not self.is_running():
             metrics = {
                 "is_running": False,
+                "seq": seq,
             }
             return MetricsModel(**metrics)
 
+        # after the running check, start swaps the state before it is running
+        state = self._state
+        age = self._metrics_settings.age
+
         # power
-        power = self.time_map.get(MetricsKey.POWER)
-        ma_power = self.timed_moving_average.average(MetricsKey.POWER)
+        power = state.time_map.get(MetricsKey.POWER)
+        ma_power = state.timed_moving_average.average(MetricsKey.POWER)
+        smooth_power = state.filter_map.get(MetricsKey.POWER)
 
         # speed
-        speed = self.time_map.get(MetricsKey.SPEED)
-        ma_speed = self.timed_moving_average.average(MetricsKey.SPEED)
+        speed = state.time_map.get(MetricsKey.SPEED)
+        ma_speed = state.timed_moving_average.average(MetricsKey.SPEED)
+        smooth_speed = state.filter_map.get(MetricsKey.SPEED)
 
         # cadence
-        cadence = self.time_map.get(MetricsKey.CADENCE)
-        ma_cadence = self.timed_moving_average.average(MetricsKey.CADENCE)
+        cadence = state.time_map.get(MetricsKey.CADENCE)
+        ma_cadence = state.timed_moving_average.average(MetricsKey.CADENCE)
+        smooth_cadence = state.filter_map.get(MetricsKey.CADENCE)
+
+        # heart rate variability
+        rr_interval, rmssd, sdnn = state.hrv.snapshot()
+
+        # work and W' balance
+        work_kj, energy_kcal, w_prime_balance, w_prime_balance_percent = (
+            state.energy.snapshot()
+        )
 
         # distance
-        distance = self.time_map.get(MetricsKey.DISTANCE)
-        ma_distance = self.sum_map.sum(MetricsKey.DISTANCE)
+        distance = state.time_map.get(MetricsKey.DISTANCE)
+        ma_distance, distance_by_device = state.distance.snapshot()
 
         # heart rate & zone
-        heart_rate = self.time_map.get(MetricsKey.HEART_RATE)
-        heart_rate_percent = SportZone.percent_from_age(
-            self._metrics_settings.age, heart_rate
-        )
+        heart_rate = state.time_map.get(MetricsKey.HEART_RATE)
+        heart_rate_percent = SportZone.percent_from_age(age, heart_rate)
         zone = SportZone.from_hr_percent(heart_rate_percent)
         if zone == SportZone.UNKNOWN:
             zone = None
 
-        ma_heart_rate = self.timed_moving_average.average(MetricsKey.HEART_RATE)
-        ma_heart_rate_percent = SportZone.percent_from_age(
-            self._metrics_settings.age, ma_heart_rate
-        )
+        ma_heart_rate = state.timed_moving_average.average(MetricsKey.HEART_RATE)
+        smooth_heart_rate = state.filter_map.get(MetricsKey.HEART_RATE)
+        ma_heart_rate_percent = SportZone.percent_from_age(age, ma_heart_rate)
         ma_zone = SportZone.from_hr_percent(ma_heart_rate_percent)
         if ma_zone == SportZone.UNKNOWN:
             ma_zone = None
@@ -148,35 +416,52 @@ class Metrics:
         metrics = {
             "power": power,
             "ma_power": ma_power,
+            "smooth_power": smooth_power,
             "speed": speed,
             "ma_speed": ma_speed,
+            "smooth_speed": smooth_speed,
             "cadence": cadence,
             "ma_cadence": ma_cadence,
+            "smooth_cadence": smooth_cadence,
             "distance": distance,
             "ma_distance": ma_distance,
+            "distance_by_device": distance_by_device or None,
             "heart_rate": heart_rate,
             "ma_heart_rate": ma_heart_rate,
+            "smooth_heart_rate": smooth_heart_rate,
             "heart_rate_percent": heart_rate_percent,
             "ma_heart_rate_percent": ma_heart_rate_percent,
             "zone_name": zone.name if zone else None,
             "ma_zone_name": ma_zone.name if ma_zone else None,
             "zone_description": zone.value if zone else None,
             "ma_zone_description": ma_zone.value if ma_zone else None,
-            "is_running": self._is_running,
-            "last_sensor_update": self.last_sensor_update,
-            "last_sensor_name": self.last_sensor_name,
+            "rr_interval": rr_interval,
+            "rmssd": rmssd,
+            "sdnn": sdnn,
+            "work_kj": work_kj,
+            "energy_kcal": energy_kcal,
+            "w_prime_balance": w_prime_balance,
+            "w_prime_balance_percent": w_prime_balance_percent,
+            "is_running": True,
+            "last_sensor_update": state.last_sensor_update,
+            "last_sensor_name": state.last_sensor_name,
+            "seq": seq,
         }
 
         return MetricsModel(**metrics)
 
     def _reset_metrics(self):
-
-        self.time_map = TimedMap(ttl=15)
-        self.timed_moving_average = TimedMovingAverage(ttl=40)
-        self.sum_map = CumulativeSumMap()
-
-        self.last_sensor_update = None
-        self.last_sensor_name = None
+        self._state = _IngestState(self._metrics_settings, self._clock)
+
+    def get_ingest_stats(self) -> IngestStatsModel:
+        state = self._state
+        received = state.pages_received
+        skipped = state.pages_skipped
+        return IngestStatsModel(
+            pages_received=received,
+            pages_skipped=skipped,
+            skip_ratio=skipped / received if received else None,
+        )
 
     def get_devices(self) -> List[DeviceModel]:
 
@@ -187,53 +472,141 @@ class Metrics:
             for dev in self._devices
         ]
 
-    def _on_device_data(self, page: int, page_name: str, data: DeviceData):
+    def get_trainer(self) -> Optional[AntPlusDevice]:
+        """The open FE-C trainer, None without one or while not running."""
+        with self._lock:
+            if not self.is_running():
+                return None
+            for dev in self._devices:
+                if dev.device_type == DeviceType.FitnessEquipment.value:
+                    return dev
+        return None
+
+    @staticmethod
+    def _page_signature(data: DeviceData, dev):
+        """
+        Raw event counters of a data page, sensors rebroadcast the same values
+        until a new event happens. None means the page is always processed.
+        """
+        if isinstance(data, BikeSpeedData):
+            return (data.bike_speed_event_time[1], data.cumulative_speed_revolution[1])
+        if isinstance(data, BikeCadenceData):
+            return (
+                data.bike_cadence_event_time[1],
+                data.cumulative_cadence_revolution[1],
+            )
+        if isinstance(data, HeartRateData):
+            return (data.beat_time, data.beat_count, data.heart_rate)
+        if isinstance(data, PowerData):
+            # openant keeps the power event count on the device, not in PowerData
+            event_count = getattr(dev, "_power_update_event_count", None)
+            if event_count is None:
+                return None
+            return (event_count[1], data.instantaneous_power)
+        return None
+
+    def _on_device_page(self, dev, page: int, page_name: str, data: DeviceData):
+        """Skips pages with unchanged event counters before any calculation."""
+        state = self._state
+        state.pages_received += 1
+        # a repeated page still shows the sensor is in range
+        self.channel_manager.touch(dev.device_id)
+        signature = self._page_signature(data, dev)
+        if signature is not None:
+            key = (dev.device_id, page_name)
+            if state.page_signatures.get(key) == signature:
+                state.pages_skipped += 1
+                return
+            if len(state.page_signatures) >= MAX_PAGE_SIGNATURES:
+                # costs at most one unskipped page per sensor
+                state.page_signatures.clear()
+            state.page_signatures[key] = signature
+        self._on_device_data(page, page_name, data, dev.device_id, state)
+
+    def _on_device_data(
+        self,
+        page: int,
+        page_name: str,
+        data: DeviceData,
+        device_id: int = 0,
+        state: Optional[_IngestState] = None,
+    ):
+        if state is None:
+            state = self._state
+        # one consistent settings object per packet, it may be swapped anytime
+        settings = self._metrics_settings
+        # evaluated once per packet, the log calls below are skipped entirely
+        debug = self._packet_logger.isEnabledFor(logging.DEBUG)
         try:
             if isinstance(data, BikeCadenceData):
                 cadence = data.calculate_cadence()
-                self.time_map.set(MetricsKey.CADENCE, cadence)
-                self.timed_moving_average.add(MetricsKey.CADENCE, cadence)
-                self._logger.debug("cadence: %s", cadence)
+                state.time_map.set(MetricsKey.CADENCE, cadence)
+                state.timed_moving_average.add(MetricsKey.CADENCE, cadence)
+                state.filter_map.add(MetricsKey.CADENCE, cadence)
+                self._notify_sample(MetricsKey.CADENCE, cadence, device_id)
+                if debug:
+                    self._packet_logger.debug("cadence: %s", cadence)
 
             if isinstance(data, HeartRateData):
                 heart_rate = int(round(data.heart_rate))
-                self.time_map.set(MetricsKey.HEART_RATE, heart_rate)
-                self.timed_moving_average.add(MetricsKey.HEART_RATE, heart_rate)
-                self._logger.debug("heart_rate: %s", heart_rate)
+                state.time_map.set(MetricsKey.HEART_RATE, heart_rate)
+                state.timed_moving_average.add(MetricsKey.HEART_RATE, heart_rate)
+                state.filter_map.add(MetricsKey.HEART_RATE, heart_rate)
+                self._notify_sample(MetricsKey.HEART_RATE, heart_rate, device_id)
+                # page 4 also carries the time of the beat before
+                rr = state.hrv.add(
+                    device_id,
+                    data.beat_time,
+                    data.beat_count,
+                    data.previous_heart_beat_time if page & 0x0F == 4 else None,
+                )
+                if debug:
+                    self._packet_logger.debug("heart_rate: %s, rr: %s", heart_rate, rr)
 
             if isinstance(data, BikeSpeedData):
-                speed_wheel_circumference_m = (
-                    self._metrics_settings.speed_wheel_circumference_m
-                )
+                speed_wheel_circumference_m = settings.speed_wheel_circumference_m
                 if (
                     speed_wheel_circumference_m is not None
                     and speed_wheel_circumference_m > 0
                 ):
                     speed = data.calculate_speed(speed_wheel_circumference_m)
-                    self.time_map.set(MetricsKey.SPEED, speed)
-                    self.timed_moving_average.add(MetricsKey.SPEED, speed)
-                    self._logger.debug("speed: %s", speed)
-
-                distance_wheel_circumference = (
-                    self._metrics_settings.distance_wheel_circumference_m
-                )
+                    state.time_map.set(MetricsKey.SPEED, speed)
+                    state.timed_moving_average.add(MetricsKey.SPEED, speed)
+                    state.filter_map.add(MetricsKey.SPEED, speed)
+                    self._notify_sample(MetricsKey.SPEED, speed, device_id)
+                    if debug:
+                        self._packet_logger.debug("speed: %s", speed)
+
+                distance_wheel_circumference = settings.distance_wheel_circumference_m
                 if (
                     distance_wheel_circumference is not None
                     and distance_wheel_circumference > 0
                 ):
-                    distance = data.calculate_distance(distance_wheel_circumference)
-                    self.time_map.set(MetricsKey.DISTANCE, distance)
-                    self.sum_map.add(MetricsKey.DISTANCE, distance)
-                    self._logger.debug("distance: %s", distance)
+                    state.distance.add(
+                        device_id,
+                        data.cumulative_speed_revolution[1],
+                        distance_wheel_circumference,
+                    )
+                    distance = state.distance.sum(device_id)
+                    state.time_map.set(MetricsKey.DISTANCE, distance)
+                    # the total of all speed sensors belongs to none of them
+                    self._notify_sample(MetricsKey.DISTANCE, state.distance.sum())
+                    if debug:
+                        self._packet_logger.debug("distance: %s", distance)
 
             if isinstance(data, PowerData):
                 power = int(round(data.instantaneous_power))
-                self.time_map.set(MetricsKey.POWER, power)
-                self.timed_moving_average.add(MetricsKey.POWER, power)
-                self._logger.debug("power: %s", power)
-
-            self.last_sensor_update = datetime.now().astimezone()
-            self.last_sensor_name = page_name
+                state.time_map.set(MetricsKey.POWER, power)
+                state.timed_moving_average.add(MetricsKey.POWER, power)
+                state.filter_map.add(MetricsKey.POWER, power)
+                state.energy.add(power)
+                self._notify_sample(MetricsKey.POWER, power, device_id)
+                if debug:
+                    self._packet_logger.debug("power: %s", power)
+
+            state.last_sensor_update = self._clock.now()
+            state.last_sensor_name = page_name
+            self._publish_update()
 
         except Exception:
             self._logger.warning("Error processing device data update", exc_info=True)
@@ -248,64 +621,191 @@ class Metrics:
             device_trans,
             self._metrics_settings,
         )
-        filter_device_ids = self._metrics_settings.device_ids
-        if filter_device_ids is None or len(filter_device_ids) == 0:
-            self._create_sensor_device(device_id, device_type, device_trans)
-        else:
-            if device_id in filter_device_ids:
-                self._create_sensor_device(device_id, device_type, device_trans)
+        self._create_sensor_device(device_id, device_type, device_trans)
 
     def _create_sensor_device(self, device_id, device_type, device_trans):
-        if DeviceType(device_type) in (
-            DeviceType.BikeCadence,
-            DeviceType.BikeSpeed,
-            DeviceType.BikeSpeedCadence,
-            DeviceType.HeartRate,
-            DeviceType.PowerMeter,
-        ):
-            try:
+        with self._lock:
+            # checked under the lock, the filter can change at any time
+            if not self.is_running() or not self._allows_device(device_id):
+                return
+            self._open_device((device_id, device_type, device_trans))
+
+    def _open_paired_devices(self):
+        """
+        Opens dedicated channels for sensors of earlier sessions, the scanner
+        stays the fallback for new sensors. Called with lock held.
+        """
+        paired = [
+            d for d in self.pairing_cache.devices() if self._allows_device(d.device_id)
+        ]
+        for d in paired:
+            device_tuple = (d.device_id, d.device_type, d.trans_type)
+            if self.channel_manager.is_open(d.device_id):
+                continue
+            self._logger.debug("Opening paired device %s", device_tuple)
+            if self._open_device(device_tuple):
+                # the scanner must not report it as new
+                self.scanner.found.add(device_tuple)
+
+    def _open_device(self, device_tuple) -> bool:
+        """Opens a channel for the device if the budget allows, called with lock held."""
+        device_id, device_type, device_trans = device_tuple
+        if DeviceType(device_type) not in SENSOR_DEVICE_TYPES:
+            return False
+
+        allowed, evict_id = self.channel_manager.acquire(device_id)
+        if not allowed:
+            if not self.channel_manager.is_open(device_id):
                 self._logger.info(
-                    "Creating new device with device_id: %s, device_type: %s",
+                    "No free channel for device_id: %s, device_type: %s",
                     device_id,
                     device_type,
                 )
-                dev: AntPlusDevice = auto_create_device(
-                    self._node, device_id, device_type, device_trans
-                )
+                # let the scanner report the device again later
+                self._forget_found(device_tuple)
+            return False
+
+        if evict_id is not None:
+            self._logger.info(
+                "Closing device_id: %s for preferred device_id: %s",
+                evict_id,
+                device_id,
+            )
+            self._close_device(evict_id)
 
-                # print(f"Created device {dev}, type {type(dev)}")
-                dev.on_device_data = lambda page, page_name, data: self._on_device_data(
-                    page, page_name, data
-                )
+        try:
+            self._logger.info(
+                "Creating new device with device_id: %s, device_type: %s",
+                device_id,
+                device_type,
+            )
+            dev: AntPlusDevice = auto_create_device(
+                self._node, device_id, device_type, device_trans
+            )
+
+            # print(f"Created device {dev}, type {type(dev)}")
+            dev.on_device_data = lambda page, page_name, data: self._on_device_page(
+                dev, page, page_name, data
+            )
 
-                # dev.on_battery = lambda data: self._on_device_battery(data)
+            # dev.on_battery = lambda data: self._on_device_battery(data)
+
+            self._devices.append(dev)
+            self.channel_manager.opened(device_id, dev, device_tuple)
+            return True
+        except Exception:
+            self._logger.warning("Could not auto create device", exc_info=True)
+            self._forget_found(device_tuple)
+            return False
+
+    def _update_pairing_cache(self):
+        self.pairing_cache.seen(self.channel_manager.active(HOUSEKEEPING_SECONDS))
+
+    def _forget_found(self, device_tuple):
+        if self.scanner is not None:
+            self.scanner.found.discard(device_tuple)
+
+    def _close_device(self, device_id: int):
+        """Closes the channel of a device so the scanner can find it again, called with lock held."""
+        channel = self.channel_manager.closed(device_id)
+        if channel is None:
+            return
+        try:
+            channel.device.close_channel()
+        except Exception:
+            self._logger.warning("Could not close device channel", exc_info=True)
+        if channel.device in self._devices:
+            self._devices.remove(channel.device)
+        self._forget_found(channel.device_tuple)
+
+    def close_idle_devices(self):
+        """Closes channels of sensors that stopped sending data."""
+        with self._lock:
+            if not self.is_running():
+                return
+            for device_id in self.channel_manager.idle():
+                self._logger.info("Closing idle device_id: %s", device_id)
+                self._close_device(device_id)
+            self._trim_scanner()
+
+    def _trim_scanner(self):
+        """
+        The scanner remembers every sensor in range, at events that are
+        hundreds. Forgets all but the open ones, called with lock held.
+        """
+        scanner = self.scanner
+        if scanner is None or len(scanner.found) <= MAX_SCANNER_FOUND:
+            return
+        open_tuples = set(self.channel_manager.active(float("inf")))
+        self._logger.info("Forgetting %s scanned devices", len(scanner.found))
+        scanner.found.intersection_update(open_tuples)
+        keys = {
+            f"{device_id}:{device_type}" for device_id, device_type, _ in open_tuples
+        }
+        for key in [k for k in scanner.common if k not in keys]:
+            del scanner.common[key]
 
-                self._devices.append(dev)
+    def _run_housekeeping(self):
+        while not self._clock.wait(self._stop_event, HOUSEKEEPING_SECONDS):
+            try:
+                self.close_idle_devices()
+                self._update_pairing_cache()
+                self.pairing_cache.save()
             except Exception:
-                self._logger.warning("Could not auto create device", exc_info=True)
+                self._logger.warning("Error in channel housekeeping", exc_info=True)
 
     def _on_device_battery(self, data: BatteryData):
         self._logger.debug("BatteryData: %s", data)
 
     def _run_node(self):
-        retries = 0
         while True:
-            try:
-                self._logger.debug("Starting ANT+ node")
-                self._is_running = True
-                self._node.start()  # blocking
-                self._logger.debug("Ant+ Node returns from blocking")
-                # exit loop
+            node = self._node
+            # None after a failed rebuild, the next one follows the backoff
+            if node is not None:
+                started = self._clock.monotonic()
+                try:
+                    self._logger.debug("Starting ANT+ node")
+                    node.start()  # blocking
+                    self._logger.debug("Ant+ Node returns from blocking")
+                    # exit loop
+                    break
+                except Exception:
+                    self._logger.warning("Node error", exc_info=True)
+                if self._clock.monotonic() - started >= STABLE_NODE_SECONDS:
+                    self._backoff.reset()
+
+            delay = self._backoff.next_delay()
+            self._logger.warning(
+                "Try node restart in %.1fs (retry=%s)", delay, self._backoff.attempts
+            )
+            if self._clock.wait(self._stop_event, delay):
                 break
-            except Exception:
-                self._logger.warning("Node error", exc_info=True)
-                retries += 1
-                self._logger.warning("Try node restart (retry={retries})")
-                time.sleep(1)
-            finally:
-                self._is_running = False
+            with self._lock:
+                if not self.is_running():
+                    break
+                try:
+                    self._stop_node()
+                    self._create_node()
+                    self._open_paired_devices()
+                except Exception:
+                    self._logger.warning("Node restart failed", exc_info=True)
+                    # never start the stopped node again
+                    self._node = None
 
     def _cleanup_devices(self):
+        self.channel_manager.clear()
+        if isinstance(self._node, ChannelNode):
+            # all channels at once instead of two round trips per device
+            self._devices.clear()
+            try:
+                unconfirmed = self._node.close_all()
+            except Exception:
+                self._logger.warning("Could not close channels", exc_info=True)
+                return
+            if unconfirmed:
+                self._logger.warning("Channels %s did not confirm close", unconfirmed)
+            return
+
         for dev in self._devices:
             try:
                 self._logger.debug(
@@ -1,41 +1,89 @@
 import asyncio
 import json
+import logging
 import os
+import signal
+import threading
+from contextlib import asynccontextmanager
 from pathlib import Path
-import logging
-from typing import List
-from fastapi import APIRouter, FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from typing import FrozenSet, List, Optional, Type
+
+from fastapi import APIRouter, FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
 
 from app.ant import Metrics
+from app.broadcast import SampleBroadcaster, parse_address
+from app.clock import SYSTEM_CLOCK, AcceleratedClock
+from app.core import setup_logging
+from app.library import WorkoutLibrary
+from app.memory import MemoryProfiler, tracemalloc_frames_from_env
 from app.model import (
+    DeviceModel,
+    IngestStatsModel,
     IntervalModel,
     IntervalProgressModel,
+    LapModel,
+    MemoryReportModel,
     MetricsModel,
     MetricsSettingsModel,
-    DeviceModel,
+    SessionReportModel,
+    WorkoutDefinitionModel,
+    WorkoutModel,
+    WorkoutPageModel,
 )
-from app.workout import Timer
-from app.core import setup_logging
+from app.pairing import PairingCache
+from app.session import SessionRecorder, build_report
+from app.sim import SimulatedMetrics
+from app.stream import SequenceNotifier, StreamHub, TickScheduler
+from app.trainer import TrainerController
+from app.workout import Timer, WorkoutTracker
 
 # --------------------
 # Constants
 # --------------------
 current_file = Path(__file__).resolve()
-root_store = current_file.parent.parent
+root_store = os.getenv("AMWA_DATA_DIR", current_file.parent.parent)
 METRICS_FILE = os.path.join(root_store, "metrics.json")
+# single workout of earlier versions, imported into the library once
 WORKOUT_FILE = os.path.join(root_store, "workout.json")
+LIBRARY_FILE = os.path.join(root_store, "workouts.db")
+PAIRING_FILE = os.path.join(root_store, "pairing.json")
+# run with simulated sensors instead of an ANT+ stick
+SIMULATE = os.getenv("AMWA_SIMULATE", "").lower() in ("1", "true", "yes")
+# speed up time for simulations only, e.g. 10 runs a simulated hour in 6 minutes
+CLOCK_FACTOR = float(os.getenv("AMWA_CLOCK_FACTOR", "1"))
+# binary sample broadcast for local programs, see app/broadcast.py
+BROADCAST_UNIX = os.getenv("AMWA_BROADCAST_UNIX")
+BROADCAST_UDP = os.getenv("AMWA_BROADCAST_UDP")
 
 METRICS_DELAY_SECONDS = 0.5
 DEVICES_DELAY_SECONDS = 1
 WORKOUT_DELAY_SECONDS = 0.1
+MAX_STREAM_HZ = 20
+# frames a reconnecting stream client can catch up on, e.g. after a Wi-Fi drop
+REPLAY_SECONDS = 30
+MAX_POLL_TIMEOUT_SECONDS = 60
 
 setup_logging()
 logger = logging.getLogger("app.api")
 shutdown_event = asyncio.Event()  # shared shutdown flag
 
+# all streams of the same rate tick together
+stream_ticks = TickScheduler(shutdown_event)
+metrics_hub = StreamHub("metrics", shutdown_event, stream_ticks, REPLAY_SECONDS)
+# snapshots, a reconnect only needs the latest one; a replayed burst of
+# workout frames would repeat old interval beeps
+devices_hub = StreamHub(
+    "devices", shutdown_event, stream_ticks, REPLAY_SECONDS, keyframes_only=True
+)
+workout_hub = StreamHub(
+    "workout", shutdown_event, stream_ticks, REPLAY_SECONDS, keyframes_only=True
+)
+metrics_updates = SequenceNotifier()
+memory_profiler = MemoryProfiler()
+
 
 # --------------------
 # JSON Persistence Helpers
@@ -66,51 +114,121 @@ def save_metrics_settings(metrics: Metrics):
         logger.warning(f"Failed to save metrics settings: {e}")
 
 
-def load_workout() -> list[IntervalModel]:
-    """Load workout intervals from /tmp or return empty list."""
-    if os.path.exists(WORKOUT_FILE):
-        try:
-            with open(WORKOUT_FILE, "r") as f:
-                data = json.load(f)
-            return [IntervalModel(**i) for i in data]
-        except Exception as e:
-            logger.warning(f"Failed to load workout from {WORKOUT_FILE}: {e}")
-    return []
+def open_library() -> WorkoutLibrary:
+    """Opens the workout library, importing workout.json on first use."""
+    library = WorkoutLibrary(LIBRARY_FILE)
+    if library.count() == 0 and os.path.exists(WORKOUT_FILE):
+        library.import_json(WORKOUT_FILE)
+    return library
 
 
-def save_workout(workout: list[IntervalModel]):
-    """Save workout intervals to /tmp."""
+def load_workout(library: WorkoutLibrary) -> list[IntervalModel]:
+    """Intervals of the selected workout or an empty list."""
     try:
-        data = [i.model_dump() for i in workout]
-        with open(WORKOUT_FILE, "w") as f:
-            json.dump(data, f, indent=2)
-        logger.info(f"Workout saved to {WORKOUT_FILE}")
+        workout = library.selected()
     except Exception as e:
-        logger.warning(f"Failed to save workout: {e}")
+        logger.warning(f"Failed to load selected workout: {e}")
+        return []
+    return workout.intervals if workout else []
 
 
 # --------------------
 # Lifespan: load and save state
 # --------------------
+def begin_shutdown():
+    """Ends all streams and long polls, runs on the event loop."""
+    shutdown_event.set()
+    metrics_updates.close()
+
+
+def install_shutdown_signals(loop: asyncio.AbstractEventLoop):
+    """
+    uvicorn waits for open connections before it runs the lifespan shutdown,
+    so SSE clients would hold up every restart. Chains its SIGINT/SIGTERM
+    handlers to end the streams as soon as the signal arrives.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return  # e.g. TestClient, signals can only be set from the main thread
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(begin_shutdown)
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logging.info("Starting ANT+ Metrics Service...")
+    tracemalloc_frames = tracemalloc_frames_from_env()
+    if tracemalloc_frames:
+        memory_profiler.start(tracemalloc_frames)
+        memory_profiler.snapshot()
 
     # Load metrics settings and workout from /tmp
-    app.state.metrics = Metrics(metrics_settings=load_metrics_settings())
-    app.state.workout = load_workout()
-    app.state.timer = Timer(app.state.workout)
+    clock = SYSTEM_CLOCK
+    if SIMULATE and CLOCK_FACTOR != 1:
+        # real sensors send in real time, only a simulation can be sped up
+        clock = AcceleratedClock(CLOCK_FACTOR)
+    elif CLOCK_FACTOR != 1:
+        logger.warning("AMWA_CLOCK_FACTOR only applies with AMWA_SIMULATE")
+    broadcaster = None
+    if BROADCAST_UNIX or BROADCAST_UDP:
+        broadcaster = SampleBroadcaster(
+            unix_path=BROADCAST_UNIX,
+            multicast_group=parse_address(BROADCAST_UDP) if BROADCAST_UDP else None,
+        )
+    if SIMULATE:
+        app.state.metrics = SimulatedMetrics(
+            metrics_settings=load_metrics_settings(),
+            clock=clock,
+            broadcaster=broadcaster,
+        )
+    else:
+        pairing_cache = PairingCache(PAIRING_FILE)
+        pairing_cache.load()
+        app.state.metrics = Metrics(
+            metrics_settings=load_metrics_settings(),
+            pairing_cache=pairing_cache,
+            broadcaster=broadcaster,
+        )
+    app.state.library = open_library()
+    app.state.workout = load_workout(app.state.library)
+    app.state.timer = Timer(app.state.workout, clock=clock)
+    app.state.tracker = WorkoutTracker(
+        app.state.timer, app.state.metrics.get_metrics_settings
+    )
+    app.state.session = SessionRecorder(app.state.timer, clock=clock)
+    app.state.trainer = TrainerController(
+        app.state.timer,
+        app.state.metrics.get_trainer,
+        app.state.metrics.get_metrics_settings,
+        clock=clock,
+    )
+    app.state.trainer.start()
+    app.state.metrics.add_sample_listener(app.state.tracker.on_sample)
+    app.state.metrics.add_sample_listener(app.state.session.on_sample)
+    app.state.metrics.add_update_listener(metrics_updates.publish)
+    install_shutdown_signals(asyncio.get_running_loop())
 
     yield
 
     logging.info("Shutting down ANT+ Metrics Service...")
-    shutdown_event.set()
+    begin_shutdown()
+    await asyncio.to_thread(app.state.trainer.stop)
     if app.state.metrics:
         await asyncio.to_thread(app.state.metrics.stop)
+    if broadcaster:
+        broadcaster.close()
 
-    # Save current settings/workout on shutdown
+    # Save current settings on shutdown, the library writes immediately
     await asyncio.to_thread(save_metrics_settings, app.state.metrics)
-    await asyncio.to_thread(save_workout, app.state.workout)
+    app.state.library.close()
 
 
 # --------------------
@@ -148,6 +266,8 @@ def get_status():
 @api_router.post("/metrics/start")
 def start_metrics():
     try:
+        if not app.state.metrics.is_running():
+            app.state.session.reset()  # a new session, the last report is gone
         app.state.metrics.start()
         return {"message": "Metrics collection started"}
     except Exception as e:
@@ -166,13 +286,10 @@ def stop_metrics():
 @api_router.post("/metrics/settings")
 def update_metrics_settings(payload: MetricsSettingsModel):
     metrics: Metrics = app.state.metrics
-    if metrics.is_running():
-        raise HTTPException(
-            status_code=400, detail="Cannot update metrics while running"
-        )
     try:
         metrics.set_metrics_settings(payload)
         save_metrics_settings(metrics)  # persist immediately
+        app.state.trainer.wake()  # FTP or lead of trainer targets
         return {"message": f"Metrics settings updated to {payload}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update: {str(e)}")
@@ -186,14 +303,43 @@ def get_metrics_settings():
         raise HTTPException(status_code=500, detail=f"Failed to get settings: {str(e)}")
 
 
-@api_router.get("/metrics", response_model=MetricsModel)
-def get_metrics():
+@api_router.get(
+    "/metrics",
+    response_model=MetricsModel,
+    responses={304: {"description": "No newer snapshot than after"}},
+)
+async def get_metrics(
+    after: Optional[int] = Query(
+        None, ge=0, description="Only return a snapshot with seq newer than this"
+    ),
+    timeout: float = Query(
+        0,
+        ge=0,
+        le=MAX_POLL_TIMEOUT_SECONDS,
+        description="Seconds to wait for a newer snapshot",
+    ),
+):
+    """
+    Latest metrics snapshot. With after, long-polls until a snapshot newer
+    than that seq exists and answers 304 without body when none arrived
+    within timeout.
+    """
+    if after is not None and not await metrics_updates.wait(after, timeout):
+        return Response(status_code=304)
     try:
-        return app.state.metrics.get_metrics()
+        return await asyncio.to_thread(app.state.metrics.get_metrics)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get metrics: {str(e)}")
 
 
+@api_router.get("/metrics/stats", response_model=IngestStatsModel)
+def get_metrics_stats():
+    try:
+        return app.state.metrics.get_ingest_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
+
+
 @api_router.get("/metrics/devices", response_model=list[DeviceModel])
 def get_metrics_devices():
     try:
@@ -213,14 +359,105 @@ def get_workout():
 
 @api_router.post("/workout", response_model=list[IntervalModel])
 def set_workout(intervals: list[IntervalModel]):
+    """Replaces the intervals of the selected workout, creates one if none is."""
+    check_timer_stopped()
+    library: WorkoutLibrary = app.state.library
+    selected = library.selected()
+    if selected is None:
+        workout = library.create(
+            WorkoutDefinitionModel(name="Workout", intervals=intervals)
+        )
+        library.select(workout.id)
+    else:
+        library.update(
+            selected.id,
+            WorkoutDefinitionModel(
+                name=selected.name,
+                description=selected.description,
+                tags=selected.tags,
+                intervals=intervals,
+            ),
+        )
+    app.state.workout = intervals
+    return app.state.workout
+
+
+def check_timer_stopped():
     timer: Timer = app.state.timer
     if timer.is_running():
         raise HTTPException(
             status_code=400, detail="Cannot update workout while the timer is running"
         )
-    app.state.workout = intervals
-    save_workout(app.state.workout)  # persist immediately
-    return app.state.workout
+
+
+@api_router.get("/workouts", response_model=WorkoutPageModel)
+def list_workouts(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    tag: Optional[str] = None,
+    name: Optional[str] = Query(None, description="Name prefix"),
+):
+    return app.state.library.list(offset=offset, limit=limit, tag=tag, name=name)
+
+
+@api_router.post("/workouts", response_model=WorkoutModel)
+def create_workout(workout: WorkoutDefinitionModel):
+    return app.state.library.create(workout)
+
+
+@api_router.get("/workouts/selected", response_model=Optional[WorkoutModel])
+def get_selected_workout():
+    return app.state.library.selected()
+
+
+@api_router.get("/workouts/{workout_id}", response_model=WorkoutModel)
+def get_library_workout(workout_id: int):
+    workout = app.state.library.get(workout_id)
+    if workout is None:
+        raise HTTPException(status_code=404, detail="Workout not found")
+    return workout
+
+
+@api_router.put("/workouts/{workout_id}", response_model=WorkoutModel)
+def update_workout(workout_id: int, workout: WorkoutDefinitionModel):
+    library: WorkoutLibrary = app.state.library
+    selected = workout_id == library.selected_id()
+    if selected:
+        check_timer_stopped()
+    updated = library.update(workout_id, workout)
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Workout not found")
+    if selected:
+        app.state.workout = updated.intervals
+    return updated
+
+
+@api_router.delete("/workouts/{workout_id}")
+def delete_workout(workout_id: int):
+    if workout_id == app.state.library.selected_id():
+        raise HTTPException(status_code=400, detail="Cannot delete selected workout")
+    if not app.state.library.delete(workout_id):
+        raise HTTPException(status_code=404, detail="Workout not found")
+    return {"message": f"Workout {workout_id} deleted"}
+
+
+@api_router.post("/workouts/{workout_id}/select", response_model=WorkoutModel)
+def select_workout(workout_id: int):
+    """Makes the workout the one the timer runs."""
+    check_timer_stopped()
+    workout = app.state.library.select(workout_id)
+    if workout is None:
+        raise HTTPException(status_code=404, detail="Workout not found")
+    app.state.workout = workout.intervals
+    return workout
+
+
+@api_router.get("/workout/laps", response_model=list[LapModel])
+def get_workout_laps():
+    try:
+        return app.state.tracker.laps()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get laps: {str(e)}")
 
 
 @api_router.post("/workout/start")
@@ -229,6 +466,7 @@ def start_workout():
         timer: Timer = app.state.timer
         timer.set_intervak(app.state.workout)
         timer.start()
+        app.state.trainer.wake()
         return {"message": "Workout started"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to start: {str(e)}")
@@ -238,79 +476,193 @@ def start_workout():
 def stop_workout():
     try:
         app.state.timer.stop()
+        app.state.trainer.wake()
         return {"message": "Workout stopped"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to stop: {str(e)}")
 
 
+# --------------------
+# Session Endpoints
+# --------------------
+@api_router.get("/sessions/current/report", response_model=SessionReportModel)
+def get_session_report():
+    """
+    Report of the session since metrics were last started, also after they
+    stopped. Computed on request from the recorded samples.
+    """
+    settings: MetricsSettingsModel = app.state.metrics.get_metrics_settings()
+    try:
+        return build_report(app.state.session, settings.ftp, settings.crank_length_m)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to report: {str(e)}")
+
+
+# --------------------
+# Debug Endpoints
+# --------------------
+@api_router.get("/debug/memory", response_model=MemoryReportModel)
+async def get_memory_report(limit: int = Query(20, ge=1, le=200)):
+    """
+    RSS and, when started with AMWA_TRACEMALLOC, the top allocation sites
+    diffed against the last snapshot.
+    """
+    return await asyncio.to_thread(memory_profiler.report, limit)
+
+
+@api_router.post("/debug/memory/snapshot")
+async def take_memory_snapshot():
+    if not memory_profiler.is_tracing():
+        raise HTTPException(
+            status_code=400, detail="Start the service with AMWA_TRACEMALLOC=1"
+        )
+    await asyncio.to_thread(memory_profiler.snapshot)
+    return {"message": "Memory baseline taken"}
+
+
 # --------------------
 # SSE Streaming
 # --------------------
-async def metrics_event_generator():
-    while not shutdown_event.is_set():
+def parse_fields(
+    fields: Optional[str], model: Type[BaseModel]
+) -> Optional[FrozenSet[str]]:
+    """Parse a comma separated field projection, None means all fields."""
+    if not fields:
+        return None
+    names = frozenset(f.strip() for f in fields.split(",") if f.strip())
+    unknown = names - model.model_fields.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return names or None
+
+
+def stream_period(hz: Optional[float], default_seconds: float) -> float:
+    return default_seconds if hz is None else 1 / hz
+
+
+def resume_id(header: Optional[str], query: Optional[str]) -> Optional[str]:
+    """
+    Browsers send Last-Event-ID when an EventSource reconnects by itself, a
+    client opening a new EventSource passes it as last_event_id.
+    """
+    return header or query
+
+
+async def metrics_event_generator(
+    fields: Optional[FrozenSet[str]] = None,
+    period: float = METRICS_DELAY_SECONDS,
+    last_event_id: Optional[str] = None,
+):
+    async def produce() -> str:
         try:
             metrics: MetricsModel = await asyncio.to_thread(
                 app.state.metrics.get_metrics
             )
-            yield f"data: {metrics.model_dump_json()}\n\n"
-            await asyncio.sleep(METRICS_DELAY_SECONDS)
-        except asyncio.CancelledError:
-            break
+            return f"data: {metrics.model_dump_json(include=fields)}\n\n"
         except Exception as e:
             logger.error("Error in metrics_event_generator", exc_info=True)
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
-            await asyncio.sleep(METRICS_DELAY_SECONDS)
+            return f"data: {json.dumps({'error': str(e)})}\n\n"
+
+    async for frame in metrics_hub.subscribe(
+        (fields, period), period, produce, last_event_id
+    ):
+        yield frame
 
 
 @api_router.get("/metrics/stream")
-async def stream_metrics():
-    return StreamingResponse(metrics_event_generator(), media_type="text/event-stream")
+async def stream_metrics(
+    fields: Optional[str] = None,
+    hz: Optional[float] = Query(None, gt=0, le=MAX_STREAM_HZ),
+    last_event_id: Optional[str] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    return StreamingResponse(
+        metrics_event_generator(
+            parse_fields(fields, MetricsModel),
+            stream_period(hz, METRICS_DELAY_SECONDS),
+            resume_id(last_event_id_header, last_event_id),
+        ),
+        media_type="text/event-stream",
+    )
 
 
-async def device_event_generator():
-    while not shutdown_event.is_set():
+async def device_event_generator(
+    fields: Optional[FrozenSet[str]] = None,
+    period: float = DEVICES_DELAY_SECONDS,
+    last_event_id: Optional[str] = None,
+):
+    async def produce() -> str:
         try:
             devices: List[DeviceModel] = await asyncio.to_thread(
                 app.state.metrics.get_devices
             )
-            data = json.dumps([device.model_dump() for device in devices])
-            yield f"data: {data}\n\n"
-            await asyncio.sleep(DEVICES_DELAY_SECONDS)
-        except asyncio.CancelledError:
-            break
+            data = json.dumps([device.model_dump(include=fields) for device in devices])
+            return f"data: {data}\n\n"
         except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
-            await asyncio.sleep(DEVICES_DELAY_SECONDS)
+            return f"data: {json.dumps({'error': str(e)})}\n\n"
+
+    async for frame in devices_hub.subscribe(
+        (fields, period), period, produce, last_event_id
+    ):
+        yield frame
 
 
 @api_router.get("/metrics/devices/stream")
-async def stream_devices():
-    return StreamingResponse(device_event_generator(), media_type="text/event-stream")
+async def stream_devices(
+    fields: Optional[str] = None,
+    hz: Optional[float] = Query(None, gt=0, le=MAX_STREAM_HZ),
+    last_event_id: Optional[str] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    return StreamingResponse(
+        device_event_generator(
+            parse_fields(fields, DeviceModel),
+            stream_period(hz, DEVICES_DELAY_SECONDS),
+            resume_id(last_event_id_header, last_event_id),
+        ),
+        media_type="text/event-stream",
+    )
 
 
-async def workout_event_generator():
-    timer: Timer = app.state.timer
-    while True:
+async def workout_event_generator(
+    fields: Optional[FrozenSet[str]] = None,
+    period: float = WORKOUT_DELAY_SECONDS,
+    last_event_id: Optional[str] = None,
+):
+    async def produce() -> str:
+        tracker: WorkoutTracker = app.state.tracker
         try:
-            progress: IntervalProgressModel = await asyncio.to_thread(
-                timer.current_interval
-            )
+            progress: IntervalProgressModel = await asyncio.to_thread(tracker.progress)
             if progress:
-                yield f"data: {progress.model_dump_json()}\n\n"
-            else:
-                yield f"data: {json.dumps({})}\n\n"
-            await asyncio.sleep(WORKOUT_DELAY_SECONDS)
-        except asyncio.CancelledError:
-            break
+                return f"data: {progress.model_dump_json(include=fields)}\n\n"
+            return f"data: {json.dumps({})}\n\n"
         except Exception as e:
             logger.error("Error in workout_event_generator", exc_info=True)
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
-            await asyncio.sleep(WORKOUT_DELAY_SECONDS)
+            return f"data: {json.dumps({'error': str(e)})}\n\n"
+
+    async for frame in workout_hub.subscribe(
+        (fields, period), period, produce, last_event_id
+    ):
+        yield frame
 
 
 @api_router.get("/workout/stream")
-async def stream_workout():
-    return StreamingResponse(workout_event_generator(), media_type="text/event-stream")
+async def stream_workout(
+    fields: Optional[str] = None,
+    hz: Optional[float] = Query(None, gt=0, le=MAX_STREAM_HZ),
+    last_event_id: Optional[str] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    return StreamingResponse(
+        workout_event_generator(
+            parse_fields(fields, IntervalProgressModel),
+            stream_period(hz, WORKOUT_DELAY_SECONDS),
+            resume_id(last_event_id_header, last_event_id),
+        ),
+        media_type="text/event-stream",
+    )
 
 
 # --------------------
@@ -0,0 +1,230 @@
+"""
+Binary sample broadcast for local consumers.
+
+Every ingested sample is sent as one fixed 24 byte little-endian datagram:
+
+    offset  size  field
+    0       1     version (1)
+    1       1     metric id, see METRIC_IDS
+    2       2     reserved
+    4       4     device id (uint32)
+    8       8     timestamp, wall clock seconds since the epoch (float64)
+    16      8     value (float64)
+
+Distance is the total of all speed sensors and is sent with device id 0.
+
+Datagrams go to a Unix datagram socket bound by the consumer and/or a UDP
+multicast group that never leaves the host (TTL 0), so several programs can
+listen at once. Sending never blocks, datagrams nobody listens to are dropped.
+"""
+
+import argparse
+import logging
+import socket
+import struct
+import sys
+from typing import Optional, Tuple
+
+from app.util import MetricsKey
+
+VERSION = 1
+SAMPLE = struct.Struct("<BBHIdd")
+SAMPLE_SIZE = SAMPLE.size
+
+METRIC_IDS = {
+    MetricsKey.POWER: 1,
+    MetricsKey.SPEED: 2,
+    MetricsKey.CADENCE: 3,
+    MetricsKey.DISTANCE: 4,
+    MetricsKey.HEART_RATE: 5,
+}
+METRIC_KEYS = {v: k for k, v in METRIC_IDS.items()}
+
+DEFAULT_MULTICAST_GROUP = ("239.255.77.1", 5577)
+
+
+def parse_address(value: str) -> Tuple[str, int]:
+    """'host:port' to a (host, port) tuple."""
+    host, _, port = value.rpartition(":")
+    return host or DEFAULT_MULTICAST_GROUP[0], int(port)
+
+
+class SampleBroadcaster:
+    """Packs samples into a reused buffer and sends them without blocking."""
+
+    def __init__(
+        self,
+        unix_path: Optional[str] = None,
+        multicast_group: Optional[Tuple[str, int]] = None,
+    ):
+        self._logger = logging.getLogger("app.broadcast")
+        self.unix_path = unix_path
+        self.multicast_group = multicast_group
+        self._buffer = bytearray(SAMPLE_SIZE)
+        self._unix = None
+        self._udp = None
+        self.sent = 0
+        self.dropped = 0
+
+        if unix_path:
+            self._unix = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._unix.setblocking(False)
+        if multicast_group:
+            self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._udp.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 0)
+            self._udp.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            self._udp.setsockopt(
+                socket.IPPROTO_IP,
+                socket.IP_MULTICAST_IF,
+                socket.inet_aton("127.0.0.1"),
+            )
+            self._udp.setblocking(False)
+
+    def send(self, key: MetricsKey, device_id: int, timestamp: float, value: float):
+        buffer = self._buffer
+        SAMPLE.pack_into(
+            buffer, 0, VERSION, METRIC_IDS[key], 0, device_id, timestamp, value
+        )
+        if self._unix is not None:
+            self._send(self._unix, self.unix_path)
+        if self._udp is not None:
+            self._send(self._udp, self.multicast_group)
+
+    def _send(self, sock: socket.socket, address):
+        try:
+            sock.sendto(self._buffer, address)
+            self.sent += 1
+        except (BlockingIOError, ConnectionRefusedError, FileNotFoundError):
+            # no consumer or a slow one, samples are not queued
+            self.dropped += 1
+        except OSError:
+            self.dropped += 1
+            self._logger.debug("Could not send sample to %s", address, exc_info=True)
+
+    def close(self):
+        for sock in (self._unix, self._udp):
+            if sock is not None:
+                sock.close()
+        self._unix = None
+        self._udp = None
+
+
+class SampleReader:
+    """
+    Client for the sample broadcast.
+
+    Datagrams are received into one preallocated buffer and decoded through
+    typed memoryviews over it, so reading a sample creates no intermediate
+    bytes or tuples. The fields of the last sample are available as
+    attributes until the next read().
+
+        reader = SampleReader(multicast_group=DEFAULT_MULTICAST_GROUP)
+        while reader.read():
+            print(reader.metric, reader.device_id, reader.value)
+    """
+
+    def __init__(
+        self,
+        unix_path: Optional[str] = None,
+        multicast_group: Optional[Tuple[str, int]] = None,
+    ):
+        if (unix_path is None) == (multicast_group is None):
+            raise ValueError("Give either unix_path or multicast_group")
+        if sys.byteorder != "little":
+            raise RuntimeError("SampleReader needs a little-endian host")
+
+        if unix_path:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.bind(unix_path)
+        else:
+            group, port = multicast_group
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._sock.bind(("", port))
+            membership = socket.inet_aton(group) + socket.inet_aton("127.0.0.1")
+            self._sock.setsockopt(
+                socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership
+            )
+        self.unix_path = unix_path
+
+        self._buffer = bytearray(SAMPLE_SIZE)
+        view = memoryview(self._buffer)
+        self._bytes = view
+        self._device_ids = view[4:8].cast("I")
+        self._floats = view[8:24].cast("d")
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def settimeout(self, seconds: Optional[float]):
+        self._sock.settimeout(seconds)
+
+    def read(self) -> bool:
+        """
+        Wait for the next sample. Returns False on timeout, datagrams with
+        an unknown version or size are skipped.
+        """
+        while True:
+            try:
+                size = self._sock.recv_into(self._buffer)
+            except socket.timeout:
+                return False
+            if size == SAMPLE_SIZE and self._bytes[0] == VERSION:
+                return True
+
+    @property
+    def metric_id(self) -> int:
+        return self._bytes[1]
+
+    @property
+    def metric(self) -> Optional[MetricsKey]:
+        return METRIC_KEYS.get(self._bytes[1])
+
+    @property
+    def device_id(self) -> int:
+        return self._device_ids[0]
+
+    @property
+    def timestamp(self) -> float:
+        return self._floats[0]
+
+    @property
+    def value(self) -> float:
+        return self._floats[1]
+
+    def close(self):
+        self._device_ids.release()
+        self._floats.release()
+        self._bytes.release()
+        self._sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print broadcast samples")
+    parser.add_argument("--unix", help="Unix datagram socket path to bind")
+    parser.add_argument(
+        "--udp",
+        nargs="?",
+        const="{}:{}".format(*DEFAULT_MULTICAST_GROUP),
+        help="multicast group:port to join",
+    )
+    args = parser.parse_args()
+
+    reader = SampleReader(
+        unix_path=args.unix,
+        multicast_group=parse_address(args.udp) if args.udp else None,
+    )
+    try:
+        while reader.read():
+            print(
+                f"{reader.timestamp:.3f} {reader.metric.value} "
+                f"device={reader.device_id} value={reader.value}"
+            )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
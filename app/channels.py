@@ -0,0 +1,275 @@
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from openant.base.message import Message
+from openant.easy.channel import Channel
+from openant.easy.node import Node
+
+from app.clock import SYSTEM_CLOCK, Clock
+
+# time the stick gets to confirm each batch of channel commands on stop
+CLOSE_TIMEOUT_SECONDS = 0.5
+
+_WAKE = (None, -1, None)
+
+
+class ChannelNode(Node):
+    """
+    Node that can close channels in any order.
+
+    openant numbers a new channel by the length of the channel list and
+    dispatches data by list index, which breaks once a channel other than the
+    last one is removed. Here the list position always equals the channel
+    number and freed slots are reused.
+    """
+
+    def new_channel(
+        self, ctype: int, network_number: int = 0x00, ext_assign: Optional[int] = None
+    ):
+        if None in self.channels:
+            num = self.channels.index(None)
+        elif len(self.channels) < self.max_channels:
+            num = len(self.channels)
+            self.channels.append(None)
+        else:
+            raise RuntimeError(
+                f"Cannot create new channel: all {self.max_channels} channels in use"
+            )
+        if network_number >= self.max_networks:
+            raise RuntimeError(
+                f"Cannot create new channel #{num}: network {network_number} out of range"
+            )
+        channel = Channel(num, self, self.ant)
+        self.channels[num] = channel
+        channel._assign(ctype, network_number, ext_assign)
+        return channel
+
+    def remove_channel(self, channel: Channel):
+        try:
+            channel.close()
+            channel._unassign()
+        finally:
+            if channel.id < len(self.channels) and self.channels[channel.id] is channel:
+                self.channels[channel.id] = None
+
+    def remove_channel_id(self, channel_id: int):
+        if 0 <= channel_id < len(self.channels) and self.channels[channel_id]:
+            self.remove_channel(self.channels[channel_id])
+
+    def close_all(self, timeout: float = CLOSE_TIMEOUT_SECONDS) -> List[int]:
+        """
+        Closes and unassigns all channels, including the scanner's. The
+        commands for all channels are sent back to back and their responses
+        collected together, so this takes two round trips to the stick no
+        matter how many channels are open. Returns the channels the stick
+        did not confirm within timeout per round trip.
+        """
+        numbers = {c.id for c in self.channels if c is not None}
+        self.channels = [None] * len(self.channels)
+        if not numbers:
+            return []
+
+        unconfirmed = self._batch(
+            numbers, self.ant.close_channel, Message.ID.CLOSE_CHANNEL, timeout
+        )
+        unconfirmed |= self._batch(
+            numbers, self.ant.unassign_channel, Message.ID.UNASSIGN_CHANNEL, timeout
+        )
+        return sorted(unconfirmed)
+
+    def _batch(
+        self,
+        numbers: Set[int],
+        send: Callable[[int], None],
+        event_id: int,
+        timeout: float,
+    ) -> Set[int]:
+        """Sends one command per channel, returns the ones without response."""
+        for num in numbers:
+            send(num)
+        if not self.ant._running:
+            return set(numbers)
+
+        deadline = time.monotonic() + timeout
+        pending = set(numbers)
+        with self._responses_cond:
+            while pending:
+                # only take the responses to our commands, other waiters
+                # share the queue
+                for response in list(self._responses):
+                    channel, event, _ = response
+                    if event == event_id and channel in pending:
+                        self._responses.remove(response)
+                        pending.discard(channel)
+                remaining = deadline - time.monotonic()
+                if not pending or remaining <= 0:
+                    break
+                self._responses_cond.wait(remaining)
+        return pending
+
+    def stop(self):
+        """Stops the node, the main loop returns at once instead of on its poll."""
+        if self._running:
+            self._running = False
+            self._datas.put(_WAKE)
+            self.ant.stop()
+            self._worker_thread.join()
+
+    def _main(self):
+        while self._running:
+            try:
+                (data_type, channel, data) = self._datas.get(True, 1.0)
+                self._datas.task_done()
+            except queue.Empty:
+                continue
+
+            if data_type is None:
+                continue
+            target = self.channels[channel] if channel < len(self.channels) else None
+            if target is None:
+                # late data of a channel that was just closed
+                continue
+            if data_type == "broadcast":
+                target.on_broadcast_data(data)
+            elif data_type == "burst":
+                target.on_burst_data(data)
+            elif data_type == "broadcast_tx":
+                target.on_broadcast_tx_data(data)
+            elif data_type == "acknowledge":
+                target.on_acknowledge_data(data)
+
+    def open_channel_count(self) -> int:
+        return sum(1 for c in self.channels if c is not None)
+
+
+class Backoff:
+    """Exponential backoff with full jitter."""
+
+    def __init__(self, base: float = 0.5, maximum: float = 30.0, rng=None):
+        self.base = base
+        self.maximum = maximum
+        self.attempts = 0
+        self._random = rng or random.Random()
+
+    def next_delay(self) -> float:
+        delay = min(self.maximum, self.base * (2**self.attempts))
+        self.attempts += 1
+        return self._random.uniform(delay / 2, delay)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class _OpenChannel:
+    __slots__ = ("device", "device_tuple", "preferred", "last_seen")
+
+    def __init__(self, device, device_tuple, preferred: bool, now: float):
+        self.device = device
+        self.device_tuple = device_tuple
+        self.preferred = preferred
+        self.last_seen = now
+
+
+class ChannelManager:
+    """
+    Tracks open sensor channels against the channel budget of the ANT stick.
+
+    One channel stays reserved for the scanner. Devices listed in device_ids
+    are preferred: when the budget is used up a preferred device takes over
+    the channel of the longest idle non-preferred device. Channels without
+    data for idle_timeout seconds are reported for closing, so the sensor
+    can be reacquired by the scanner.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 8,
+        reserved: int = 1,
+        idle_timeout: float = 30.0,
+        preferred: Optional[Iterable[int]] = None,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        self.capacity = capacity
+        self.reserved = reserved
+        self.idle_timeout = idle_timeout
+        self.preferred = set(preferred or [])
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._channels: Dict[int, _OpenChannel] = {}
+
+    def budget(self) -> int:
+        return max(0, self.capacity - self.reserved)
+
+    def is_open(self, device_id: int) -> bool:
+        with self._lock:
+            return device_id in self._channels
+
+    def devices(self) -> List:
+        with self._lock:
+            return [c.device for c in self._channels.values()]
+
+    def acquire(self, device_id: int) -> Tuple[bool, Optional[int]]:
+        """
+        Ask for a channel. Returns (allowed, device_id to evict first).
+        """
+        with self._lock:
+            if device_id in self._channels:
+                return False, None
+            if len(self._channels) < self.budget():
+                return True, None
+            if device_id not in self.preferred:
+                return False, None
+
+            candidates = [
+                (c.last_seen, k) for k, c in self._channels.items() if not c.preferred
+            ]
+            if not candidates:
+                return False, None
+            return True, min(candidates)[1]
+
+    def opened(self, device_id: int, device, device_tuple=None):
+        with self._lock:
+            self._channels[device_id] = _OpenChannel(
+                device,
+                device_tuple,
+                device_id in self.preferred,
+                self._clock.monotonic(),
+            )
+
+    def closed(self, device_id: int):
+        """Forget a channel, returns its entry or None."""
+        with self._lock:
+            return self._channels.pop(device_id, None)
+
+    def touch(self, device_id: int):
+        channel = self._channels.get(device_id)
+        if channel is not None:
+            channel.last_seen = self._clock.monotonic()
+
+    def idle(self) -> List[int]:
+        now = self._clock.monotonic()
+        with self._lock:
+            return [
+                k
+                for k, c in self._channels.items()
+                if now - c.last_seen > self.idle_timeout
+            ]
+
+    def active(self, seconds: float) -> List:
+        """Device tuples of channels with data in the last seconds."""
+        now = self._clock.monotonic()
+        with self._lock:
+            return [
+                c.device_tuple
+                for c in self._channels.values()
+                if c.device_tuple is not None and now - c.last_seen <= seconds
+            ]
+
+    def clear(self) -> List:
+        with self._lock:
+            devices = [c.device for c in self._channels.values()]
+            self._channels.clear()
+            return devices
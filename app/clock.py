@@ -0,0 +1,71 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class Clock:
+    """
+    Time source for the service.
+
+    monotonic() is used for TTLs and durations, it never jumps when NTP syncs
+    on a Pi without RTC. now() is wall time and only used for display.
+    """
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def now(self) -> datetime:
+        return datetime.now().astimezone()
+
+    def wait(self, event: threading.Event, seconds: float) -> bool:
+        """Wait for the event or until the given clock seconds passed."""
+        return event.wait(max(0.0, seconds))
+
+
+class ManualClock(Clock):
+    """Clock that only moves when advanced, for tests and fast-forward simulations."""
+
+    def __init__(self, start: float = 0.0, wall_start: Optional[datetime] = None):
+        self._lock = threading.Lock()
+        self._time = start
+        self._start = start
+        self._wall_start = wall_start or datetime.now().astimezone()
+
+    def advance(self, seconds: float):
+        with self._lock:
+            self._time += seconds
+
+    def monotonic(self) -> float:
+        with self._lock:
+            return self._time
+
+    def now(self) -> datetime:
+        return self._wall_start + timedelta(seconds=self.monotonic() - self._start)
+
+    def wait(self, event: threading.Event, seconds: float) -> bool:
+        if event.is_set():
+            return True
+        self.advance(max(0.0, seconds))
+        return event.is_set()
+
+
+class AcceleratedClock(Clock):
+    """Clock running a given factor faster than real time."""
+
+    def __init__(self, factor: float = 10.0):
+        self.factor = factor
+        self._real_start = time.monotonic()
+        self._wall_start = datetime.now().astimezone()
+
+    def monotonic(self) -> float:
+        return (time.monotonic() - self._real_start) * self.factor
+
+    def now(self) -> datetime:
+        return self._wall_start + timedelta(seconds=self.monotonic())
+
+    def wait(self, event: threading.Event, seconds: float) -> bool:
+        return event.wait(max(0.0, seconds) / self.factor)
+
+
+SYSTEM_CLOCK = Clock()
@@ -1,10 +1,71 @@
-import os
+import atexit
+import copy
 import logging
 import logging.config
+import logging.handlers
+import os
+import queue
+import threading
+import time
 from pathlib import Path
+from typing import List, Optional
+
+PACKET_LOGGER = "app.metrics.packet"
+_EXCEPTION_FORMATTER = logging.Formatter()
+
+_listeners: List[logging.handlers.QueueListener] = []
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        """
+        Renders message and traceback now, as args may change before the
+        listener gets to them and exc_info keeps the frames alive. The line
+        itself is still formatted in the listener thread.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
 
-def setup_logging():
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most `rate` records per second through, used to sample per-packet logs."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._window = 0
+        self._count = 0
+
+    def filter(self, record):
+        window = int(time.monotonic())
+        with self._lock:
+            if window != self._window:
+                self._window = window
+                self._count = 0
+            self._count += 1
+            return self._count <= self.rate
+
+
+def _configure():
     env_var = "LOGGING_CONF"
 
     # Check environment variable
@@ -27,3 +88,76 @@ def setup_logging():
 
     # Fallback
     logging.basicConfig(level=logging.INFO)
+
+
+def _configured_loggers() -> List[logging.Logger]:
+    loggers = [logging.getLogger()]
+    for logger in logging.Logger.manager.loggerDict.values():
+        if isinstance(logger, logging.Logger) and logger.handlers:
+            loggers.append(logger)
+    return loggers
+
+
+def stop_logging():
+    """Flush and stop the queue listeners."""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def _install_queue_handlers(queue_size: int):
+    """
+    Move the configured handlers behind QueueHandler/QueueListener pairs.
+    Loggers sharing the same handlers share one queue and listener thread.
+    """
+    stop_logging()
+
+    queue_handlers = {}
+    for logger in _configured_loggers():
+        handlers = tuple(
+            h
+            for h in logger.handlers
+            if not isinstance(h, logging.handlers.QueueHandler)
+        )
+        if not handlers:
+            continue
+
+        queue_handler = queue_handlers.get(handlers)
+        if queue_handler is None:
+            log_queue = queue.Queue(maxsize=queue_size)
+            queue_handler = DroppingQueueHandler(log_queue)
+            listener = logging.handlers.QueueListener(
+                log_queue, *handlers, respect_handler_level=True
+            )
+            listener.start()
+            _listeners.append(listener)
+            queue_handlers[handlers] = queue_handler
+
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+
+
+def setup_logging(queue_size: int = 10000, packet_log_rate: Optional[float] = None):
+    """
+    Configure logging from logging.conf and route all records through a queue,
+    so slow stdout/journald writes never block the ANT+ thread.
+
+    Per-packet logs use the app.metrics.packet logger. When packet_log_rate
+    (or the LOG_PACKET_RATE environment variable) is set they are sampled to
+    at most that many records per second.
+    """
+    _configure()
+    _install_queue_handlers(queue_size)
+
+    if packet_log_rate is None and os.getenv("LOG_PACKET_RATE"):
+        packet_log_rate = float(os.getenv("LOG_PACKET_RATE"))
+
+    packet_logger = logging.getLogger(PACKET_LOGGER)
+    for f in list(packet_logger.filters):
+        if isinstance(f, RateLimitFilter):
+            packet_logger.removeFilter(f)
+    if packet_log_rate:
+        packet_logger.addFilter(RateLimitFilter(packet_log_rate))
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,98 @@
+"""
+Work and W' balance integrated from power samples.
+
+Every sample holds until the next one, so the energy of an interval is the
+previous power times the real time between samples. W' balance follows
+Skiba's differential model: above CP it is spent 1:1, below CP it recovers
+towards W' at a rate proportional to the distance below CP. The recovery
+is integrated exactly for constant power, so long sample gaps stay stable.
+"""
+
+import math
+import threading
+from typing import Optional, Tuple
+
+from app.clock import SYSTEM_CLOCK, Clock
+
+# gross efficiency of cycling, converts mechanical work to food energy
+GROSS_EFFICIENCY = 0.24
+KCAL_PER_KJ = 1 / 4.184
+DEFAULT_W_PRIME_J = 20000
+
+
+class EnergyAccumulator:
+    """
+    Total work, estimated kcal and W' balance, O(1) per sample.
+
+    After a sensor dropout the last power is held for at most max_gap_s,
+    the rest of the gap counts neither as work nor as recovery. Without a
+    CP the W' balance is unknown.
+    """
+
+    def __init__(
+        self,
+        cp: Optional[float] = None,
+        w_prime: Optional[float] = None,
+        clock: Clock = SYSTEM_CLOCK,
+        max_gap_s: float = 5.0,
+    ):
+        self.clock = clock
+        self.max_gap_s = max_gap_s
+        self.cp = None
+        self.w_prime = DEFAULT_W_PRIME_J
+        self.work_j = 0.0
+        self.w_balance = None
+        self._power = None
+        self._last_time = None
+        self.lock = threading.Lock()
+        self.set_parameters(cp, w_prime)
+
+    def set_parameters(self, cp: Optional[float], w_prime: Optional[float]):
+        """New CP and W', the balance keeps what was spent so far."""
+        with self.lock:
+            w_prime = w_prime or DEFAULT_W_PRIME_J
+            if not cp:
+                self.w_balance = None
+            elif self.w_balance is None:
+                self.w_balance = float(w_prime)
+            else:
+                spent = self.w_prime - self.w_balance
+                self.w_balance = max(0.0, w_prime - spent)
+            self.cp = cp or None
+            self.w_prime = w_prime
+
+    def add(self, power: float):
+        now = self.clock.monotonic()
+        with self.lock:
+            if self._last_time is not None:
+                dt = min(now - self._last_time, self.max_gap_s)
+                if dt > 0:
+                    self._integrate(self._power, dt)
+            self._power = max(0.0, float(power))
+            self._last_time = now
+
+    def _integrate(self, power: float, dt: float):
+        """Called with lock held."""
+        self.work_j += power * dt
+        if self.cp is None:
+            return
+        if power > self.cp:
+            self.w_balance = max(0.0, self.w_balance - (power - self.cp) * dt)
+        else:
+            rate = (self.cp - power) / self.w_prime
+            deficit = self.w_prime - self.w_balance
+            self.w_balance = self.w_prime - deficit * math.exp(-rate * dt)
+
+    def snapshot(self) -> Tuple[float, float, Optional[float], Optional[float]]:
+        """(work in kJ, kcal, W' balance in J, W' balance in percent of W')."""
+        with self.lock:
+            work_kj = self.work_j / 1000
+            kcal = work_kj * KCAL_PER_KJ / GROSS_EFFICIENCY
+            if self.w_balance is None:
+                return work_kj, kcal, None, None
+            return (
+                work_kj,
+                kcal,
+                self.w_balance,
+                100 * self.w_balance / self.w_prime,
+            )
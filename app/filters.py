@@ -0,0 +1,160 @@
+import math
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+from app.clock import SYSTEM_CLOCK, Clock
+from app.model import FilterSettingsModel, FilterType
+from app.util import MetricsKey
+
+DEFAULT_FILTERS: Dict[MetricsKey, List[FilterSettingsModel]] = {
+    # median rejects single sample power dropouts before smoothing
+    MetricsKey.POWER: [
+        FilterSettingsModel(type=FilterType.MEDIAN, window=5),
+        FilterSettingsModel(type=FilterType.EMA, time_constant_s=3),
+    ],
+    MetricsKey.SPEED: [
+        FilterSettingsModel(
+            type=FilterType.KALMAN, process_noise=4.0, measurement_noise=2.0
+        ),
+    ],
+    MetricsKey.CADENCE: [FilterSettingsModel(type=FilterType.EMA, time_constant_s=3)],
+    MetricsKey.HEART_RATE: [
+        FilterSettingsModel(type=FilterType.EMA, time_constant_s=5)
+    ],
+}
+
+
+class EmaFilter:
+    """Exponential moving average, the weight depends on the time between samples."""
+
+    __slots__ = ("time_constant_s", "value", "last_time")
+
+    def __init__(self, time_constant_s: float = 3.0):
+        self.time_constant_s = time_constant_s
+        self.value = None
+        self.last_time = None
+
+    def update(self, value: float, now: float) -> float:
+        if self.value is None:
+            self.value = float(value)
+        else:
+            dt = max(0.0, now - self.last_time)
+            alpha = 1 - math.exp(-dt / self.time_constant_s)
+            self.value += alpha * (value - self.value)
+        self.last_time = now
+        return self.value
+
+
+class MedianFilter:
+    """Median of the last N samples, rejects short spikes and dropouts."""
+
+    __slots__ = ("values",)
+
+    def __init__(self, window: int = 5):
+        self.values = deque(maxlen=window)
+
+    def update(self, value: float, now: float) -> float:
+        self.values.append(value)
+        ordered = sorted(self.values)
+        middle = len(ordered) // 2
+        if len(ordered) % 2:
+            return float(ordered[middle])
+        return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+class KalmanFilter:
+    """One dimensional Kalman filter with a random walk model."""
+
+    __slots__ = ("process_noise", "measurement_noise", "value", "variance", "last_time")
+
+    def __init__(self, process_noise: float = 4.0, measurement_noise: float = 2.0):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.value = None
+        self.variance = 0.0
+        self.last_time = None
+
+    def update(self, value: float, now: float) -> float:
+        if self.value is None:
+            self.value = float(value)
+            self.variance = self.measurement_noise
+        else:
+            dt = max(0.0, now - self.last_time)
+            # predict
+            self.variance += self.process_noise * dt
+            # correct
+            gain = self.variance / (self.variance + self.measurement_noise)
+            self.value += gain * (value - self.value)
+            self.variance *= 1 - gain
+        self.last_time = now
+        return self.value
+
+
+def create_filter(settings: FilterSettingsModel):
+    if settings.type == FilterType.EMA:
+        return EmaFilter(settings.time_constant_s or 3.0)
+    if settings.type == FilterType.MEDIAN:
+        return MedianFilter(settings.window or 5)
+    if settings.type == FilterType.KALMAN:
+        return KalmanFilter(
+            settings.process_noise or 4.0, settings.measurement_noise or 2.0
+        )
+    raise ValueError(f"Unknown filter type {settings.type}")
+
+
+class FilterChain:
+    __slots__ = ("filters",)
+
+    def __init__(self, settings: List[FilterSettingsModel]):
+        self.filters = [create_filter(s) for s in settings]
+
+    def update(self, value: float, now: float) -> float:
+        for f in self.filters:
+            value = f.update(value, now)
+        return value
+
+
+class FilterMap:
+    """
+    Runs a filter chain per metric at ingest time and keeps the latest
+    filtered value until it expires like TimedMap.
+    """
+
+    def __init__(
+        self,
+        filters: Optional[Dict[MetricsKey, List[FilterSettingsModel]]] = None,
+        ttl=15,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        self.ttl = ttl
+        self.clock = clock
+        self.chains = {
+            key: FilterChain(settings)
+            for key, settings in (filters or DEFAULT_FILTERS).items()
+        }
+        self.store = {}
+        self.lock = threading.Lock()
+
+    def add(self, key, value) -> Optional[float]:
+        chain = self.chains.get(key)
+        if chain is None or value is None:
+            return None
+        now = self.clock.monotonic()
+        with self.lock:
+            filtered = chain.update(value, now)
+            self.store[key] = (filtered, now + self.ttl)
+        return filtered
+
+    def get(self, key) -> Optional[float]:
+        with self.lock:
+            if key in self.store:
+                value, expire_time = self.store[key]
+                if self.clock.monotonic() < expire_time:
+                    return value
+                del self.store[key]
+        return None
+
+    def __repr__(self):
+        with self.lock:
+            return str({k: v[0] for k, v in self.store.items()})
@@ -0,0 +1,285 @@
+"""
+Heart rate variability from the beat timing of ANT+ heart rate pages.
+
+Every heart rate page carries the time of the last beat (1/1024 s, rolls over
+after 64 s) and a beat counter (rolls over after 256 beats). RR intervals are
+derived from consecutive pages, artifacts are rejected against a running
+reference and RMSSD/SDNN are kept over a rolling time window with running
+sums, so every beat costs O(1) and memory is fixed per device.
+"""
+
+import math
+import threading
+from array import array
+from typing import Optional, Tuple
+
+from app.clock import SYSTEM_CLOCK, Clock
+
+BEAT_TIME_ROLLOVER_S = 64.0
+BEAT_COUNT_ROLLOVER = 256
+# plausible beat to beat intervals, 200 to 30 bpm
+MIN_RR_MS = 300.0
+MAX_RR_MS = 2000.0
+DEFAULT_WINDOW_S = 60
+
+
+class RRExtractor:
+    """
+    RR intervals from the raw beat time and count of consecutive pages.
+
+    A count that advanced by more than one means pages were lost, only the
+    last interval is known then, from the previous beat time of page 4.
+    Such an interval does not directly follow the one before it.
+    """
+
+    __slots__ = ("beat_time", "beat_count", "last_seen")
+
+    # beat times are ambiguous after a gap as long as their rollover
+    MAX_GAP_S = BEAT_TIME_ROLLOVER_S - 4
+
+    def __init__(self):
+        self.beat_time = None
+        self.beat_count = None
+        self.last_seen = None
+
+    def update(
+        self,
+        beat_time: float,
+        beat_count: int,
+        now: float,
+        previous_beat_time: Optional[float] = None,
+    ) -> Tuple[Optional[float], bool]:
+        """
+        Returns the RR interval in ms of a new beat, None without one, and
+        whether it directly follows the previously returned interval.
+        """
+        if beat_time is None or beat_time < 0:
+            return None, False
+        last_time, last_count = self.beat_time, self.beat_count
+        gap = self.last_seen is not None and now - self.last_seen > self.MAX_GAP_S
+        self.beat_time, self.beat_count, self.last_seen = beat_time, beat_count, now
+
+        if last_time is None or gap:
+            if previous_beat_time is not None and previous_beat_time >= 0:
+                return self._interval(previous_beat_time, beat_time), False
+            return None, False
+
+        beats = (beat_count - last_count) % BEAT_COUNT_ROLLOVER
+        if beats == 0:
+            return None, False
+        if beats == 1:
+            return self._interval(last_time, beat_time), True
+        if previous_beat_time is not None and previous_beat_time >= 0:
+            return self._interval(previous_beat_time, beat_time), False
+        return None, False
+
+    @staticmethod
+    def _interval(start: float, end: float) -> float:
+        return ((end - start) % BEAT_TIME_ROLLOVER_S) * 1000
+
+
+class ArtifactFilter:
+    """
+    Rejects ectopic beats and detection errors: intervals outside the
+    plausible range or more than tolerance away from a running reference.
+    After max_rejects rejections in a row the rhythm really changed and the
+    reference restarts from the new interval.
+    """
+
+    __slots__ = ("tolerance", "max_rejects", "alpha", "reference", "rejects")
+
+    def __init__(self, tolerance: float = 0.2, max_rejects: int = 5, alpha=0.1):
+        self.tolerance = tolerance
+        self.max_rejects = max_rejects
+        self.alpha = alpha
+        self.reference = None
+        self.rejects = 0
+
+    def accept(self, rr: float) -> bool:
+        if not MIN_RR_MS <= rr <= MAX_RR_MS:
+            return False
+        if self.reference is None or self.rejects >= self.max_rejects:
+            self.reference = rr
+            self.rejects = 0
+            return True
+        if abs(rr - self.reference) > self.tolerance * self.reference:
+            self.rejects += 1
+            return False
+        self.rejects = 0
+        self.reference += self.alpha * (rr - self.reference)
+        return True
+
+
+class RollingHrv:
+    """
+    RR intervals of the last window_s seconds in a fixed capacity ring,
+    with running sums for SDNN and RMSSD. The squared successive difference
+    is stored with each interval, NaN when it does not follow the one
+    before, so removing the oldest beat is O(1) as well.
+    """
+
+    __slots__ = (
+        "times",
+        "rrs",
+        "diffs",
+        "head",
+        "size",
+        "sum_rr",
+        "sum_rr_sq",
+        "sum_diff_sq",
+        "diff_count",
+    )
+
+    def __init__(self, capacity: int = 1024):
+        self.times = array("d", bytes(8 * capacity))
+        self.rrs = array("d", bytes(8 * capacity))
+        self.diffs = array("d", bytes(8 * capacity))
+        self.head = 0
+        self.size = 0
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self.sum_rr = 0.0
+        self.sum_rr_sq = 0.0
+        self.sum_diff_sq = 0.0
+        self.diff_count = 0
+
+    def append(self, now: float, rr: float, follows: bool):
+        capacity = len(self.rrs)
+        diff_sq = math.nan
+        if follows and self.size:
+            last = self.rrs[(self.head + self.size - 1) % capacity]
+            diff_sq = (rr - last) ** 2
+        if self.size == capacity:
+            self.popleft()
+
+        index = (self.head + self.size) % capacity
+        self.times[index] = now
+        self.rrs[index] = rr
+        self.diffs[index] = diff_sq
+        self.size += 1
+        self.sum_rr += rr
+        self.sum_rr_sq += rr * rr
+        if not math.isnan(diff_sq):
+            self.sum_diff_sq += diff_sq
+            self.diff_count += 1
+
+    def popleft(self):
+        rr = self.rrs[self.head]
+        diff_sq = self.diffs[self.head]
+        self.sum_rr -= rr
+        self.sum_rr_sq -= rr * rr
+        if not math.isnan(diff_sq):
+            self.sum_diff_sq -= diff_sq
+            self.diff_count -= 1
+        self.head = (self.head + 1) % len(self.rrs)
+        self.size -= 1
+        if self.size == 0:
+            self._reset_sums()  # no float drift over long runs
+        else:
+            # the new oldest beat has no predecessor in the window anymore
+            diff_sq = self.diffs[self.head]
+            if not math.isnan(diff_sq):
+                self.sum_diff_sq -= diff_sq
+                self.diff_count -= 1
+                self.diffs[self.head] = math.nan
+
+    def expire(self, before: float):
+        while self.size and self.times[self.head] < before:
+            self.popleft()
+
+    def last(self) -> Optional[float]:
+        if not self.size:
+            return None
+        return self.rrs[(self.head + self.size - 1) % len(self.rrs)]
+
+    def sdnn(self) -> Optional[float]:
+        n = self.size
+        if n < 2:
+            return None
+        variance = (self.sum_rr_sq - self.sum_rr * self.sum_rr / n) / (n - 1)
+        return math.sqrt(max(0.0, variance))
+
+    def rmssd(self) -> Optional[float]:
+        if self.diff_count < 1:
+            return None
+        return math.sqrt(max(0.0, self.sum_diff_sq / self.diff_count))
+
+
+class _HrvDevice:
+    __slots__ = ("extractor", "artifacts", "window", "last_seen", "rejected_last")
+
+    def __init__(self, capacity: int):
+        self.extractor = RRExtractor()
+        self.artifacts = ArtifactFilter()
+        self.window = RollingHrv(capacity)
+        self.last_seen = None
+        self.rejected_last = False
+
+
+class HrvAccumulator:
+    """
+    Live HRV per heart rate sensor. The snapshot is of the sensor that sent
+    the latest beat, at most max_devices are tracked.
+    """
+
+    def __init__(
+        self,
+        window_s: float = DEFAULT_WINDOW_S,
+        clock: Clock = SYSTEM_CLOCK,
+        max_devices: int = 4,
+        capacity: int = 1024,
+    ):
+        self.window_s = window_s
+        self.clock = clock
+        self.max_devices = max_devices
+        self.capacity = capacity
+        self.store = {}
+        self.latest = None
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def add(
+        self,
+        device_id,
+        beat_time: float,
+        beat_count: int,
+        previous_beat_time: Optional[float] = None,
+    ) -> Optional[float]:
+        """Feed a heart rate page, returns the accepted RR interval in ms."""
+        now = self.clock.monotonic()
+        with self.lock:
+            device = self.store.get(device_id)
+            if device is None:
+                if len(self.store) >= self.max_devices:
+                    oldest = min(self.store, key=lambda k: self.store[k].last_seen)
+                    del self.store[oldest]
+                device = _HrvDevice(self.capacity)
+                self.store[device_id] = device
+            device.last_seen = now
+
+            rr, follows = device.extractor.update(
+                beat_time, beat_count, now, previous_beat_time
+            )
+            if rr is None:
+                return None
+            if not device.artifacts.accept(rr):
+                self.rejected += 1
+                device.rejected_last = True
+                return None
+            # an interval after a rejected one is not diffed across the gap
+            device.window.append(now, rr, follows and not device.rejected_last)
+            device.rejected_last = False
+            device.window.expire(now - self.window_s)
+            self.latest = device_id
+            return rr
+
+    def snapshot(self) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+        """(last RR interval, RMSSD, SDNN) in ms, None where unknown."""
+        with self.lock:
+            device = self.store.get(self.latest)
+            if device is None:
+                return None, None, None
+            window = device.window
+            window.expire(self.clock.monotonic() - self.window_s)
+            return window.last(), window.rmssd(), window.sdnn()
@@ -0,0 +1,263 @@
+import json
+import logging
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+from app.clock import SYSTEM_CLOCK, Clock
+from app.model import (
+    IntervalModel,
+    WorkoutDefinitionModel,
+    WorkoutModel,
+    WorkoutPageModel,
+    WorkoutSummaryModel,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workouts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    interval_count INTEGER NOT NULL,
+    total_seconds INTEGER NOT NULL,
+    updated TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS workouts_name ON workouts (name COLLATE NOCASE, id);
+
+CREATE TABLE IF NOT EXISTS workout_tags (
+    tag TEXT NOT NULL COLLATE NOCASE,
+    workout_id INTEGER NOT NULL REFERENCES workouts (id) ON DELETE CASCADE,
+    PRIMARY KEY (tag, workout_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS workout_tags_workout ON workout_tags (workout_id);
+
+CREATE TABLE IF NOT EXISTS workout_intervals (
+    workout_id INTEGER PRIMARY KEY REFERENCES workouts (id) ON DELETE CASCADE,
+    intervals TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS library_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# sorts after every character a name continues with
+MAX_CHAR = "\U0010ffff"
+SUMMARY_COLUMNS = (
+    "w.id, w.name, w.description, w.interval_count, w.total_seconds, w.updated"
+)
+
+
+class WorkoutLibrary:
+    """
+    Structured workouts in SQLite.
+
+    Listing only reads the summary columns and tags, ordered through the
+    name index, the interval bodies live in their own table and are loaded
+    for a single workout when it is opened or selected. The database runs
+    in WAL mode so a backup or sqlite3 shell can read while the service
+    writes.
+    """
+
+    def __init__(self, path: str = ":memory:", clock: Clock = SYSTEM_CLOCK):
+        self._logger = logging.getLogger("app.library")
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM workouts").fetchone()[0]
+
+    def list(
+        self,
+        offset: int = 0,
+        limit: int = 50,
+        tag: Optional[str] = None,
+        name: Optional[str] = None,
+    ) -> WorkoutPageModel:
+        """One page of summaries by name, optionally by tag and name prefix."""
+        clause, params = _filters(tag, name)
+
+        with self._lock:
+            total = self._db.execute(
+                f"SELECT count(*) FROM workouts w {clause}", params
+            ).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT {SUMMARY_COLUMNS} FROM workouts w {clause} "
+                "ORDER BY w.name COLLATE NOCASE, w.id LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+            tags = self._tags([row["id"] for row in rows])
+
+        return WorkoutPageModel(
+            items=[_summary(row, tags.get(row["id"], [])) for row in rows],
+            total=total,
+            offset=offset,
+            limit=limit,
+        )
+
+    def get(self, workout_id: int) -> Optional[WorkoutModel]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {SUMMARY_COLUMNS}, i.intervals FROM workouts w "
+                "JOIN workout_intervals i ON i.workout_id = w.id WHERE w.id = ?",
+                (workout_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            tags = self._tags([workout_id]).get(workout_id, [])
+
+        return WorkoutModel(
+            **_summary(row, tags).model_dump(),
+            intervals=[IntervalModel(**i) for i in json.loads(row["intervals"])],
+        )
+
+    def create(self, workout: WorkoutDefinitionModel) -> WorkoutModel:
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO workouts "
+                "(name, description, interval_count, total_seconds, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                self._columns(workout),
+            )
+            workout_id = cursor.lastrowid
+            self._write_body(workout_id, workout)
+        return self.get(workout_id)
+
+    def update(
+        self, workout_id: int, workout: WorkoutDefinitionModel
+    ) -> Optional[WorkoutModel]:
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE workouts SET name = ?, description = ?, interval_count = ?, "
+                "total_seconds = ?, updated = ? WHERE id = ?",
+                (*self._columns(workout), workout_id),
+            )
+            if cursor.rowcount == 0:
+                return None
+            self._db.execute(
+                "DELETE FROM workout_tags WHERE workout_id = ?", (workout_id,)
+            )
+            self._write_body(workout_id, workout)
+        return self.get(workout_id)
+
+    def delete(self, workout_id: int) -> bool:
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "DELETE FROM workouts WHERE id = ?", (workout_id,)
+            )
+            return cursor.rowcount > 0
+
+    def selected_id(self) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM library_state WHERE key = 'selected'"
+            ).fetchone()
+        return int(row["value"]) if row and row["value"] is not None else None
+
+    def select(self, workout_id: int) -> Optional[WorkoutModel]:
+        """Remembers the workout for the next start, returns it with intervals."""
+        workout = self.get(workout_id)
+        if workout is None:
+            return None
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO library_state (key, value) "
+                "VALUES ('selected', ?)",
+                (str(workout_id),),
+            )
+        return workout
+
+    def selected(self) -> Optional[WorkoutModel]:
+        workout_id = self.selected_id()
+        return self.get(workout_id) if workout_id is not None else None
+
+    def import_json(self, path: str, name: str = "Workout") -> Optional[WorkoutModel]:
+        """Imports a workout.json of earlier versions and selects it."""
+        try:
+            with open(path, "r") as f:
+                intervals = [IntervalModel(**i) for i in json.load(f)]
+        except Exception as e:
+            self._logger.warning(f"Failed to import workout from {path}: {e}")
+            return None
+        workout = self.create(WorkoutDefinitionModel(name=name, intervals=intervals))
+        self._logger.info(f"Imported {path} as workout {workout.id}")
+        return self.select(workout.id)
+
+    def _columns(self, workout: WorkoutDefinitionModel):
+        return (
+            workout.name,
+            workout.description,
+            len(workout.intervals),
+            sum(i.seconds for i in workout.intervals),
+            self._clock.now().isoformat(),
+        )
+
+    def _write_body(self, workout_id: int, workout: WorkoutDefinitionModel):
+        """Tags and intervals, called with lock held inside a transaction."""
+        self._db.executemany(
+            "INSERT OR IGNORE INTO workout_tags (tag, workout_id) VALUES (?, ?)",
+            [(tag, workout_id) for tag in workout.tags],
+        )
+        self._db.execute(
+            "INSERT OR REPLACE INTO workout_intervals (workout_id, intervals) "
+            "VALUES (?, ?)",
+            (
+                workout_id,
+                json.dumps([i.model_dump(mode="json") for i in workout.intervals]),
+            ),
+        )
+
+    def _tags(self, workout_ids: List[int]):
+        """Tags per workout id, called with lock held."""
+        if not workout_ids:
+            return {}
+        marks = ",".join("?" * len(workout_ids))
+        tags = {}
+        for row in self._db.execute(
+            f"SELECT workout_id, tag FROM workout_tags WHERE workout_id IN ({marks}) "
+            "ORDER BY tag",
+            workout_ids,
+        ):
+            tags.setdefault(row["workout_id"], []).append(row["tag"])
+        return tags
+
+
+def _summary(row: sqlite3.Row, tags: List[str]) -> WorkoutSummaryModel:
+    return WorkoutSummaryModel(
+        id=row["id"],
+        name=row["name"],
+        description=row["description"],
+        tags=tags,
+        interval_count=row["interval_count"],
+        total_seconds=row["total_seconds"],
+        updated=row["updated"],
+    )
+
+
+def _filters(tag: Optional[str], name: Optional[str]) -> Tuple[str, list]:
+    """WHERE clause and parameters of a listing."""
+    where, params = [], []
+    if tag:
+        where.append("w.id IN (SELECT workout_id FROM workout_tags WHERE tag = ?)")
+        params.append(tag)
+    if name:
+        # a range on the indexed expression uses the name index on every
+        # SQLite version, LIKE only where it may match the column against
+        # the NOCASE index; wildcards in name stay literal
+        where.append("w.name COLLATE NOCASE >= ? AND w.name COLLATE NOCASE < ?")
+        params.extend((name, name + MAX_CHAR))
+    return (f"WHERE {' AND '.join(where)}" if where else ""), params
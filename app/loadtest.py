@@ -0,0 +1,328 @@
+"""
+End-to-end load harness.
+
+Starts app.api:app with simulated sensors (AMWA_SIMULATE=1), opens N dashboard
+clients, each subscribed to the metrics, devices and workout streams, and
+writes a JSON report with delivery latency, frame rates, dropped frames and
+server CPU/RSS. Delivery latency is measured from the time the server
+produced a frame, sent with it as an SSE comment, to its arrival at the
+client. Data age is how old the latest sensor sample of a metrics frame is
+on arrival, which includes the sensor rate and is reported separately.
+
+    python -m app.loadtest --clients 10 --duration 60 --output report.json
+    python -m app.loadtest --clients 10 --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.api import DEVICES_DELAY_SECONDS, METRICS_DELAY_SECONDS, WORKOUT_DELAY_SECONDS
+
+STREAMS = {
+    "metrics": ("/api/metrics/stream", METRICS_DELAY_SECONDS),
+    "devices": ("/api/metrics/devices/stream", DEVICES_DELAY_SECONDS),
+    "workout": ("/api/workout/stream", WORKOUT_DELAY_SECONDS),
+}
+
+# comment line StreamHub puts in every frame
+PRODUCED_PREFIX = ": produced="
+
+root_dir = Path(__file__).resolve().parent.parent
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class ClientStats:
+    def __init__(self):
+        self.frames = 0
+        self.errors = 0
+        self.latencies_ms: List[float] = []
+        self.data_ages_ms: List[float] = []
+        self.connected_at: Optional[float] = None
+        self.closed_at: Optional[float] = None
+
+
+class ProcessSampler:
+    """Samples CPU time and RSS of a process from /proc (Linux only)."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.rss_kb: List[int] = []
+        self._cpu_start = None
+        self._time_start = None
+        self.cpu_percent: Optional[float] = None
+
+    def _cpu_seconds(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+            return (int(fields[11]) + int(fields[12])) / self.clock_ticks
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def _rss(self) -> Optional[int]:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def start(self):
+        self._cpu_start = self._cpu_seconds()
+        self._time_start = time.monotonic()
+
+    def sample(self):
+        rss = self._rss()
+        if rss is not None:
+            self.rss_kb.append(rss)
+
+    def finish(self):
+        cpu = self._cpu_seconds()
+        if cpu is not None and self._cpu_start is not None:
+            wall = time.monotonic() - self._time_start
+            self.cpu_percent = (cpu - self._cpu_start) / wall * 100 if wall else None
+
+    def report(self) -> dict:
+        return {
+            "cpu_percent": self.cpu_percent,
+            "rss_kb_start": self.rss_kb[0] if self.rss_kb else None,
+            "rss_kb_end": self.rss_kb[-1] if self.rss_kb else None,
+            "rss_kb_max": max(self.rss_kb) if self.rss_kb else None,
+        }
+
+
+async def read_stream(
+    client: httpx.AsyncClient,
+    name: str,
+    path: str,
+    stats: ClientStats,
+    stop: asyncio.Event,
+):
+    try:
+        async with client.stream("GET", path, timeout=None) as response:
+            stats.connected_at = time.monotonic()
+            async for line in response.aiter_lines():
+                if stop.is_set():
+                    break
+                if line.startswith(PRODUCED_PREFIX):
+                    produced = float(line[len(PRODUCED_PREFIX) :])
+                    stats.latencies_ms.append((time.time() - produced) * 1000)
+                    continue
+                if not line.startswith("data:"):
+                    continue
+                stats.frames += 1
+                if name != "metrics":
+                    continue
+                try:
+                    data = json.loads(line[len("data:") :])
+                except ValueError:
+                    stats.errors += 1
+                    continue
+                last_update = data.get("last_sensor_update")
+                if last_update:
+                    sampled = datetime.fromisoformat(last_update)
+                    age = datetime.now().astimezone() - sampled
+                    stats.data_ages_ms.append(age.total_seconds() * 1000)
+    except httpx.HTTPError:
+        stats.errors += 1
+    finally:
+        stats.closed_at = time.monotonic()
+
+
+def summarize(name: str, clients: List[ClientStats]) -> dict:
+    period = STREAMS[name][1]
+    frames = sum(c.frames for c in clients)
+    expected = 0
+    fps = []
+    for c in clients:
+        if c.connected_at is None or c.closed_at is None:
+            continue
+        connected = c.closed_at - c.connected_at
+        expected += int(connected / period)
+        if connected > 0:
+            fps.append(c.frames / connected)
+
+    latencies = [v for c in clients for v in c.latencies_ms]
+    data_ages = [v for c in clients for v in c.data_ages_ms]
+    return {
+        "clients": len(clients),
+        "frames": frames,
+        "expected_frames": expected,
+        "dropped_frames": max(0, expected - frames),
+        "errors": sum(c.errors for c in clients),
+        "fps_mean": sum(fps) / len(fps) if fps else None,
+        "fps_min": min(fps) if fps else None,
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p99": percentile(latencies, 99),
+        "data_age_ms_p50": percentile(data_ages, 50),
+        "data_age_ms_p99": percentile(data_ages, 99),
+    }
+
+
+def git_version() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=root_dir,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def wait_for_server(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get("/api/status")
+            if response.status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+async def run(args) -> dict:
+    data_dir = tempfile.TemporaryDirectory(prefix="amwa-loadtest-")
+    env = {**os.environ, "AMWA_SIMULATE": "1", "AMWA_DATA_DIR": data_dir.name}
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.api:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+            "--timeout-graceful-shutdown",
+            "1",
+        ],
+        cwd=root_dir,
+        env=env,
+        stdout=None if args.verbose else subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    sampler = ProcessSampler(server.pid)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+            await wait_for_server(client)
+            await client.post("/api/metrics/start")
+            await client.post("/api/workout/start")
+            # let the simulated sensors deliver the first samples
+            await asyncio.sleep(1)
+
+            stop = asyncio.Event()
+            stats: Dict[str, List[ClientStats]] = {name: [] for name in STREAMS}
+            tasks = []
+            for _ in range(args.clients):
+                for name, (path, _) in STREAMS.items():
+                    client_stats = ClientStats()
+                    stats[name].append(client_stats)
+                    tasks.append(
+                        asyncio.create_task(
+                            read_stream(client, name, path, client_stats, stop)
+                        )
+                    )
+
+            sampler.start()
+            deadline = time.monotonic() + args.duration
+            while time.monotonic() < deadline:
+                sampler.sample()
+                await asyncio.sleep(0.5)
+            sampler.finish()
+
+            stop.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            await client.post("/api/workout/stop")
+            await client.post("/api/metrics/stop")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        data_dir.cleanup()
+
+    return {
+        "version": git_version(),
+        "timestamp": datetime.now().astimezone().isoformat(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "clients": args.clients,
+        "duration_seconds": args.duration,
+        "server": sampler.report(),
+        "streams": {name: summarize(name, clients) for name, clients in stats.items()},
+    }
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """Difference of every numeric value in the report against a baseline report."""
+
+    def diff(current, base):
+        if isinstance(current, dict) and isinstance(base, dict):
+            return {k: diff(v, base.get(k)) for k, v in current.items() if k in base}
+        if isinstance(current, (int, float)) and isinstance(base, (int, float)):
+            return current - base
+        return None
+
+    return diff(report, baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AMWA end-to-end load harness")
+    parser.add_argument("--clients", type=int, default=5, help="dashboard clients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="write JSON report to this file")
+    parser.add_argument("--compare", help="baseline JSON report to diff against")
+    parser.add_argument("--verbose", action="store_true", help="show server logs")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare) as f:
+            report["diff"] = compare(report, json.load(f))
+
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(data)
+    print(data)
+
+
+if __name__ == "__main__":
+    main()
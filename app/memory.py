@@ -0,0 +1,108 @@
+import os
+import threading
+import tracemalloc
+from typing import Optional
+
+from app.clock import SYSTEM_CLOCK, Clock
+from app.model import AllocationSiteModel, MemoryReportModel
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, None where /proc is missing."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class MemoryProfiler:
+    """
+    Opt-in tracemalloc reports. Tracing slows every allocation down, so it
+    only runs after start(), e.g. from the AMWA_TRACEMALLOC environment
+    variable. report() lists the top allocation sites, diffed against the
+    last snapshot() when there is one.
+    """
+
+    def __init__(self, clock: Clock = SYSTEM_CLOCK):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._baseline = None
+        self._baseline_time = None
+
+    def is_tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        with self._lock:
+            self._baseline = None
+            self._baseline_time = None
+        tracemalloc.stop()
+
+    def snapshot(self):
+        """Takes the baseline for later reports."""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing")
+        snapshot = self._take()
+        with self._lock:
+            self._baseline = snapshot
+            self._baseline_time = self._clock.monotonic()
+
+    @staticmethod
+    def _take():
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            )
+        )
+
+    def report(self, limit: int = 20) -> MemoryReportModel:
+        report = MemoryReportModel(rss_bytes=rss_bytes())
+        if not tracemalloc.is_tracing():
+            return report
+
+        report.tracing = True
+        report.traced_current_bytes, report.traced_peak_bytes = (
+            tracemalloc.get_traced_memory()
+        )
+        snapshot = self._take()
+        with self._lock:
+            baseline, baseline_time = self._baseline, self._baseline_time
+
+        if baseline is None:
+            stats = snapshot.statistics("lineno")
+        else:
+            report.baseline_age_s = self._clock.monotonic() - baseline_time
+            stats = snapshot.compare_to(baseline, "lineno")
+
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            report.top.append(
+                AllocationSiteModel(
+                    location=f"{frame.filename}:{frame.lineno}",
+                    size=stat.size,
+                    size_diff=getattr(stat, "size_diff", 0),
+                    count=stat.count,
+                    count_diff=getattr(stat, "count_diff", 0),
+                )
+            )
+        return report
+
+
+def tracemalloc_frames_from_env() -> int:
+    """Frames per traceback from AMWA_TRACEMALLOC, 0 when tracing is off."""
+    value = os.getenv("AMWA_TRACEMALLOC", "").lower()
+    if value in ("", "0", "false", "no"):
+        return 0
+    if value in ("1", "true", "yes"):
+        return 1
+    return max(1, int(value))
@@ -1,8 +1,10 @@
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+from app.util import MetricsKey
 
 
 class SportZone(str, Enum):
@@ -83,19 +85,76 @@ class SportZone(str, Enum):
         return formatted_name, self.value
 
 
+class FilterType(str, Enum):
+    EMA = "ema"
+    MEDIAN = "median"
+    KALMAN = "kalman"
+
+
+class FilterSettingsModel(BaseModel):
+    type: FilterType
+    time_constant_s: Optional[float] = Field(
+        None, gt=0, description="EMA time constant in seconds"
+    )
+    window: Optional[int] = Field(
+        None, ge=1, le=31, description="Number of samples for the median filter"
+    )
+    process_noise: Optional[float] = Field(
+        None, gt=0, description="Kalman process noise per second"
+    )
+    measurement_noise: Optional[float] = Field(
+        None, gt=0, description="Kalman measurement noise"
+    )
+
+
 class MetricsSettingsModel(BaseModel):
+    # swapped as a whole while metrics run, never changed in place
+    model_config = ConfigDict(frozen=True)
+
     speed_wheel_circumference_m: Optional[float] = Field(
         None, gt=0, description="Wheel circumference in meters (speed sensor)"
     )
     distance_wheel_circumference_m: Optional[float] = Field(
         None, gt=0, description="Wheel circumference in meters (distance sensor)"
     )
+    crank_length_m: Optional[float] = Field(
+        None, gt=0, le=0.3, description="Crank length in meters, 0.1725 when not set"
+    )
     age: Optional[int] = Field(None, gt=0, description="User age in years")
+    ftp: Optional[int] = Field(
+        None, gt=0, description="Functional threshold power in watts"
+    )
+    cp: Optional[int] = Field(
+        None,
+        gt=0,
+        description="Critical power in watts for W' balance, FTP when not set",
+    )
+    w_prime: Optional[int] = Field(
+        None, gt=0, description="W' in joules, 20000 when not set"
+    )
 
     device_ids: Optional[List[int]] = Field(
         None, description="Device Ids to use when set"
     )
 
+    trainer_lead_s: Optional[float] = Field(
+        None,
+        ge=0,
+        le=10,
+        description="Seconds a trainer target is sent before the interval, 2 when not set",
+    )
+
+    hrv_window_s: Optional[int] = Field(
+        None,
+        ge=10,
+        le=300,
+        description="Rolling window for RMSSD and SDNN in seconds, 60 when not set",
+    )
+
+    filters: Optional[Dict[MetricsKey, List[FilterSettingsModel]]] = Field(
+        None, description="Filter chain per metric, defaults are used when not set"
+    )
+
 
 class DeviceModel(BaseModel):
     device_id: int
@@ -103,21 +162,64 @@ class DeviceModel(BaseModel):
     name: str
 
 
+class LifecycleState(str, Enum):
+    STOPPED = "stopped"
+    STARTING = "starting"
+    RUNNING = "running"
+    STOPPING = "stopping"
+
+
+class PairedDeviceModel(BaseModel):
+    device_id: int
+    device_type: int
+    trans_type: int = 0
+    last_seen: datetime
+
+
+class AllocationSiteModel(BaseModel):
+    location: str
+    size: int
+    size_diff: int = 0
+    count: int
+    count_diff: int = 0
+
+
+class MemoryReportModel(BaseModel):
+    rss_bytes: Optional[int] = None
+    tracing: bool = False
+    traced_current_bytes: Optional[int] = None
+    traced_peak_bytes: Optional[int] = None
+    # seconds since the baseline snapshot the sites are diffed against
+    baseline_age_s: Optional[float] = None
+    top: List[AllocationSiteModel] = Field(default_factory=list)
+
+
+class IngestStatsModel(BaseModel):
+    pages_received: int = 0
+    pages_skipped: int = 0
+    skip_ratio: Optional[float] = None
+
+
 class MetricsModel(BaseModel):
     power: Optional[int] = None
     ma_power: Optional[float] = None
+    smooth_power: Optional[float] = None
 
     speed: Optional[float] = None
     ma_speed: Optional[float] = None
+    smooth_speed: Optional[float] = None
 
     cadence: Optional[float] = None
     ma_cadence: Optional[float] = None
+    smooth_cadence: Optional[float] = None
 
     distance: Optional[float] = None
     ma_distance: Optional[float] = None
+    distance_by_device: Optional[Dict[int, float]] = None
 
     heart_rate: Optional[int] = None
     ma_heart_rate: Optional[float] = None
+    smooth_heart_rate: Optional[float] = None
 
     heart_rate_percent: Optional[float] = None
     ma_heart_rate_percent: Optional[float] = None
@@ -128,14 +230,109 @@ class MetricsModel(BaseModel):
     ma_zone_name: Optional[str] = None
     ma_zone_description: Optional[str] = None
 
+    # heart rate variability from beat timing, milliseconds
+    rr_interval: Optional[float] = None
+    rmssd: Optional[float] = None
+    sdnn: Optional[float] = None
+
+    # integrated from power since start
+    work_kj: Optional[float] = None
+    energy_kcal: Optional[float] = None
+    w_prime_balance: Optional[float] = None
+    w_prime_balance_percent: Optional[float] = None
+
     is_running: Optional[bool] = None
     last_sensor_update: Optional[datetime] = None
     last_sensor_name: Optional[str] = None
 
+    # increases with every processed data page, start and stop
+    seq: int = 0
+
+
+class TargetType(str, Enum):
+    POWER = "power"
+    FTP_PERCENT = "ftp_percent"
+    HEART_RATE = "heart_rate"
+    CADENCE = "cadence"
+    # basic resistance of a smart trainer in percent
+    RESISTANCE = "resistance"
+
+
+class TargetModel(BaseModel):
+    type: TargetType
+    low: float = Field(..., ge=0, description="Lower bound of the target range")
+    high: float = Field(..., ge=0, description="Upper bound of the target range")
+
+    @model_validator(mode="after")
+    def check_range(self):
+        if self.low > self.high:
+            raise ValueError(f"low {self.low} is above high {self.high}")
+        return self
+
 
 class IntervalModel(BaseModel):
     seconds: int
     name: str
+    target: Optional[TargetModel] = None
+
+
+class WorkoutDefinitionModel(BaseModel):
+    name: str = Field(..., min_length=1, max_length=200)
+    description: Optional[str] = None
+    tags: List[str] = Field(default_factory=list)
+    intervals: List[IntervalModel]
+
+
+class WorkoutSummaryModel(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    tags: List[str] = Field(default_factory=list)
+    interval_count: int
+    total_seconds: int
+    updated: datetime
+
+
+class WorkoutModel(WorkoutSummaryModel):
+    intervals: List[IntervalModel]
+
+
+class WorkoutPageModel(BaseModel):
+    items: List[WorkoutSummaryModel]
+    total: int
+    offset: int
+    limit: int
+
+
+class ComplianceModel(BaseModel):
+    target_low: Optional[float] = None
+    target_high: Optional[float] = None
+    actual: Optional[float] = None
+    time_in_target: float = 0
+    time_with_data: float = 0
+    average_deviation: Optional[float] = None
+    score: Optional[float] = None
+
+
+class AggregateModel(BaseModel):
+    count: int = 0
+    avg: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+
+class LapModel(BaseModel):
+    lap_number: int
+    round_number: int
+    interval_index: int
+    name: str
+    duration: float
+    distance: Optional[float] = None
+    power: AggregateModel
+    heart_rate: AggregateModel
+    cadence: AggregateModel
+    speed: AggregateModel
+    compliance: Optional[ComplianceModel] = None
 
 
 class IntervalProgressModel(BaseModel):
@@ -145,3 +342,69 @@ class IntervalProgressModel(BaseModel):
     total_time_spent: Optional[float] = None
     round_number: Optional[int] = None
     is_running: Optional[bool] = None
+    compliance: Optional[ComplianceModel] = None
+
+
+class MetricSummaryModel(BaseModel):
+    avg: Optional[float] = None
+    max: Optional[float] = None
+    seconds: int = Field(0, description="Seconds with data")
+
+
+class PeakPowerModel(BaseModel):
+    seconds: int
+    watts: float = Field(..., description="Best average power over the duration")
+
+
+class HistogramBinModel(BaseModel):
+    low: float
+    high: float
+    seconds: int
+
+
+class QuadrantModel(BaseModel):
+    threshold_force_n: float = Field(
+        ..., description="Effective pedal force of FTP at the average cadence"
+    )
+    threshold_velocity_m_s: float = Field(
+        ..., description="Circumferential pedal velocity at the average cadence"
+    )
+    q1_percent: float = Field(..., description="High force, high velocity")
+    q2_percent: float = Field(..., description="High force, low velocity")
+    q3_percent: float = Field(..., description="Low force, low velocity")
+    q4_percent: float = Field(..., description="Low force, high velocity")
+
+
+class IntervalSummaryModel(BaseModel):
+    name: str
+    round_number: int
+    interval_index: int
+    start_s: float = Field(..., description="Seconds since the session start")
+    duration_s: float
+    avg_power: Optional[float] = None
+    max_power: Optional[float] = None
+    avg_heart_rate: Optional[float] = None
+    max_heart_rate: Optional[float] = None
+    avg_cadence: Optional[float] = None
+
+
+class SessionReportModel(BaseModel):
+    duration_s: float
+    samples: Dict[str, int] = Field(..., description="Recorded samples per metric")
+    dropped_samples: int = Field(0, description="Samples over the recording limit")
+    distance: Optional[float] = None
+    power: MetricSummaryModel
+    heart_rate: MetricSummaryModel
+    cadence: MetricSummaryModel
+    speed: MetricSummaryModel
+    normalized_power: Optional[float] = None
+    peak_power: List[PeakPowerModel] = Field(default_factory=list)
+    power_histogram: List[HistogramBinModel] = Field(default_factory=list)
+    heart_rate_histogram: List[HistogramBinModel] = Field(default_factory=list)
+    quadrants: Optional[QuadrantModel] = Field(
+        None, description="Pedaling quadrant analysis, needs FTP and cadence"
+    )
+    decoupling_percent: Optional[float] = Field(
+        None, description="Pa:HR, drop of power per heart beat in the second half"
+    )
+    intervals: List[IntervalSummaryModel] = Field(default_factory=list)
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import threading
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.clock import SYSTEM_CLOCK, Clock
+from app.model import PairedDeviceModel
+
+# last_seen of a known sensor is only persisted again after this long
+SEEN_RESOLUTION = timedelta(hours=1)
+
+
+class PairingCache:
+    """
+    Sensors seen in earlier sessions, persisted as JSON.
+
+    On start a dedicated channel is opened for every cached sensor, so data
+    flows after one message period instead of waiting for the wildcard
+    scanner. Sensors not seen for max_age are dropped, as are the oldest
+    beyond max_devices.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_age: timedelta = timedelta(days=30),
+        clock: Clock = SYSTEM_CLOCK,
+        max_devices: int = 64,
+    ):
+        self._logger = logging.getLogger("app.pairing")
+        self.path = path
+        self.max_age = max_age
+        self.max_devices = max_devices
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._devices: Dict[int, PairedDeviceModel] = {}
+        self._dirty = False
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            devices = [PairedDeviceModel(**d) for d in data]
+        except Exception as e:
+            self._logger.warning(f"Failed to load pairing cache from {self.path}: {e}")
+            return
+        with self._lock:
+            self._devices = {d.device_id: d for d in devices}
+            self._expire()
+
+    def save(self):
+        """Writes the cache if it changed since the last save."""
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            self._expire()
+            data = [d.model_dump(mode="json") for d in self._devices.values()]
+            self._dirty = False
+        try:
+            with open(self.path, "w") as f:
+                json.dump(data, f, indent=2)
+        except Exception as e:
+            self._logger.warning(f"Failed to save pairing cache: {e}")
+
+    def _expire(self):
+        """Drops old sensors, called with lock held."""
+        oldest = self._clock.now() - self.max_age
+        expired = [k for k, d in self._devices.items() if d.last_seen < oldest]
+        if len(self._devices) - len(expired) > self.max_devices:
+            by_age = sorted(self._devices, key=lambda k: self._devices[k].last_seen)
+            expired = by_age[: len(self._devices) - self.max_devices]
+        for device_id in expired:
+            del self._devices[device_id]
+        if expired:
+            self._dirty = True
+
+    def seen(self, device_tuples: Iterable[Tuple[int, int, int]]):
+        now = self._clock.now()
+        with self._lock:
+            for device_id, device_type, trans_type in device_tuples:
+                known = self._devices.get(device_id)
+                if (
+                    known is not None
+                    and known.device_type == device_type
+                    and known.trans_type == trans_type
+                    and now - known.last_seen < SEEN_RESOLUTION
+                ):
+                    continue
+                self._devices[device_id] = PairedDeviceModel(
+                    device_id=device_id,
+                    device_type=device_type,
+                    trans_type=trans_type,
+                    last_seen=now,
+                )
+                self._dirty = True
+
+    def forget(self, device_id: int):
+        with self._lock:
+            if self._devices.pop(device_id, None) is not None:
+                self._dirty = True
+
+    def devices(self) -> List[PairedDeviceModel]:
+        """Cached sensors, most recently seen first."""
+        with self._lock:
+            self._expire()
+            return sorted(
+                self._devices.values(), key=lambda d: d.last_seen, reverse=True
+            )
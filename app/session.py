@@ -0,0 +1,328 @@
+"""
+Raw samples of the active session and the post-session report.
+
+Samples are appended to one pair of float32 arrays per metric (seconds
+since the session start and value), 8 bytes per sample. The report copies
+them into NumPy arrays, resamples every metric onto a common 1 Hz grid and
+computes everything with vectorized operations.
+"""
+
+import math
+import threading
+from array import array
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.clock import SYSTEM_CLOCK, Clock
+from app.model import (
+    HistogramBinModel,
+    IntervalSummaryModel,
+    MetricSummaryModel,
+    PeakPowerModel,
+    QuadrantModel,
+    SessionReportModel,
+)
+from app.util import MetricsKey
+from app.workout import IntervalPosition, Timer
+
+RECORDED_KEYS = (
+    MetricsKey.POWER,
+    MetricsKey.HEART_RATE,
+    MetricsKey.CADENCE,
+    MetricsKey.SPEED,
+)
+# a sample is carried forward on the 1 Hz grid for at most this long
+STALE_SECONDS = 3.0
+PEAK_DURATIONS = (5, 60, 300, 1200)
+POWER_BIN_WATTS = 25
+HEART_RATE_BIN_BPM = 10
+DEFAULT_CRANK_LENGTH_M = 0.1725
+
+
+class SessionRecorder:
+    """
+    Keeps every sample of the session, registered as a Metrics sample
+    listener. At most max_samples are kept per metric (24 h at 4 Hz),
+    later samples are counted but dropped.
+
+    With a timer, every interval change is marked with the position, so the
+    report can summarize intervals across timer stops and restarts. Only
+    the latest max_marks marks are kept, the report leaves out the intervals
+    of the dropped ones.
+    """
+
+    def __init__(
+        self,
+        timer: Optional[Timer] = None,
+        clock: Clock = SYSTEM_CLOCK,
+        max_samples: int = 345600,
+        max_marks: int = 10000,
+    ):
+        self._timer = timer
+        self._clock = clock
+        self.max_samples = max_samples
+        self.max_marks = max_marks
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Starts a new session."""
+        with self._lock:
+            self.start = self._clock.monotonic()
+            self.end = self.start
+            self._times = {key: array("f") for key in RECORDED_KEYS}
+            self._values = {key: array("f") for key in RECORDED_KEYS}
+            self._marks: Deque[Tuple[float, Optional[IntervalPosition]]] = deque(
+                maxlen=self.max_marks
+            )
+            self.distance: Optional[float] = None
+            self.dropped = 0
+
+    def on_sample(self, key: MetricsKey, value: float, now: float):
+        if key == MetricsKey.DISTANCE:
+            self.distance = value
+            return
+        if key not in RECORDED_KEYS:
+            return
+        position = self._timer.position() if self._timer is not None else None
+        with self._lock:
+            self._mark(position, now)
+            times = self._times[key]
+            if len(times) >= self.max_samples:
+                self.dropped += 1
+                return
+            times.append(now - self.start)
+            self._values[key].append(value)
+            self.end = max(self.end, now)
+
+    def _mark(self, position: Optional[IntervalPosition], now: float):
+        """Called with lock held."""
+        last = self._marks[-1][1] if self._marks else None
+        if position is None:
+            if last is not None:
+                self._marks.append((now - self.start, None))
+        elif last is None or position.key() != last.key():
+            start = now - position.time_spent - self.start
+            self._marks.append((max(start, 0.0), position))
+
+    def marks(self) -> List[Tuple[float, Optional[IntervalPosition]]]:
+        """(seconds since the session start, position) at every interval change."""
+        with self._lock:
+            return list(self._marks)
+
+    def arrays(self) -> Tuple[float, Dict[MetricsKey, Tuple[np.ndarray, np.ndarray]]]:
+        """Copies of the samples, the duration so far and (times, values) per metric."""
+        with self._lock:
+            duration = self.end - self.start
+            return duration, {
+                key: (
+                    np.array(self._times[key], dtype=np.float64),
+                    np.array(self._values[key], dtype=np.float64),
+                )
+                for key in RECORDED_KEYS
+            }
+
+
+def resample(times: np.ndarray, values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """Last sample at every grid point, NaN where it is older than STALE_SECONDS."""
+    if len(times) == 0:
+        return np.full(len(grid), np.nan)
+    index = np.searchsorted(times, grid, side="right") - 1
+    clipped = np.clip(index, 0, None)
+    valid = (index >= 0) & (grid - times[clipped] <= STALE_SECONDS)
+    return np.where(valid, values[clipped], np.nan)
+
+
+def summarize(values: np.ndarray) -> MetricSummaryModel:
+    known = values[~np.isnan(values)]
+    if len(known) == 0:
+        return MetricSummaryModel()
+    return MetricSummaryModel(
+        avg=float(known.mean()), max=float(known.max()), seconds=len(known)
+    )
+
+
+def normalized_power(power: np.ndarray) -> Optional[float]:
+    """Fourth root of the mean fourth power of the 30 s rolling average."""
+    filled = np.nan_to_num(power)
+    if len(filled) < 30:
+        return None
+    rolling = np.convolve(filled, np.ones(30) / 30, mode="valid")
+    return float(np.mean(rolling**4) ** 0.25)
+
+
+def peak_powers(power: np.ndarray) -> List[PeakPowerModel]:
+    """Best average power over each duration, from one cumulative sum."""
+    filled = np.nan_to_num(power)
+    cumulative = np.concatenate(([0.0], np.cumsum(filled)))
+    peaks = []
+    for seconds in PEAK_DURATIONS:
+        if len(filled) < seconds:
+            break
+        means = (cumulative[seconds:] - cumulative[:-seconds]) / seconds
+        peaks.append(PeakPowerModel(seconds=seconds, watts=float(means.max())))
+    return peaks
+
+
+def histogram(values: np.ndarray, width: float) -> List[HistogramBinModel]:
+    """Seconds per bin of the given width."""
+    known = values[~np.isnan(values)]
+    if len(known) == 0:
+        return []
+    bins = np.floor(known / width).astype(np.int64)
+    first = int(bins.min())
+    counts = np.bincount(bins - first)
+    return [
+        HistogramBinModel(
+            low=(first + i) * width, high=(first + i + 1) * width, seconds=int(c)
+        )
+        for i, c in enumerate(counts)
+        if c
+    ]
+
+
+def quadrants(
+    power: np.ndarray,
+    cadence: np.ndarray,
+    threshold_power: Optional[float],
+    crank_length_m: float,
+) -> Optional[QuadrantModel]:
+    """
+    Pedaling quadrant analysis: effective pedal force against pedal
+    velocity, split at the force and velocity of threshold power at the
+    rider's average cadence.
+    """
+    pedaling = ~np.isnan(power) & ~np.isnan(cadence) & (cadence > 0)
+    if not threshold_power or not pedaling.any():
+        return None
+    watts, rpm = power[pedaling], cadence[pedaling]
+    velocity = rpm * crank_length_m * 2 * math.pi / 60
+    force = watts / velocity
+
+    threshold_velocity = float(rpm.mean()) * crank_length_m * 2 * math.pi / 60
+    threshold_force = threshold_power / threshold_velocity
+    high_force = force >= threshold_force
+    high_velocity = velocity >= threshold_velocity
+    total = len(watts)
+    return QuadrantModel(
+        threshold_force_n=threshold_force,
+        threshold_velocity_m_s=threshold_velocity,
+        q1_percent=100 * float(np.sum(high_force & high_velocity)) / total,
+        q2_percent=100 * float(np.sum(high_force & ~high_velocity)) / total,
+        q3_percent=100 * float(np.sum(~high_force & ~high_velocity)) / total,
+        q4_percent=100 * float(np.sum(~high_force & high_velocity)) / total,
+    )
+
+
+def decoupling(power: np.ndarray, heart_rate: np.ndarray) -> Optional[float]:
+    """
+    Pa:HR in percent, how much the power to heart rate ratio of the second
+    half dropped against the first half.
+    """
+    both = ~np.isnan(power) & ~np.isnan(heart_rate) & (heart_rate > 0)
+    watts, bpm = power[both], heart_rate[both]
+    if len(watts) < 60:
+        return None
+    half = len(watts) // 2
+    first = watts[:half].mean() / bpm[:half].mean()
+    second = watts[half:].mean() / bpm[half:].mean()
+    if first <= 0:
+        return None
+    return float(100 * (first - second) / first)
+
+
+def interval_summaries(
+    grid_power: np.ndarray,
+    grid_heart_rate: np.ndarray,
+    grid_cadence: np.ndarray,
+    marks: List[Tuple[float, Optional[IntervalPosition]]],
+) -> List[IntervalSummaryModel]:
+    """
+    Summaries of the workout intervals between the recorded marks, a mark
+    without position ends an interval without starting the next one.
+    """
+    duration = len(grid_power)
+    if duration == 0 or not marks:
+        return []
+    starts = np.clip(
+        np.ceil([start for start, _ in marks]).astype(np.int64), 0, duration
+    )
+    ends = np.append(starts[1:], duration)
+    # reduceat needs increasing offsets inside the grid, so empty segments go
+    keep = np.flatnonzero(ends > starts)
+    if len(keep) == 0:
+        return []
+    positions = [marks[n][1] for n in keep]
+    starts, ends = starts[keep], ends[keep]
+    edges = starts
+
+    def sums(values):
+        known = ~np.isnan(values)
+        total = np.add.reduceat(np.where(known, values, 0.0), edges)
+        count = np.add.reduceat(known.astype(np.int64), edges)
+        peak = np.maximum.reduceat(np.where(known, values, -np.inf), edges)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return total / count, peak
+
+    avg_power, max_power = sums(grid_power)
+    avg_heart_rate, max_heart_rate = sums(grid_heart_rate)
+    avg_cadence, _ = sums(grid_cadence)
+
+    def value(x) -> Optional[float]:
+        return float(x) if np.isfinite(x) else None
+
+    return [
+        IntervalSummaryModel(
+            name=position.interval.name,
+            round_number=position.round_number,
+            interval_index=position.index,
+            start_s=float(starts[n]),
+            duration_s=float(ends[n] - starts[n]),
+            avg_power=value(avg_power[n]),
+            max_power=value(max_power[n]),
+            avg_heart_rate=value(avg_heart_rate[n]),
+            max_heart_rate=value(max_heart_rate[n]),
+            avg_cadence=value(avg_cadence[n]),
+        )
+        for n, position in enumerate(positions)
+        if position is not None
+    ]
+
+
+def build_report(
+    recorder: SessionRecorder,
+    threshold_power: Optional[float] = None,
+    crank_length_m: Optional[float] = None,
+) -> SessionReportModel:
+    """Report of the recorded session, threshold_power enables the quadrants."""
+    duration, samples = recorder.arrays()
+    marks = recorder.marks()
+    grid = np.arange(0.0, max(duration, 0.0), 1.0)
+    series = {
+        key: resample(times, values, grid) for key, (times, values) in samples.items()
+    }
+    power = series[MetricsKey.POWER]
+    heart_rate = series[MetricsKey.HEART_RATE]
+    cadence = series[MetricsKey.CADENCE]
+
+    return SessionReportModel(
+        duration_s=duration,
+        samples={key.value: len(times) for key, (times, _) in samples.items()},
+        dropped_samples=recorder.dropped,
+        distance=recorder.distance,
+        power=summarize(power),
+        heart_rate=summarize(heart_rate),
+        cadence=summarize(cadence),
+        speed=summarize(series[MetricsKey.SPEED]),
+        normalized_power=normalized_power(power),
+        peak_power=peak_powers(power),
+        power_histogram=histogram(power, POWER_BIN_WATTS),
+        heart_rate_histogram=histogram(heart_rate, HEART_RATE_BIN_BPM),
+        quadrants=quadrants(
+            power, cadence, threshold_power, crank_length_m or DEFAULT_CRANK_LENGTH_M
+        ),
+        decoupling_percent=decoupling(power, heart_rate),
+        intervals=interval_summaries(power, heart_rate, cadence, marks),
+    )
@@ -0,0 +1,271 @@
+import math
+import random
+import threading
+from typing import List, Optional
+
+from openant.devices.bike_speed_cadence import BikeCadenceData, BikeSpeedData
+from openant.devices.common import DeviceData, DeviceType
+from openant.devices.fitness_equipment import (
+    CommandStatus,
+    FitnessEquipmentData,
+    ResistenceMode,
+)
+from openant.devices.heart_rate import HeartRateData
+from openant.devices.power_meter import PowerData
+
+from app.ant import Metrics
+from app.broadcast import SampleBroadcaster
+from app.clock import SYSTEM_CLOCK, Clock, ManualClock
+from app.model import LifecycleState, MetricsSettingsModel
+
+
+class SimulatedDevice:
+    """
+    Stands in for an openant AntPlusDevice and produces data pages the way the
+    real device profiles do, including the raw 16-bit event time and
+    revolution counters.
+    """
+
+    WHEEL_CIRCUMFERENCE_M = 2.096
+
+    def __init__(self, device_id: int, device_type: DeviceType, name: str, seed=None):
+        self.device_id = device_id
+        self.device_type = device_type.value
+        self.name = name
+        self._random = random.Random(seed if seed is not None else device_id)
+
+        self._revolutions = 0.0
+        self._event_time = 0.0
+        self._beats = 0.0
+        self._power_update_event_count = [0, 0]
+
+        if device_type == DeviceType.HeartRate:
+            self.page_name, self.data = "heart_rate", HeartRateData()
+        elif device_type == DeviceType.PowerMeter:
+            self.page_name, self.data = "power", PowerData()
+        elif device_type == DeviceType.BikeCadence:
+            self.page_name, self.data = "bike_cadence", BikeCadenceData()
+        elif device_type == DeviceType.BikeSpeed:
+            self.page_name, self.data = "bike_speed", BikeSpeedData()
+        else:
+            raise ValueError(f"Unsupported simulated device type {device_type}")
+
+    def close_channel(self):
+        pass
+
+    def tick(self, elapsed: float, dt: float) -> DeviceData:
+        """Advance the simulated sensor by dt seconds and return the data page."""
+        effort, noise = self._effort(elapsed)
+
+        if isinstance(self.data, PowerData):
+            self.data.instantaneous_power = self._rider_power(effort, noise)
+            self._count_power_event()
+        elif isinstance(self.data, HeartRateData):
+            heart_rate = 110 + 50 * effort + 2 * noise
+            beats = heart_rate / 60 * dt
+            self._beats, beat_time = self._count_events(self._beats, beats, dt)
+            self.data.heart_rate = int(round(heart_rate))
+            self.data.beat_count = int(self._beats) % 256
+            if beat_time is not None:
+                self.data.beat_time = beat_time
+        elif isinstance(self.data, BikeCadenceData):
+            cadence = 75 + 20 * effort + noise
+            self._advance(
+                self.data.bike_cadence_event_time,
+                self.data.cumulative_cadence_revolution,
+                cadence / 60 * dt,
+                dt,
+            )
+        elif isinstance(self.data, BikeSpeedData):
+            speed_mps = (25 + 10 * effort + noise) / 3.6
+            self._advance(
+                self.data.bike_speed_event_time,
+                self.data.cumulative_speed_revolution,
+                speed_mps / self.WHEEL_CIRCUMFERENCE_M * dt,
+                dt,
+            )
+        return self.data
+
+    def _effort(self, elapsed: float):
+        """Slow wave over a few minutes plus some noise."""
+        return 0.5 + 0.5 * math.sin(elapsed / 90), self._random.uniform(-1, 1)
+
+    @staticmethod
+    def _rider_power(effort: float, noise: float) -> int:
+        return max(0, int(150 + 100 * effort + 10 * noise))
+
+    def _count_power_event(self):
+        count = self._power_update_event_count
+        count[0], count[1] = count[1], (count[1] + 1) % 256
+
+    def _count_events(self, total: float, events: float, dt: float):
+        """
+        Advance the event counter, returns the new total and the 1/1024 s event
+        time of the last completed event or None if no event completed.
+        """
+        self._event_time += dt
+        new_total = total + events
+        if int(new_total) == int(total):
+            return new_total, None
+        since_last = (new_total - int(new_total)) / events * dt
+        event_time = (self._event_time - since_last) % 64
+        return new_total, int(event_time * 1024) / 1024
+
+    def _advance(self, event_time: List[float], revolutions: List[int], revs, dt):
+        self._revolutions, last_event = self._count_events(self._revolutions, revs, dt)
+        # pages without a new revolution repeat the last event
+        event_time[0] = event_time[1]
+        revolutions[0] = revolutions[1]
+        if last_event is not None:
+            event_time[1] = last_event
+            revolutions[1] = int(self._revolutions) % 0x10000
+
+
+class SimulatedTrainer(SimulatedDevice):
+    """
+    FE-C smart trainer. Free riding it produces the same power as a
+    simulated power meter, in ERG mode the power follows the target power
+    with a first order lag. Commands are confirmed on the next data page,
+    as the command status page of a real trainer would.
+    """
+
+    # seconds until an ERG trainer covers 63 % of a target change
+    ERG_TIME_CONSTANT_S = 1.5
+
+    def __init__(self, device_id: int, name: str = "fitness_equipment", seed=None):
+        super().__init__(device_id, DeviceType.PowerMeter, name, seed)
+        self.device_type = DeviceType.FitnessEquipment.value
+        self.page_name = "standard_power"
+        # keyed like openant's FitnessEquipment.data
+        self.data = {"power": self.data, "fe": FitnessEquipmentData()}
+        self.command_status = CommandStatus.Unitialised
+        self.commands = []  # (mode, value) of every received command
+        self._pending = None
+        self._power = None
+
+    def set_target_power(self, power: int):
+        self.commands.append((ResistenceMode.TargetPower, power))
+        self._pending = (ResistenceMode.TargetPower, power)
+
+    def set_basic_resistance(self, resistance: float):
+        self.commands.append((ResistenceMode.Basic, resistance))
+        self._pending = (ResistenceMode.Basic, resistance)
+
+    def tick(self, elapsed: float, dt: float) -> DeviceData:
+        fe = self.data["fe"]
+        if self._pending is not None:
+            fe.resistance_mode, fe.resistance = self._pending
+            self.command_status = CommandStatus.Pass
+            self._pending = None
+
+        free_ride = self._rider_power(*self._effort(elapsed))
+        if fe.resistance_mode == ResistenceMode.TargetPower:
+            target = fe.resistance
+        elif fe.resistance_mode == ResistenceMode.Basic:
+            target = free_ride * (1 + fe.resistance / 100)
+        else:
+            target = free_ride
+        if self._power is None:
+            self._power = target
+        self._power += (target - self._power) * (
+            1 - math.exp(-dt / self.ERG_TIME_CONSTANT_S)
+        )
+        power = self.data["power"]
+        power.instantaneous_power = max(0, int(round(self._power)))
+        self._count_power_event()
+        return power
+
+
+def default_devices() -> List[SimulatedDevice]:
+    return [
+        SimulatedTrainer(1001),
+        SimulatedDevice(1002, DeviceType.HeartRate, "heart_rate"),
+        SimulatedDevice(1003, DeviceType.BikeCadence, "bike_cadence"),
+        SimulatedDevice(1004, DeviceType.BikeSpeed, "bike_speed"),
+    ]
+
+
+class SimulatedMetrics(Metrics):
+    """
+    Metrics fed by simulated sensors instead of an ANT+ stick.
+    Used for load tests and for running the service without hardware.
+
+    With a ManualClock no sensor thread is started, the simulation only
+    advances through fast_forward() so hours of riding run in seconds.
+    """
+
+    def __init__(
+        self,
+        metrics_settings: MetricsSettingsModel = MetricsSettingsModel(),
+        rate_hz: float = 4.0,
+        devices: Optional[List[SimulatedDevice]] = None,
+        clock: Clock = SYSTEM_CLOCK,
+        broadcaster: Optional[SampleBroadcaster] = None,
+    ):
+        super().__init__(
+            metrics_settings=metrics_settings, clock=clock, broadcaster=broadcaster
+        )
+        self._rate_hz = rate_hz
+        self._simulated_devices = devices
+        self._started = 0.0
+
+    def start(self):
+        with self._lifecycle_lock, self._lock:
+            if self._lifecycle != LifecycleState.STOPPED:
+                self._logger.warning("Metrics collection already running")
+                return
+
+            self._devices = list(self._simulated_devices or default_devices())
+            self._stop_event.clear()
+            self._started = self._clock.monotonic()
+            self._reset_metrics()
+            self._lifecycle = LifecycleState.RUNNING
+            if not isinstance(self._clock, ManualClock):
+                self._node_thread = threading.Thread(target=self._run_node, daemon=True)
+                self._node_thread.start()
+        self._publish_update()
+
+    def stop(self):
+        with self._lifecycle_lock:
+            with self._lock:
+                if self._lifecycle != LifecycleState.RUNNING:
+                    self._logger.warning("Metrics collection already stopped")
+                    return
+                self._lifecycle = LifecycleState.STOPPING
+                self._stop_event.set()
+
+            self._join_threads(self._node_thread)
+            with self._lock:
+                self._cleanup_devices()
+            self._reset_metrics()
+            self._lifecycle = LifecycleState.STOPPED
+        self._publish_update()
+
+    def fast_forward(self, seconds: float, on_tick=None):
+        """
+        Advance a ManualClock simulation by the given seconds, one sensor
+        period at a time. on_tick is called after every period.
+        """
+        if not isinstance(self._clock, ManualClock):
+            raise ValueError("fast_forward requires a ManualClock")
+
+        period = 1 / self._rate_hz
+        for _ in range(int(round(seconds * self._rate_hz))):
+            self._clock.advance(period)
+            self._tick(period)
+            if on_tick:
+                on_tick()
+
+    def _tick(self, period: float):
+        elapsed = self._clock.monotonic() - self._started
+        for dev in self._devices:
+            data = dev.tick(elapsed, period)
+            self._on_device_page(dev, 0x10, dev.page_name, data)
+
+    def _run_node(self):
+        period = 1 / self._rate_hz
+        next_tick = self._clock.monotonic()
+        while not self._stop_event.is_set():
+            self._tick(period)
+            next_tick += period
+            self._clock.wait(self._stop_event, next_tick - self._clock.monotonic())
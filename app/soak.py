@@ -0,0 +1,262 @@
+"""
+Memory soak test.
+
+Fast-forwards a simulated session on a ManualClock with the wiring of
+app/api.py: workout tracker, session recorder, long-poll waiters and the
+metrics, devices and workout stream hubs with clients that connect, resume
+and leave. Samples RSS and the size of every growing structure each
+simulated hour. Fails when RSS grows more than --max-growth-mb after the
+warmup hour or a structure outgrows its bound. The finished laps list
+grows until it reaches its cap of 500 laps (about 20 hours of this
+workout), which is part of the budget. The recorder is capped at one
+simulated hour, so its arrays fill in the warmup hour and the run checks
+that they stop there.
+
+Stream clients run on a real event loop. Their rates are scaled up like
+the clock, one to four milliseconds per frame, so a visit takes
+milliseconds. A client visits every five minutes and asks for another rate.
+
+    python -m app.soak --hours 24 --output soak_report.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.clock import ManualClock
+from app.memory import rss_bytes
+from app.model import IntervalModel, MetricsSettingsModel, TargetModel, TargetType
+from app.session import SessionRecorder, build_report
+from app.sim import SimulatedMetrics
+from app.stream import SequenceNotifier, StreamHub, TickScheduler
+from app.workout import Timer, WorkoutTracker
+
+WORKOUT = [
+    IntervalModel(
+        name="work",
+        seconds=300,
+        target=TargetModel(type=TargetType.FTP_PERCENT, low=90, high=105),
+    ),
+    IntervalModel(
+        name="rest",
+        seconds=120,
+        target=TargetModel(type=TargetType.HEART_RATE, low=100, high=140),
+    ),
+]
+# periods of the stream clients, scaled like the clock
+STREAM_PERIODS = tuple(n / 1000 for n in range(1, 5))
+STREAM_REPLAY_SECONDS = 0.01
+# two marks per 7 minute round, the cap is reached in the warmup hour
+MAX_MARKS = 16
+
+
+class StreamClients:
+    """
+    The stream hubs and long-poll notifier of app/api.py on their own event
+    loop, with one client per hub that connects, resumes and leaves.
+    """
+
+    def __init__(self, metrics: SimulatedMetrics, tracker: WorkoutTracker):
+        self.loop = asyncio.new_event_loop()
+        self.shutdown_event = asyncio.Event()
+        self.ticks = TickScheduler(self.shutdown_event)
+        self.notifier = SequenceNotifier()
+        metrics.add_update_listener(self.notifier.publish)
+
+        def hub(name, keyframes_only=False):
+            return StreamHub(
+                name,
+                self.shutdown_event,
+                self.ticks,
+                STREAM_REPLAY_SECONDS,
+                keyframes_only=keyframes_only,
+            )
+
+        async def metrics_frame():
+            return f"data: {metrics.get_metrics().model_dump_json()}\n\n"
+
+        async def devices_frame():
+            devices = [device.model_dump() for device in metrics.get_devices()]
+            return f"data: {json.dumps(devices)}\n\n"
+
+        async def workout_frame():
+            progress = tracker.progress()
+            return f"data: {progress.model_dump_json() if progress else '{}'}\n\n"
+
+        self.hubs = [
+            (hub("metrics"), metrics_frame),
+            (hub("devices", keyframes_only=True), devices_frame),
+            (hub("workout", keyframes_only=True), workout_frame),
+        ]
+
+    def long_poll(self, advance: Callable[[], None]) -> bool:
+        """A long-poll request waiting while advance() publishes an update."""
+
+        async def request():
+            waiter = asyncio.ensure_future(
+                self.notifier.wait(self.notifier.seq(), timeout=1)
+            )
+            await asyncio.sleep(0)  # waits before the update
+            advance()
+            return await waiter
+
+        return self.loop.run_until_complete(request())
+
+    def visit(self, minute: int):
+        """Every client reads two frames, leaves and resumes from its id."""
+        period = STREAM_PERIODS[minute % len(STREAM_PERIODS)]
+
+        async def client(hub: StreamHub, produce):
+            last_event_id = None
+            for _ in range(2):
+                gen = hub.subscribe((None, period), period, produce, last_event_id)
+                for _ in range(2):
+                    frame = await gen.__anext__()
+                    last_event_id = frame.split("\n", 1)[0][len("id: ") :]
+                await gen.aclose()
+
+        async def clients():
+            await asyncio.gather(*(client(hub, produce) for hub, produce in self.hubs))
+
+        self.loop.run_until_complete(clients())
+
+    def sizes(self) -> Dict[str, int]:
+        return {
+            "stream_groups": sum(hub.group_count() for hub, _ in self.hubs),
+            "stream_subscribers": sum(hub.subscriber_count() for hub, _ in self.hubs),
+            "pending_ticks": self.ticks.pending_count(),
+            "poll_waiters": self.notifier.waiter_count(),
+        }
+
+    def close(self):
+        self.shutdown_event.set()
+        self.notifier.close()
+        # lingering producers end at their next tick
+        self.loop.run_until_complete(asyncio.sleep(max(STREAM_PERIODS)))
+        self.loop.close()
+
+
+def run(
+    hours: float = 24,
+    rate_hz: float = 4,
+    poll_seconds: float = 1,
+    max_growth_mb: float = 8,
+    on_hour=None,
+) -> Dict:
+    clock = ManualClock()
+    settings = MetricsSettingsModel(
+        age=30,
+        ftp=250,
+        speed_wheel_circumference_m=2.096,
+        distance_wheel_circumference_m=2.096,
+    )
+    metrics = SimulatedMetrics(metrics_settings=settings, rate_hz=rate_hz, clock=clock)
+    timer = Timer(WORKOUT, clock=clock)
+    tracker = WorkoutTracker(timer, metrics.get_metrics_settings)
+    recorder = SessionRecorder(
+        timer, clock=clock, max_samples=int(3600 * rate_hz), max_marks=MAX_MARKS
+    )
+    metrics.add_sample_listener(tracker.on_sample)
+    metrics.add_sample_listener(recorder.on_sample)
+    streams = StreamClients(metrics, tracker)
+    bounds = {
+        "session_samples": recorder.max_samples,
+        "session_marks": recorder.max_marks,
+        "laps": 500,
+        "stream_groups": len(streams.hubs) * len(STREAM_PERIODS),
+        "stream_subscribers": 0,
+        "pending_ticks": len(STREAM_PERIODS),
+        "poll_waiters": 0,
+    }
+
+    def poll():
+        # what a dashboard client does when its long-poll returns
+        metrics.get_metrics().model_dump_json()
+        tracker.progress().model_dump_json()
+
+    started = time.monotonic()
+    metrics.start()
+    timer.start()
+
+    rss_mb: List[Optional[float]] = []
+    sizes: List[Dict[str, int]] = []
+    woken = 0
+    for hour in range(int(hours)):
+        elapsed = 0.0
+        while elapsed < 3600:
+            woken += streams.long_poll(lambda: metrics.fast_forward(poll_seconds))
+            elapsed += poll_seconds
+            poll()
+            if elapsed % 60 < poll_seconds:
+                for lap in tracker.laps():
+                    lap.model_dump_json()
+            if elapsed % 300 < poll_seconds:
+                streams.visit(int((hour * 3600 + elapsed) // 300))
+        report = build_report(recorder, settings.ftp)
+        sizes.append(
+            {
+                "session_samples": max(report.samples.values()),
+                "session_marks": len(recorder.marks()),
+                "laps": len(tracker.laps()),
+                **streams.sizes(),
+            }
+        )
+        gc.collect()
+        rss = rss_bytes()
+        rss_mb.append(round(rss / 1024 / 1024, 2) if rss is not None else None)
+        if on_hour:
+            on_hour(hour + 1, rss_mb[-1])
+
+    metrics.stop()
+    streams.close()
+
+    measured = [r for r in rss_mb[1:] if r is not None]
+    growth = max(measured) - measured[0] if len(measured) > 1 else None
+    unbounded = sorted(
+        {name for hour in sizes for name, size in hour.items() if size > bounds[name]}
+    )
+    return {
+        "simulated_hours": hours,
+        "wall_seconds": round(time.monotonic() - started, 1),
+        "rss_mb": rss_mb,
+        "growth_after_warmup_mb": round(growth, 2) if growth is not None else None,
+        "max_growth_mb": max_growth_mb,
+        "sizes": sizes,
+        "bounds": bounds,
+        "unbounded": unbounded,
+        "long_polls_woken": woken,
+        "passed": (growth is None or growth <= max_growth_mb) and not unbounded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AMWA memory soak test")
+    parser.add_argument("--hours", type=float, default=24, help="simulated hours")
+    parser.add_argument("--rate-hz", type=float, default=4, help="sensor page rate")
+    parser.add_argument("--poll-seconds", type=float, default=1)
+    parser.add_argument("--max-growth-mb", type=float, default=8)
+    parser.add_argument("--output", help="write JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(
+        args.hours,
+        args.rate_hz,
+        args.poll_seconds,
+        args.max_growth_mb,
+        on_hour=lambda hour, rss: print(f"hour {hour}: rss {rss} MB", file=sys.stderr),
+    )
+
+    data = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(data)
+    print(data)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
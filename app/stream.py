@@ -0,0 +1,308 @@
+import asyncio
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+
+class _Group:
+    __slots__ = ("queues", "task", "token", "count", "frames", "linger")
+
+    def __init__(self, token: str, replay_frames: int):
+        self.queues: Set[asyncio.Queue] = set()
+        self.task: Optional[asyncio.Task] = None
+        # event ids are token:count, the token changes with every producer
+        self.token = token
+        self.count = 0
+        self.frames: deque = deque(maxlen=replay_frames)  # (count, frame)
+        self.linger: Optional[asyncio.TimerHandle] = None
+
+    def missed(self, last_event_id: Optional[str]) -> List[str]:
+        """
+        Frames after last_event_id, only the latest one as keyframe when
+        the id is of another producer or older than the buffer.
+        """
+        if not last_event_id or not self.frames:
+            return []
+        token, _, count = last_event_id.rpartition(":")
+        if token != self.token or not count.isdigit():
+            return [self.frames[-1][1]]
+        count = int(count)
+        if count < self.frames[0][0] - 1:
+            return [self.frames[-1][1]]
+        return [frame for n, frame in self.frames if n > count]
+
+
+class TickScheduler:
+    """
+    Shared deadline based ticks. A tick of a period fires on multiples of
+    that period on the loop's monotonic clock, so all streams with the same
+    rate wake together, in phase across clients, and processing time never
+    stretches the period. A waiter that is late skips to the next boundary
+    instead of catching up. Every period has one timer per tick no matter
+    how many streams wait on it. Shutdown releases all waiters at once.
+
+    Only the pending tick of a period is kept, so the periods of clients
+    that left leave nothing behind.
+    """
+
+    def __init__(self, shutdown_event: asyncio.Event):
+        self._shutdown_event = shutdown_event
+        self._ticks: Dict[float, asyncio.Future] = {}
+        self._watcher: Optional[asyncio.Task] = None
+
+    def pending_count(self) -> int:
+        return len(self._ticks)
+
+    @staticmethod
+    def next_deadline(now: float, period: float) -> float:
+        return (math.floor(now / period) + 1) * period
+
+    async def wait(self, period: float) -> float:
+        """Waits for the next tick of period, returns its deadline."""
+        loop = asyncio.get_running_loop()
+        if self._shutdown_event.is_set():
+            return loop.time()
+        self._watch_shutdown(loop)
+
+        tick = self._ticks.get(period)
+        if tick is None or tick.done() or tick.get_loop() is not loop:
+            deadline = self.next_deadline(loop.time(), period)
+            tick = loop.create_future()
+            loop.call_at(deadline, self._fire, period, tick, deadline)
+            self._ticks[period] = tick
+        # shielded, one cancelled waiter must not cancel the shared tick
+        return await asyncio.shield(tick)
+
+    def _fire(self, period: float, tick: asyncio.Future, deadline: float):
+        if self._ticks.get(period) is tick:
+            del self._ticks[period]
+        if not tick.done():
+            tick.set_result(deadline)
+
+    def _watch_shutdown(self, loop: asyncio.AbstractEventLoop):
+        if self._watcher is None or self._watcher.get_loop() is not loop:
+            self._watcher = loop.create_task(self._release_on_shutdown())
+
+    async def _release_on_shutdown(self):
+        await self._shutdown_event.wait()
+        loop = asyncio.get_running_loop()
+        ticks, self._ticks = self._ticks, {}
+        for tick in ticks.values():
+            if not tick.done():
+                tick.set_result(loop.time())
+
+
+class StreamHub:
+    """
+    Fans out SSE frames to subscribers.
+
+    Subscribers asking for the same key (e.g. the same field projection and
+    rate) share one producer task, so every distinct subscription is computed
+    and encoded once per tick no matter how many clients are connected.
+    Each subscriber only keeps the latest frame, slow clients skip frames
+    instead of buffering them.
+
+    Every frame carries an SSE id and a comment with the wall clock time it
+    was produced, which EventSource ignores and load tests measure against.
+    With replay_seconds a group keeps its frames of that long and keeps
+    producing that long after the last subscriber left, so a client that
+    reconnects with its Last-Event-ID gets exactly the frames it missed.
+    Streams of full snapshots set keyframes_only, there a reconnecting
+    client only gets the latest frame instead of a burst of stale ones.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        shutdown_event: asyncio.Event,
+        ticks: Optional[TickScheduler] = None,
+        replay_seconds: float = 0,
+        keyframes_only: bool = False,
+    ):
+        self._logger = logging.getLogger(f"app.stream.{name}")
+        self._shutdown_event = shutdown_event
+        self._ticks = ticks or TickScheduler(shutdown_event)
+        self._replay_seconds = replay_seconds
+        self._keyframes_only = keyframes_only
+        self._groups: Dict[Hashable, _Group] = {}
+        # ids of an earlier process never match
+        self._epoch = format(int(time.time()), "x")
+        self._group_ids = itertools.count(1)
+
+    def group_count(self) -> int:
+        return len(self._groups)
+
+    def subscriber_count(self) -> int:
+        return sum(len(g.queues) for g in self._groups.values())
+
+    async def subscribe(
+        self,
+        key: Hashable,
+        period: float,
+        produce: Callable[[], Awaitable[str]],
+        last_event_id: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        group = self._groups.get(key)
+        if group is None:
+            replay_frames = math.ceil(self._replay_seconds / period)
+            if self._keyframes_only:
+                replay_frames = min(replay_frames, 1)
+            group = _Group(f"{self._epoch}-{next(self._group_ids)}", replay_frames)
+            self._groups[key] = group
+            group.task = asyncio.create_task(self._run(key, group, period, produce))
+        elif group.linger is not None:
+            group.linger.cancel()
+            group.linger = None
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        group.queues.add(queue)
+        # no await in between, live frames in the queue are newer than these
+        missed = group.missed(last_event_id)
+        try:
+            for frame in missed:
+                yield frame
+            while not self._shutdown_event.is_set():
+                frame = await queue.get()
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            group.queues.discard(queue)
+            if not group.queues and self._groups.get(key) is group:
+                if self._replay_seconds and not self._shutdown_event.is_set():
+                    # keeps producing for a client that comes back
+                    group.linger = group.task.get_loop().call_later(
+                        self._replay_seconds, self._close_group, key, group
+                    )
+                else:
+                    self._close_group(key, group)
+
+    def _close_group(self, key, group: _Group):
+        if not group.queues and self._groups.get(key) is group:
+            del self._groups[key]
+            group.task.cancel()
+
+    async def _run(self, key, group: _Group, period: float, produce):
+        try:
+            while not self._shutdown_event.is_set():
+                try:
+                    frame = await produce()
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    self._logger.error(
+                        "Error producing frame for %s", key, exc_info=True
+                    )
+                    frame = None
+
+                if frame is not None:
+                    group.count += 1
+                    frame = (
+                        f"id: {group.token}:{group.count}\n"
+                        f": produced={time.time():.6f}\n{frame}"
+                    )
+                    group.frames.append((group.count, frame))
+                    for queue in group.queues:
+                        self._offer(queue, frame)
+                # returns at once on shutdown, which ends all subscribers
+                await self._ticks.wait(period)
+        finally:
+            for queue in group.queues:
+                self._offer(queue, None)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, frame):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(frame)
+
+
+class SequenceNotifier:
+    """
+    Lets long-poll requests wait on the event loop for a sequence number
+    that is published from the ANT+ thread. Waiters cost nothing until the
+    next publish, which wakes all of them with one callback per loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._closed = False
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def seq(self) -> int:
+        return self._seq
+
+    def waiter_count(self) -> int:
+        with self._lock:
+            return len(self._waiters)
+
+    def publish(self, seq: int):
+        """Thread safe, called for every new snapshot."""
+        with self._lock:
+            if seq <= self._seq:
+                return
+            self._seq = seq
+            waiters, self._waiters = self._waiters, []
+        self._wake_all(waiters)
+
+    def close(self):
+        """Releases all waiters on shutdown, later waits return at once."""
+        with self._lock:
+            self._closed = True
+            waiters, self._waiters = self._waiters, []
+        self._wake_all(waiters)
+
+    def _wake_all(self, waiters):
+        loops: Dict[asyncio.AbstractEventLoop, List[asyncio.Future]] = {}
+        for loop, future in waiters:
+            loops.setdefault(loop, []).append(future)
+        for loop, futures in loops.items():
+            try:
+                loop.call_soon_threadsafe(self._wake, futures)
+            except RuntimeError:
+                pass  # loop closed
+
+    @staticmethod
+    def _wake(futures: List[asyncio.Future]):
+        for future in futures:
+            if not future.done():
+                future.set_result(None)
+
+    async def wait(self, after: int, timeout: float) -> bool:
+        """
+        Wait until a sequence number newer than after was published.
+        Returns False on timeout. A client ahead of the current sequence
+        (e.g. after a service restart) does not wait.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._lock:
+                if self._seq != after or self._closed:
+                    return self._seq != after
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+
+            try:
+                await asyncio.wait_for(future, max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                return self._seq != after
+            finally:
+                with self._lock:
+                    if (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
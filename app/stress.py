@@ -0,0 +1,208 @@
+"""
+Concurrency stress harness for the Metrics lifecycle.
+
+Runs simulated Metrics while threads concurrently start and stop it, feed
+pages straight into ingest and read snapshots, and checks invariants on
+every reading:
+
+- no call raises
+- seq never goes backwards for a reader
+- a stopped snapshot carries no values
+- total distance equals the sum of the per-device distances
+- values stay in plausible ranges and skipped pages <= received pages
+
+    python -m app.stress --duration 30 --readers 8 --togglers 2 --feeders 2
+"""
+
+import argparse
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from openant.devices.common import DeviceType
+
+from app.model import LifecycleState, MetricsModel, MetricsSettingsModel
+from app.sim import SimulatedDevice, SimulatedMetrics
+
+MAX_VIOLATIONS = 20
+
+VALUE_FIELDS = set(MetricsModel.model_fields) - {"is_running", "seq"}
+
+
+class Violations:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.messages: List[str] = []
+
+    def add(self, message: str):
+        with self._lock:
+            self.count += 1
+            if len(self.messages) < MAX_VIOLATIONS:
+                self.messages.append(message)
+
+
+def check_snapshot(snapshot: MetricsModel, last_seq: int, violations: Violations):
+    if snapshot.seq < last_seq:
+        violations.add(f"seq went back from {last_seq} to {snapshot.seq}")
+
+    if not snapshot.is_running:
+        values = {k for k in VALUE_FIELDS if getattr(snapshot, k) is not None}
+        if values:
+            violations.add(f"stopped snapshot has values: {sorted(values)}")
+        return
+
+    by_device = snapshot.distance_by_device
+    if (snapshot.ma_distance is None) != (by_device is None):
+        violations.add(
+            f"distance {snapshot.ma_distance} does not match devices {by_device}"
+        )
+    elif by_device and abs(snapshot.ma_distance - sum(by_device.values())) > 1e-6:
+        violations.add(f"distance {snapshot.ma_distance} != sum of {by_device}")
+
+    if snapshot.power is not None and not 0 < snapshot.power < 3000:
+        violations.add(f"power out of range: {snapshot.power}")
+    if snapshot.heart_rate is not None and not 0 < snapshot.heart_rate < 250:
+        violations.add(f"heart rate out of range: {snapshot.heart_rate}")
+
+
+def run(
+    duration: float = 5.0,
+    readers: int = 4,
+    togglers: int = 2,
+    feeders: int = 2,
+    rate_hz: float = 50,
+    seed: int = 1,
+) -> Dict:
+    settings = MetricsSettingsModel(
+        age=30, speed_wheel_circumference_m=2.096, distance_wheel_circumference_m=2.096
+    )
+    metrics = SimulatedMetrics(metrics_settings=settings, rate_hz=rate_hz)
+    violations = Violations()
+    counts = {"reads": 0, "starts": 0, "stops": 0, "pages": 0}
+    counts_lock = threading.Lock()
+    done = threading.Event()
+
+    def count(name: str, n: int = 1):
+        with counts_lock:
+            counts[name] += n
+
+    def guarded(target):
+        def wrapper(*args):
+            try:
+                target(*args)
+            except Exception as e:
+                violations.add(f"{target.__name__} raised {e!r}")
+
+        return wrapper
+
+    @guarded
+    def reader():
+        last_seq = 0
+        n = 0
+        while not done.is_set():
+            snapshot = metrics.get_metrics()
+            check_snapshot(snapshot, last_seq, violations)
+            last_seq = snapshot.seq
+            stats = metrics.get_ingest_stats()
+            if stats.pages_skipped > stats.pages_received:
+                violations.add(f"more skipped than received pages: {stats}")
+            metrics.get_devices()
+            n += 1
+        count("reads", n)
+
+    @guarded
+    def toggler(index: int):
+        rng = random.Random(seed + index)
+        while not done.is_set():
+            if rng.random() < 0.5:
+                metrics.start()
+                count("starts")
+            else:
+                metrics.stop()
+                count("stops")
+            time.sleep(rng.uniform(0, 0.02))
+
+    @guarded
+    def feeder(index: int):
+        devices = [
+            SimulatedDevice(
+                3000 + 10 * index, DeviceType.BikeSpeed, "bike_speed", seed + index
+            ),
+            SimulatedDevice(
+                3001 + 10 * index, DeviceType.PowerMeter, "power", seed + index
+            ),
+        ]
+        started = time.monotonic()
+        n = 0
+        while not done.is_set():
+            elapsed = time.monotonic() - started
+            for dev in devices:
+                data = dev.tick(elapsed, 0.01)
+                metrics._on_device_page(dev, 0x10, dev.page_name, data)
+                n += 1
+            time.sleep(0.001)
+        count("pages", n)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=toggler, args=(i,)) for i in range(togglers)]
+    threads += [threading.Thread(target=feeder, args=(i,)) for i in range(feeders)]
+
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    done.set()
+    for thread in threads:
+        thread.join(timeout=10)
+        if thread.is_alive():
+            violations.add(f"{thread.name} did not finish")
+
+    metrics.stop()
+    if metrics.get_lifecycle_state() != LifecycleState.STOPPED:
+        violations.add(f"ended in state {metrics.get_lifecycle_state()}")
+    if metrics.get_metrics().is_running:
+        violations.add("still running after stop")
+
+    return {
+        "duration_s": round(time.monotonic() - started, 1),
+        "readers": readers,
+        "togglers": togglers,
+        "feeders": feeders,
+        **counts,
+        "violations": violations.count,
+        "violation_messages": violations.messages,
+        "passed": violations.count == 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AMWA concurrency stress test")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--togglers", type=int, default=2)
+    parser.add_argument("--feeders", type=int, default=2)
+    parser.add_argument("--rate-hz", type=float, default=50, help="sensor page rate")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # start/stop races log "already running" warnings by design
+    logging.getLogger("app.metrics").setLevel(logging.ERROR)
+    report = run(
+        args.duration,
+        args.readers,
+        args.togglers,
+        args.feeders,
+        args.rate_hz,
+        args.seed,
+    )
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+ERG control of an ANT+ FE-C smart trainer from the workout Timer.
+
+The controller looks lead_s ahead on the timer, so the command for the next
+interval goes out before the boundary and the trainer has ramped when the
+interval starts. A command is sent once; it is only repeated when the
+trainer did not confirm it through the command status page (FE-C page 71).
+"""
+
+import logging
+import threading
+from typing import Callable, Optional
+
+from openant.devices.fitness_equipment import CommandStatus, ResistenceMode
+
+from app.clock import SYSTEM_CLOCK, Clock
+from app.model import MetricsSettingsModel, TargetModel, TargetType
+from app.workout import Timer
+
+# ERG trainers need a few seconds to ramp to a new target
+DEFAULT_LEAD_SECONDS = 2.0
+CONFIRM_SECONDS = 2.0
+MAX_RETRIES = 3
+# picks up a trainer that connected and checks confirmations
+RECHECK_SECONDS = 1.0
+STOP_JOIN_TIMEOUT_SECONDS = 2
+
+
+class TrainerCommand:
+    """Target power in watts or basic resistance in percent."""
+
+    __slots__ = ("mode", "value")
+
+    def __init__(self, mode: ResistenceMode, value: float):
+        self.mode = mode
+        self.value = value
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, TrainerCommand)
+            and self.mode == other.mode
+            and self.value == other.value
+        )
+
+    def __repr__(self):
+        if self.mode == ResistenceMode.TargetPower:
+            return f"TrainerCommand({self.value} W)"
+        return f"TrainerCommand({self.value} %)"
+
+    def send(self, trainer):
+        if self.mode == ResistenceMode.TargetPower:
+            trainer.set_target_power(int(self.value))
+        else:
+            trainer.set_basic_resistance(self.value)
+
+    def confirmed_by(self, trainer) -> bool:
+        """The trainer reported the command in its last command status page."""
+        fe = trainer.data["fe"]
+        return (
+            trainer.command_status == CommandStatus.Pass
+            and fe.resistance_mode == self.mode
+            # 0.25 W and 0.5 % resolution on the wire
+            and abs(fe.resistance - self.value) < 1
+        )
+
+
+# free riding after the workout or in intervals without a trainer target
+RELEASE = TrainerCommand(ResistenceMode.Basic, 0)
+
+
+def command_for(
+    target: Optional[TargetModel], ftp: Optional[int]
+) -> Optional[TrainerCommand]:
+    """Middle of the target range, None for targets a trainer cannot hold."""
+    if target is None:
+        return None
+    middle = (target.low + target.high) / 2
+    if target.type == TargetType.POWER:
+        return TrainerCommand(ResistenceMode.TargetPower, min(round(middle), 4000))
+    if target.type == TargetType.FTP_PERCENT:
+        if not ftp:
+            return None
+        return TrainerCommand(
+            ResistenceMode.TargetPower, min(round(middle * ftp / 100), 4000)
+        )
+    if target.type == TargetType.RESISTANCE:
+        return TrainerCommand(ResistenceMode.Basic, min(round(middle * 2) / 2, 100))
+    return None
+
+
+class TrainerController:
+    """
+    Sends the interval targets of the Timer to the trainer returned by
+    trainer(), an openant FitnessEquipment or a simulated one.
+
+    The thread sleeps until the next lead-adjusted boundary and is woken by
+    wake() when the timer, the workout or the settings change.
+    """
+
+    def __init__(
+        self,
+        timer: Timer,
+        trainer: Callable[[], Optional[object]],
+        settings: Callable[[], MetricsSettingsModel] = MetricsSettingsModel,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        self._logger = logging.getLogger("app.trainer")
+        self._timer = timer
+        self._trainer = trainer
+        self._settings = settings
+        self._clock = clock
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._current = None  # trainer the last command went to
+        self._sent: Optional[TrainerCommand] = None
+        self._sent_at = 0.0
+        self._retries = 0
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="trainer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(STOP_JOIN_TIMEOUT_SECONDS)
+            if self._thread.is_alive():
+                self._logger.warning("Trainer thread did not stop")
+            self._thread = None
+
+    def wake(self):
+        """Re-plan now, after the timer, the workout or the settings changed."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                delay = self.poll()
+            except Exception:
+                self._logger.warning("Error in trainer control", exc_info=True)
+                delay = RECHECK_SECONDS
+            self._clock.wait(self._wake, delay)
+            self._wake.clear()
+
+    def poll(self) -> float:
+        """One control step, returns the seconds until the next one."""
+        trainer = self._trainer()
+        if trainer is None:
+            self._current, self._sent = None, None
+            return RECHECK_SECONDS
+        if trainer is not self._current:
+            # a new or reconnected trainer knows nothing of earlier commands
+            self._current, self._sent = trainer, None
+
+        settings = self._settings()
+        lead = settings.trainer_lead_s
+        lead = DEFAULT_LEAD_SECONDS if lead is None else lead
+        position = self._timer.position(ahead=lead)
+
+        delay = RECHECK_SECONDS
+        command = None
+        if position is not None:
+            command = command_for(position.interval.target, settings.ftp)
+            # wake up exactly lead seconds before the next boundary
+            delay = min(delay, position.interval.seconds - position.time_spent)
+        if command is None and self._sent is not None:
+            command = RELEASE
+
+        now = self._clock.monotonic()
+        if command is not None and command != self._sent:
+            self._send(trainer, command, now)
+            self._retries = 0
+        elif (
+            self._sent is not None
+            and now - self._sent_at >= CONFIRM_SECONDS
+            and self._retries < MAX_RETRIES
+            and not self._sent.confirmed_by(trainer)
+        ):
+            self._retries += 1
+            self._logger.info(
+                "Trainer did not confirm %s, retry %s", self._sent, self._retries
+            )
+            self._send(trainer, self._sent, now)
+        return max(delay, 0.0)
+
+    def _send(self, trainer, command: TrainerCommand, now: float):
+        self._sent, self._sent_at = command, now
+        self._logger.info("Sending %s to trainer %s", command, trainer.device_id)
+        try:
+            command.send(trainer)
+        except Exception:
+            self._logger.warning("Could not send trainer command", exc_info=True)
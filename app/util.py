@@ -1,10 +1,9 @@
-from collections import deque
-import time
 import threading
-
-
+from array import array
 from enum import Enum
 
+from app.clock import SYSTEM_CLOCK, Clock
+
 
 class MetricsKey(str, Enum):
     POWER = "power"
@@ -15,15 +14,16 @@ class MetricsKey(str, Enum):
 
 
 class TimedMap:
-    def __init__(self, ttl=15):
+    def __init__(self, ttl=15, clock: Clock = SYSTEM_CLOCK):
         self.ttl = ttl  # time-to-live in seconds
+        self.clock = clock
         self.store = {}
         self.lock = threading.Lock()  # lock for thread safety
 
     def set(self, key, value):
         if value is None or int(value) <= 0:
             return
-        expire_time = time.time() + self.ttl
+        expire_time = self.clock.monotonic() + self.ttl
         with self.lock:
             self.store[key] = (value, expire_time)
 
@@ -31,7 +31,7 @@ class TimedMap:
         with self.lock:
             if key in self.store:
                 value, expire_time = self.store[key]
-                if time.time() < expire_time:
+                if self.clock.monotonic() < expire_time:
                     return value
                 else:
                     # Expired, remove entry
@@ -39,7 +39,7 @@ class TimedMap:
         return None
 
     def clear_expired(self):
-        now = time.time()
+        now = self.clock.monotonic()
         with self.lock:
             keys_to_delete = [k for k, (_, t) in self.store.items() if t <= now]
             for k in keys_to_delete:
@@ -50,108 +50,201 @@ class TimedMap:
             return str({k: v[0] for k, v in self.store.items()})
 
 
+class _SampleRing:
+    """
+    Fixed capacity ring of (expire time, value) pairs in two float arrays,
+    with a running sum so the average is O(1). When full the oldest sample
+    is overwritten.
+    """
+
+    __slots__ = ("expires", "values", "head", "size", "total")
+
+    def __init__(self, capacity: int):
+        self.expires = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.head = 0
+        self.size = 0
+        self.total = 0.0
+
+    def append(self, expire_time: float, value: float):
+        capacity = len(self.values)
+        if self.size == capacity:
+            self.popleft()
+        index = (self.head + self.size) % capacity
+        self.expires[index] = expire_time
+        self.values[index] = value
+        self.size += 1
+        self.total += value
+
+    def popleft(self):
+        self.total -= self.values[self.head]
+        self.head = (self.head + 1) % len(self.values)
+        self.size -= 1
+        if self.size == 0:
+            self.total = 0.0  # no float drift over long runs
+
+    def expire(self, now: float):
+        while self.size and self.expires[self.head] <= now:
+            self.popleft()
+
+    def to_list(self):
+        capacity = len(self.values)
+        return [self.values[(self.head + i) % capacity] for i in range(self.size)]
+
+
 class TimedMovingAverage:
-    def __init__(self, ttl=45):
+    def __init__(self, ttl=45, clock: Clock = SYSTEM_CLOCK, max_samples: int = 1024):
         self.ttl = ttl
+        self.clock = clock
+        # per key, caps memory when a sensor floods pages
+        self.max_samples = max_samples
         self.store = {}
         self.lock = threading.Lock()
 
     def add(self, key, value):
         if value is None or int(value) <= 0:
             return
-        now = time.time()
+        now = self.clock.monotonic()
         expire_time = now + self.ttl
         with self.lock:
             if key not in self.store:
-                self.store[key] = deque()
-            self.store[key].append((expire_time, value))
+                self.store[key] = _SampleRing(self.max_samples)
+            self.store[key].append(expire_time, value)
             self._cleanup_key(key, now)
 
     def _cleanup_key(self, key, current_time=None):
         if current_time is None:
-            current_time = time.time()
-        dq = self.store.get(key)
-        if dq:
-            while dq and dq[0][0] <= current_time:
-                dq.popleft()
-            if not dq:
+            current_time = self.clock.monotonic()
+        ring = self.store.get(key)
+        if ring:
+            ring.expire(current_time)
+            if not ring.size:
                 del self.store[key]
 
     def _cleanup(self):
-        now = time.time()
+        now = self.clock.monotonic()
         with self.lock:
             for key in list(self.store.keys()):
                 self._cleanup_key(key, now)
 
     def average(self, key):
-        self._cleanup_key(key)
         with self.lock:
-            dq = self.store.get(key)
-            if not dq:
+            self._cleanup_key(key)
+            ring = self.store.get(key)
+            if not ring:
                 return None
-            return sum(v for _, v in dq) / len(dq)
+            return ring.total / ring.size
 
     def __repr__(self):
         self._cleanup()
         with self.lock:
-            return {k: [v for _, v in dq] for k, dq in self.store.items()}
+            return str({k: ring.to_list() for k, ring in self.store.items()})
 
 
-class CumulativeSumMap:
-    def __init__(self, threshold: int = 100):
-        self.store = {}
-        self.offset = {}
-        self.lock = threading.Lock()
-        self.threshold = threshold
+class _WheelState:
+    __slots__ = ("last_count", "last_time", "distance")
 
-    def add(self, key, value):
-        if value is None or int(value) <= 0:
-            return
+    def __init__(self, count: int, now: float):
+        self.last_count = count
+        self.last_time = now
+        self.distance = 0.0
 
-        with self.lock:
-            if key not in self.store:
-                self.store[key] = [value]
-                # keep first value as offset to simulate a reste to zero
-                if value <= self.threshold:
-                    self.offset[key] = 0
-                else:
-                    self.offset[key] = value
-                return
 
-            last_value = self.store[key][-1]
+class DistanceAccumulator:
+    """
+    Accumulates distance from raw 16-bit wheel revolution counters.
 
-            if value < last_value:
-                # append if smaller sensor was reset
-                self.store[key].append(value)
-            elif value > last_value:
-                # replace last value if greater
-                self.store[key][-1] = value
+    State is constant per device: the last raw counter value, when it was seen
+    and the distance covered so far. Counter rollover is handled with modulo
+    arithmetic. A delta that is not plausible for the elapsed time is treated
+    as a sensor reset, in which case the new counter value is the number of
+    revolutions since the reset.
 
-    def sum(self, key, reset_with_offset=True):
-        with self.lock:
-            values = self.store.get(key)
-            offset = self.offset.get(key)
-            if not values:
-                return None
+    At most max_devices are tracked, the longest silent one is forgotten
+    first. Its distance stays in the total.
+    """
 
-            if reset_with_offset:
-                return sum(values) - offset
+    ROLLOVER = 0x10000
 
-            return sum(values)
+    def __init__(
+        self,
+        max_revolutions_per_second: float = 100.0,
+        clock: Clock = SYSTEM_CLOCK,
+        max_devices: int = 32,
+    ):
+        self.max_revolutions_per_second = max_revolutions_per_second
+        self.clock = clock
+        self.max_devices = max_devices
+        self.store = {}
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, device_id, revolution_count, wheel_circumference_m) -> float:
+        """
+        Feed the raw revolution counter of a device.
+        Returns the distance in meters added by this update.
+        """
+        if revolution_count is None or wheel_circumference_m is None:
+            return 0.0
+        if wheel_circumference_m <= 0:
+            return 0.0
+
+        count = int(revolution_count) % self.ROLLOVER
+        now = self.clock.monotonic()
+        with self.lock:
+            state = self.store.get(device_id)
+            if state is None:
+                # first sample is only a baseline, the counter value is not a distance
+                if len(self.store) >= self.max_devices:
+                    oldest = min(self.store, key=lambda k: self.store[k].last_time)
+                    del self.store[oldest]
+                self.store[device_id] = _WheelState(count, now)
+                return 0.0
+
+            revolutions = (count - state.last_count) % self.ROLLOVER
+            elapsed = max(now - state.last_time, 1.0)
+            if revolutions > self.max_revolutions_per_second * elapsed:
+                # sensor was reset (e.g. battery change), counting restarted at zero
+                revolutions = count
+                if revolutions > self.max_revolutions_per_second * elapsed:
+                    revolutions = 0
+
+            state.last_count = count
+            state.last_time = now
+
+            distance = revolutions * wheel_circumference_m
+            state.distance += distance
+            self.total += distance
+            return distance
+
+    def sum(self, device_id=None):
+        """Total distance in meters, for all devices or a single device."""
+        with self.lock:
+            if device_id is None:
+                return self.total if self.store else None
+            state = self.store.get(device_id)
+            return state.distance if state else None
+
+    def snapshot(self):
+        """(sum(), device_totals()) read under one lock."""
+        with self.lock:
+            totals = {k: state.distance for k, state in self.store.items()}
+            return (self.total if self.store else None), totals
 
-    def get_values(self, key):
+    def device_totals(self) -> dict:
         with self.lock:
-            return list(self.store.get(key, []))
+            return {k: state.distance for k, state in self.store.items()}
 
-    def clear(self, key=None):
+    def clear(self, device_id=None):
         with self.lock:
-            if key is None:
+            if device_id is None:
                 self.store.clear()
-                self.offset.clear()
+                self.total = 0.0
             else:
-                self.store.pop(key, None)
-                self.offset.pop(key, None)
+                state = self.store.pop(device_id, None)
+                if state:
+                    self.total -= state.distance
 
     def __repr__(self):
         with self.lock:
-            return str(self.store)
+            return str({k: state.distance for k, state in self.store.items()})
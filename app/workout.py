@@ -1,17 +1,47 @@
-import time
-from typing import List, Optional
-from app.model import IntervalModel, IntervalProgressModel
+import threading
+from typing import Callable, List, Optional
+
+from app.clock import SYSTEM_CLOCK, Clock
+from app.model import (
+    AggregateModel,
+    ComplianceModel,
+    IntervalModel,
+    IntervalProgressModel,
+    LapModel,
+    MetricsSettingsModel,
+    TargetModel,
+    TargetType,
+)
+from app.util import MetricsKey
+
+
+class IntervalPosition:
+    """Where a running timer is, identifies an interval of a single run."""
+
+    __slots__ = ("run", "round_number", "index", "interval", "time_spent")
+
+    def __init__(self, run, round_number, index, interval, time_spent):
+        self.run = run
+        self.round_number = round_number
+        self.index = index
+        self.interval = interval
+        self.time_spent = time_spent
+
+    def key(self):
+        return (self.run, self.round_number, self.index)
 
 
 class Timer:
-    def __init__(self, intervals: List[IntervalModel]):
+    def __init__(self, intervals: List[IntervalModel], clock: Clock = SYSTEM_CLOCK):
         """
         Initialize the timer with a list of intervals.
         """
         self._intervals = intervals
+        self._clock = clock
         self._start_time = None
         self._rounds_completed = 0  # total completed rounds
         self._is_running = False
+        self._run = 0  # incremented on every start
 
     def set_intervak(self, intervals: List[IntervalModel]):
         self._intervals = intervals
@@ -21,15 +51,53 @@ class Timer:
 
     def start(self):
         """Start the timer."""
-        self._start_time = time.time()
+        self._start_time = self._clock.monotonic()
         self._is_running = True
         self._rounds_completed = 0
+        self._run += 1
 
     def stop(self):
         """Stop the timer."""
         self._is_running = False
         self._start_time = None
 
+    def position(self, ahead: float = 0.0) -> Optional[IntervalPosition]:
+        """
+        Return the current interval position without building a progress model,
+        None when the timer is not running or has no intervals.
+        """
+        start_time = self._start_time
+        intervals = self._intervals
+        if start_time is None or not intervals:
+            return None
+        return self._position(intervals, self._clock.monotonic() - start_time + ahead)
+
+    def _position(
+        self, intervals: List[IntervalModel], total_elapsed: float
+    ) -> Optional[IntervalPosition]:
+        interval_duration = sum(interval.seconds for interval in intervals)
+        if interval_duration <= 0:
+            return None
+
+        # Determine how many full rounds have passed
+        rounds_completed = int(total_elapsed // interval_duration)
+
+        # Determine time within current round
+        time_in_round = total_elapsed % interval_duration
+
+        cumulative = 0
+        for index, interval in enumerate(intervals):
+            if time_in_round < cumulative + interval.seconds:
+                return IntervalPosition(
+                    self._run,
+                    rounds_completed + 1,  # human-readable 1-based
+                    index,
+                    interval,
+                    time_in_round - cumulative,
+                )
+            cumulative += interval.seconds
+        return None
+
     def current_interval(self) -> Optional[IntervalProgressModel]:
         """
         Return an IntervalProgressModel for the current interval.
@@ -41,7 +109,7 @@ class Timer:
                 is_running=self._is_running,
             )
 
-        total_elapsed = time.time() - self._start_time
+        total_elapsed = self._clock.monotonic() - self._start_time
 
         if len(self._intervals) == 0:
             return IntervalProgressModel(
@@ -51,29 +119,17 @@ class Timer:
                 is_running=self._is_running,
             )
 
-        interval_duration = sum(interval.seconds for interval in self._intervals)
-
-        # Determine how many full rounds have passed
-        rounds_completed = int(total_elapsed // interval_duration)
-        self._rounds_completed = rounds_completed + 1  # human-readable 1-based
-
-        # Determine time within current round
-        time_in_round = total_elapsed % interval_duration
-
-        cumulative = 0
-        for interval in self._intervals:
-            if time_in_round < cumulative + interval.seconds:
-                time_in_interval = time_in_round - cumulative
-                time_remaining = interval.seconds - time_in_interval
-                return IntervalProgressModel(
-                    interval=interval,
-                    time_spent=time_in_interval,
-                    time_remaining=time_remaining,
-                    total_time_spent=total_elapsed,
-                    round_number=self._rounds_completed,  # include round info
-                    is_running=self._is_running,
-                )
-            cumulative += interval.seconds
+        position = self._position(self._intervals, total_elapsed)
+        if position is not None:
+            self._rounds_completed = position.round_number
+            return IntervalProgressModel(
+                interval=position.interval,
+                time_spent=position.time_spent,
+                time_remaining=position.interval.seconds - position.time_spent,
+                total_time_spent=total_elapsed,
+                round_number=position.round_number,  # include round info
+                is_running=self._is_running,
+            )
 
         # fallback, should never reach here
         return IntervalProgressModel(
@@ -81,3 +137,261 @@ class Timer:
             total_time_spent=total_elapsed,
             is_running=self._is_running,
         )
+
+
+TARGET_METRICS = {
+    TargetType.POWER: MetricsKey.POWER,
+    TargetType.FTP_PERCENT: MetricsKey.POWER,
+    TargetType.HEART_RATE: MetricsKey.HEART_RATE,
+    TargetType.CADENCE: MetricsKey.CADENCE,
+}
+
+
+class IntervalCompliance:
+    """
+    Incremental compliance of one interval against its target range.
+    Time is only counted while the target metric delivers samples, a gap
+    longer than max_gap seconds is treated as a dropout.
+    """
+
+    __slots__ = (
+        "low",
+        "high",
+        "actual",
+        "last_time",
+        "time_in_target",
+        "time_with_data",
+        "deviation_sum",
+    )
+
+    def __init__(self, low: float, high: float):
+        self.low = low
+        self.high = high
+        self.actual = None
+        self.last_time = None
+        self.time_in_target = 0.0
+        self.time_with_data = 0.0
+        self.deviation_sum = 0.0
+
+    def add(self, value: float, now: float, max_gap: float = 5.0):
+        if self.last_time is not None and self.actual is not None:
+            dt = now - self.last_time
+            if 0 < dt <= max_gap:
+                # the previous sample holds until this one arrives
+                self.time_with_data += dt
+                deviation = self.deviation(self.actual)
+                if deviation == 0:
+                    self.time_in_target += dt
+                self.deviation_sum += deviation * dt
+        self.actual = value
+        self.last_time = now
+
+    def deviation(self, value: float) -> float:
+        if value < self.low:
+            return self.low - value
+        if value > self.high:
+            return value - self.high
+        return 0.0
+
+    def to_model(self) -> ComplianceModel:
+        has_data = self.time_with_data > 0
+        return ComplianceModel(
+            target_low=self.low,
+            target_high=self.high,
+            actual=self.actual,
+            time_in_target=self.time_in_target,
+            time_with_data=self.time_with_data,
+            average_deviation=(
+                self.deviation_sum / self.time_with_data if has_data else None
+            ),
+            score=self.time_in_target / self.time_with_data * 100 if has_data else None,
+        )
+
+
+class Aggregate:
+    """Count, sum, min and max of a metric, O(1) per sample."""
+
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def to_model(self) -> AggregateModel:
+        return AggregateModel(
+            count=self.count,
+            avg=self.total / self.count if self.count else None,
+            min=self.min,
+            max=self.max,
+        )
+
+
+LAP_METRICS = (
+    MetricsKey.POWER,
+    MetricsKey.HEART_RATE,
+    MetricsKey.CADENCE,
+    MetricsKey.SPEED,
+)
+
+
+class Lap:
+    """The open lap of the current interval."""
+
+    __slots__ = (
+        "position",
+        "aggregates",
+        "distance_start",
+        "distance_end",
+        "compliance",
+    )
+
+    def __init__(
+        self,
+        position: IntervalPosition,
+        distance_start: Optional[float],
+        compliance: Optional[IntervalCompliance],
+    ):
+        self.position = position
+        self.aggregates = {key: Aggregate() for key in LAP_METRICS}
+        self.distance_start = distance_start
+        self.distance_end = distance_start
+        self.compliance = compliance
+
+    def add(self, key: MetricsKey, value: float, now: float):
+        if key == MetricsKey.DISTANCE:
+            if self.distance_start is None:
+                self.distance_start = value
+            self.distance_end = value
+            return
+
+        aggregate = self.aggregates.get(key)
+        if aggregate is not None:
+            aggregate.add(value)
+
+        if self.compliance is not None:
+            target: TargetModel = self.position.interval.target
+            if TARGET_METRICS[target.type] == key:
+                self.compliance.add(value, now)
+
+    def freeze(self, lap_number: int, completed: bool) -> LapModel:
+        position = self.position
+        distance = None
+        if self.distance_start is not None and self.distance_end is not None:
+            distance = self.distance_end - self.distance_start
+        return LapModel(
+            lap_number=lap_number,
+            round_number=position.round_number,
+            interval_index=position.index,
+            name=position.interval.name,
+            duration=position.interval.seconds if completed else position.time_spent,
+            distance=distance,
+            power=self.aggregates[MetricsKey.POWER].to_model(),
+            heart_rate=self.aggregates[MetricsKey.HEART_RATE].to_model(),
+            cadence=self.aggregates[MetricsKey.CADENCE].to_model(),
+            speed=self.aggregates[MetricsKey.SPEED].to_model(),
+            compliance=self.compliance.to_model() if self.compliance else None,
+        )
+
+
+class WorkoutTracker:
+    """
+    Joins the current Timer interval with incoming metric samples at ingest
+    time, so the workout stream carries target vs. actual without each
+    client redoing the work.
+
+    Every interval transition closes the open lap and freezes it into the
+    list of finished laps.
+    """
+
+    def __init__(
+        self,
+        timer: Timer,
+        settings: Callable[[], MetricsSettingsModel] = MetricsSettingsModel,
+        max_laps: int = 500,
+    ):
+        self._timer = timer
+        self._settings = settings
+        self._max_laps = max_laps
+        self._lock = threading.Lock()
+        self._run = None
+        self._lap: Optional[Lap] = None
+        self._laps: List[LapModel] = []
+        # keeps counting after the oldest laps are dropped at max_laps
+        self._lap_count = 0
+        self._distance: Optional[float] = None
+
+    def on_sample(self, key: MetricsKey, value: float, now: float):
+        position = self._timer.position()
+        with self._lock:
+            if key == MetricsKey.DISTANCE:
+                self._distance = value
+            lap = self._current_lap(position)
+            if lap is not None:
+                lap.add(key, value, now)
+
+    def _current_lap(self, position: Optional[IntervalPosition]) -> Optional[Lap]:
+        """Returns the open lap for the position, called with lock held."""
+        lap = self._lap
+        if lap is not None:
+            if position is not None and position.key() == lap.position.key():
+                lap.position = position
+                return lap
+            # interval changed or timer stopped
+            completed = position is not None and position.run == lap.position.run
+            self._freeze(lap, completed)
+            self._lap = None
+
+        if position is None:
+            return None
+
+        if position.run != self._run:
+            # a new timer run starts with an empty lap list
+            self._run = position.run
+            self._laps = []
+            self._lap_count = 0
+
+        compliance = self._new_compliance(position.interval.target)
+        self._lap = Lap(position, self._distance, compliance)
+        return self._lap
+
+    def _freeze(self, lap: Lap, completed: bool):
+        self._lap_count += 1
+        self._laps.append(lap.freeze(self._lap_count, completed))
+        if len(self._laps) > self._max_laps:
+            del self._laps[0]
+
+    def _new_compliance(self, target: Optional[TargetModel]):
+        if target is None or target.type not in TARGET_METRICS:
+            return None
+        low, high = target.low, target.high
+        if target.type == TargetType.FTP_PERCENT:
+            ftp = self._settings().ftp
+            if not ftp:
+                return None
+            low, high = low * ftp / 100, high * ftp / 100
+        return IntervalCompliance(low, high)
+
+    def laps(self) -> List[LapModel]:
+        position = self._timer.position()
+        with self._lock:
+            self._current_lap(position)
+            return list(self._laps)
+
+    def progress(self) -> IntervalProgressModel:
+        progress = self._timer.current_interval()
+        position = self._timer.position()
+        with self._lock:
+            lap = self._current_lap(position)
+            if lap is not None and lap.compliance is not None:
+                progress.compliance = lap.compliance.to_model()
+        return progress
@@ -4,6 +4,13 @@ import { API } from '../config.js';
 
 const tabId = Math.random().toString(36).slice(2);
 
+// A new EventSource does not send Last-Event-ID, pass it so the server
+// replays the frames missed while reconnecting
+function streamUrl(endpoint, lastEventId) {
+  const url = API.baseUrl + endpoint;
+  return lastEventId ? `${url}?last_event_id=${encodeURIComponent(lastEventId)}` : url;
+}
+
 // Track last second we beeped
 let lastBeepSecond = null;
 
@@ -64,6 +71,7 @@ const metricsConnected = ref(false);
 const metricsLastUpdated = ref(null);
 let metricsSource = null;
 let metricsChannel = null;
+let metricsLastEventId = null;
 
 function initMetricsStream() {
   if (metricsSource) return;
@@ -75,12 +83,15 @@ function initMetricsStream() {
     metricsConnected.value = true;
   };
 
-  metricsSource = new EventSource(API.baseUrl + API.endpoints.metricsStream);
+  metricsSource = new EventSource(
+    streamUrl(API.endpoints.metricsStream, metricsLastEventId)
+  );
   metricsSource.onopen = () => (metricsConnected.value = true);
 
   metricsSource.onmessage = (event) => {
     try {
       const data = JSON.parse(event.data);
+      if (event.lastEventId) metricsLastEventId = event.lastEventId;
       Object.assign(metrics, data);
       metricsLastUpdated.value = new Date();
       metricsConnected.value = true;
@@ -106,6 +117,7 @@ const devicesConnected = ref(false);
 const devicesLastUpdated = ref(null);
 let devicesSource = null;
 let devicesChannel = null;
+let devicesLastEventId = null;
 
 function initDevicesStream() {
   if (devicesSource) return;
@@ -119,13 +131,16 @@ function initDevicesStream() {
     }
   };
 
-  devicesSource = new EventSource(API.baseUrl + API.endpoints.devicesStream);
+  devicesSource = new EventSource(
+    streamUrl(API.endpoints.devicesStream, devicesLastEventId)
+  );
   devicesSource.onopen = () => (devicesConnected.value = true);
 
   devicesSource.onmessage = (event) => {
     try {
       const data = JSON.parse(event.data);
       if (!Array.isArray(data)) return;
+      if (event.lastEventId) devicesLastEventId = event.lastEventId;
       devices.value = data;
       devicesLastUpdated.value = new Date();
       devicesConnected.value = true;
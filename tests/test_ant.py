@@ -0,0 +1,229 @@
+# tests/test_ant.py
+import logging
+import time
+from types import SimpleNamespace
+
+from openant.devices.bike_speed_cadence import BikeSpeedData
+from openant.devices.power_meter import PowerData
+
+import app.ant
+from app import stress
+from app.ant import STOP_JOIN_TIMEOUT_SECONDS, Metrics
+from app.clock import ManualClock
+from app.model import LifecycleState, MetricsSettingsModel
+from app.sim import SimulatedMetrics
+
+
+def _speed_page(event_time, revolutions):
+    data = BikeSpeedData()
+    data.bike_speed_event_time = [0.0, event_time]
+    data.cumulative_speed_revolution = [0, revolutions]
+    return data
+
+
+# -------------------------
+# Redundant page detection
+# -------------------------
+def test_unchanged_pages_are_skipped():
+    metrics = Metrics(MetricsSettingsModel(distance_wheel_circumference_m=2.0))
+    dev = SimpleNamespace(device_id=7)
+
+    metrics._on_device_page(dev, 0, "bike_speed", _speed_page(1.0, 10))
+    metrics._on_device_page(dev, 0, "bike_speed", _speed_page(1.0, 10))
+    metrics._on_device_page(dev, 0, "bike_speed", _speed_page(1.0, 10))
+    metrics._on_device_page(dev, 0, "bike_speed", _speed_page(2.0, 12))
+
+    stats = metrics.get_ingest_stats()
+    assert stats.pages_received == 4
+    assert stats.pages_skipped == 2
+    assert stats.skip_ratio == 0.5
+    assert metrics.distance.sum(7) == 4.0
+
+
+def test_power_pages_use_event_count():
+    metrics = Metrics()
+    dev = SimpleNamespace(device_id=3, _power_update_event_count=[0, 1])
+    data = PowerData(instantaneous_power=200)
+
+    metrics._on_device_page(dev, 0x10, "power", data)
+    metrics._on_device_page(dev, 0x10, "power", data)
+    dev._power_update_event_count = [1, 2]
+    metrics._on_device_page(dev, 0x10, "power", data)
+
+    assert metrics.get_ingest_stats().pages_skipped == 1
+
+    # without an event count every page is processed
+    dev = SimpleNamespace(device_id=4)
+    metrics._on_device_page(dev, 0x10, "power", data)
+    metrics._on_device_page(dev, 0x10, "power", data)
+    assert metrics.get_ingest_stats().pages_skipped == 1
+
+
+# -------------------------
+# Snapshot sequence
+# -------------------------
+def test_seq_advances_only_for_processed_pages():
+    metrics = Metrics()
+    published = []
+    metrics.add_update_listener(published.append)
+    dev = SimpleNamespace(device_id=3, _power_update_event_count=[0, 1])
+    data = PowerData(instantaneous_power=200)
+
+    metrics._on_device_page(dev, 0x10, "power", data)
+    metrics._on_device_page(dev, 0x10, "power", data)
+
+    assert published == [1]
+    assert metrics.get_metrics().seq == 1
+
+
+# -------------------------
+# Settings hot-swap
+# -------------------------
+def test_settings_change_keeps_accumulated_data():
+    metrics = Metrics(MetricsSettingsModel(distance_wheel_circumference_m=2.0))
+    metrics._lifecycle = LifecycleState.RUNNING
+    dev = SimpleNamespace(device_id=7)
+
+    metrics._on_device_page(dev, 0, "bike_speed", _speed_page(1.0, 10))
+    metrics._on_device_page(dev, 0, "bike_speed", _speed_page(2.0, 12))
+    filter_map = metrics.filter_map
+    metrics.set_metrics_settings(
+        MetricsSettingsModel(distance_wheel_circumference_m=1.0, age=40)
+    )
+    metrics._on_device_page(dev, 0, "bike_speed", _speed_page(3.0, 14))
+
+    assert metrics.distance.sum(7) == 6.0
+    assert metrics.filter_map is filter_map  # filters unchanged
+    assert metrics.get_ingest_stats().pages_received == 3
+
+
+def test_device_filter_change_only_touches_affected_channels(monkeypatch):
+    created, closed = [], []
+
+    def fake_auto_create_device(node, device_id, device_type, trans_type):
+        created.append(device_id)
+        return SimpleNamespace(
+            device_id=device_id,
+            device_type=device_type,
+            name="x",
+            close_channel=lambda: closed.append(device_id),
+        )
+
+    monkeypatch.setattr(app.ant, "auto_create_device", fake_auto_create_device)
+
+    metrics = Metrics(MetricsSettingsModel(device_ids=[1]))
+    metrics._lifecycle = LifecycleState.RUNNING
+    metrics.scanner = SimpleNamespace(found=set())
+    for device_tuple in ((1, 120, 1), (2, 11, 5), (3, 121, 1)):
+        metrics.scanner.found.add(device_tuple)
+        metrics._scanner_on_found(device_tuple)
+    assert created == [1]
+
+    metrics.set_metrics_settings(MetricsSettingsModel(device_ids=[1, 2]))
+    assert created == [1, 2]
+    assert closed == []
+
+    metrics.set_metrics_settings(MetricsSettingsModel(device_ids=[2]))
+    assert closed == [1]
+    assert sorted(d.device_id for d in metrics.get_devices()) == [2]
+
+    metrics.set_metrics_settings(MetricsSettingsModel())
+    assert created == [1, 2, 3]
+    # the closed device was handed back to the scanner, which reports it again
+    assert (1, 120, 1) not in metrics.scanner.found
+    metrics._scanner_on_found((1, 120, 1))
+    assert created == [1, 2, 3, 1]
+
+
+# -------------------------
+# Lifecycle
+# -------------------------
+def test_restart_never_shows_pages_from_before():
+    clock = ManualClock()
+    metrics = SimulatedMetrics(rate_hz=1, clock=clock)
+    dev = SimpleNamespace(device_id=3)
+
+    metrics.start()
+    assert metrics.get_lifecycle_state() == LifecycleState.RUNNING
+    metrics.fast_forward(5)
+    assert metrics.get_metrics().power is not None
+
+    metrics.stop()
+    assert metrics.get_lifecycle_state() == LifecycleState.STOPPED
+    # a late page of the node thread after stop
+    metrics._on_device_page(dev, 0x10, "power", PowerData(instantaneous_power=999))
+    assert metrics.get_metrics().is_running is False
+
+    metrics.start()
+    assert metrics.get_metrics().power is None
+    assert metrics.get_ingest_stats().pages_received == 0
+    metrics.stop()
+
+
+def test_stop_returns_promptly():
+    # the node thread waits 10 s for the next page, longer than the join
+    # timeout, only the stop event ends it within that
+    metrics = SimulatedMetrics(rate_hz=0.1)
+    metrics.start()
+    thread = metrics._node_thread
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    metrics.stop()
+
+    assert not thread.is_alive()
+    assert time.monotonic() - started < STOP_JOIN_TIMEOUT_SECONDS
+    assert metrics.get_lifecycle_state() == LifecycleState.STOPPED
+
+
+def test_failed_node_rebuild_backs_off_instead_of_starting_stale_node(monkeypatch):
+    # the stick fails, is gone for three rebuilds and comes back
+    plan = ["fails", "gone", "gone", "gone", "works"]
+    nodes = []
+
+    class FakeNode:
+        max_channels = 8
+
+        def __init__(self):
+            outcome = plan.pop(0)
+            if outcome == "gone":
+                raise OSError("No ANT devices available")
+            self.fails = outcome == "fails"
+            self.starts = 0
+            nodes.append(self)
+
+        def set_network_key(self, network, key):
+            pass
+
+        def start(self):
+            self.starts += 1
+            if self.fails:
+                raise OSError("USB stick unplugged")
+
+        def close_all(self):
+            return []
+
+        def stop(self):
+            pass
+
+    monkeypatch.setattr(app.ant, "ChannelNode", FakeNode)
+    monkeypatch.setattr(app.ant, "Scanner", lambda node, **_: SimpleNamespace())
+    metrics = Metrics(clock=ManualClock())
+    metrics._create_node()
+    metrics._lifecycle = LifecycleState.RUNNING
+
+    metrics._run_node()  # returns when the last node returns from start
+
+    assert [node.starts for node in nodes] == [1, 1]  # stale node not restarted
+    assert metrics._backoff.attempts == 4  # grew over the failed rebuilds
+
+
+def test_stress_concurrent_lifecycle_and_ingest():
+    logging.getLogger("app.metrics").setLevel(logging.ERROR)
+    try:
+        report = stress.run(duration=1.0, readers=3, togglers=2, feeders=2)
+    finally:
+        logging.getLogger("app.metrics").setLevel(logging.NOTSET)
+
+    assert report["passed"], report["violation_messages"]
+    assert report["starts"] > 0 and report["stops"] > 0
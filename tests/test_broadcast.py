@@ -0,0 +1,128 @@
+# tests/test_broadcast.py
+from types import SimpleNamespace
+
+from openant.devices.bike_speed_cadence import BikeSpeedData
+from openant.devices.power_meter import PowerData
+
+from app.ant import Metrics
+from app.broadcast import SAMPLE_SIZE, SampleBroadcaster, SampleReader
+from app.clock import ManualClock
+from app.model import MetricsSettingsModel
+from app.util import MetricsKey
+
+
+def _speed_page(event_time, revolutions):
+    data = BikeSpeedData()
+    data.bike_speed_event_time = [0.0, event_time]
+    data.cumulative_speed_revolution = [0, revolutions]
+    return data
+
+
+# -------------------------
+# Unix datagram socket
+# -------------------------
+def test_samples_roundtrip_over_unix_socket(tmp_path):
+    path = str(tmp_path / "samples.sock")
+    reader = SampleReader(unix_path=path)
+    reader.settimeout(1)
+    broadcaster = SampleBroadcaster(unix_path=path)
+    try:
+        broadcaster.send(MetricsKey.POWER, 54321, 1_700_000_000.25, 250)
+        broadcaster.send(MetricsKey.HEART_RATE, 7, 1_700_000_001.5, 142)
+
+        assert reader.read()
+        assert reader.metric == MetricsKey.POWER
+        assert reader.device_id == 54321
+        assert reader.timestamp == 1_700_000_000.25
+        assert reader.value == 250
+
+        assert reader.read()
+        assert (reader.metric, reader.device_id, reader.value) == (
+            MetricsKey.HEART_RATE,
+            7,
+            142,
+        )
+    finally:
+        broadcaster.close()
+        reader.close()
+
+
+def test_send_without_consumer_is_dropped(tmp_path):
+    broadcaster = SampleBroadcaster(unix_path=str(tmp_path / "nobody.sock"))
+    broadcaster.send(MetricsKey.POWER, 1, 0.0, 100)
+    broadcaster.close()
+
+    assert broadcaster.sent == 0
+    assert broadcaster.dropped == 1
+
+
+def test_reader_skips_foreign_datagrams(tmp_path):
+    import socket
+
+    path = str(tmp_path / "samples.sock")
+    reader = SampleReader(unix_path=path)
+    reader.settimeout(1)
+    sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sender.sendto(b"hello", path)
+        sender.sendto(bytes([9]) + bytes(SAMPLE_SIZE - 1), path)
+        assert not reader.read()
+    finally:
+        sender.close()
+        reader.close()
+
+
+# -------------------------
+# Metrics integration
+# -------------------------
+def test_metrics_broadcasts_ingested_samples(tmp_path):
+    path = str(tmp_path / "samples.sock")
+    reader = SampleReader(unix_path=path)
+    reader.settimeout(1)
+    clock = ManualClock()
+    metrics = Metrics(clock=clock, broadcaster=SampleBroadcaster(unix_path=path))
+    try:
+        dev = SimpleNamespace(device_id=321)
+        metrics._on_device_page(dev, 0x10, "power", PowerData(instantaneous_power=180))
+
+        assert reader.read()
+        assert reader.metric == MetricsKey.POWER
+        assert reader.device_id == 321
+        assert reader.value == 180
+        assert reader.timestamp == clock.now().timestamp()
+    finally:
+        metrics.broadcaster.close()
+        reader.close()
+
+
+def test_distance_of_two_speed_sensors_is_sent_as_total(tmp_path):
+    path = str(tmp_path / "samples.sock")
+    reader = SampleReader(unix_path=path)
+    reader.settimeout(1)
+    metrics = Metrics(
+        MetricsSettingsModel(distance_wheel_circumference_m=2.0),
+        broadcaster=SampleBroadcaster(unix_path=path),
+    )
+    front, rear = SimpleNamespace(device_id=7), SimpleNamespace(device_id=8)
+    try:
+        for dev, event_time, revolutions in (
+            (front, 1.0, 10),
+            (rear, 1.0, 50),
+            (front, 2.0, 12),
+            (rear, 2.0, 53),
+        ):
+            metrics._on_device_page(
+                dev, 0, "bike_speed", _speed_page(event_time, revolutions)
+            )
+
+        samples = []
+        while len(samples) < 4 and reader.read():
+            if reader.metric == MetricsKey.DISTANCE:
+                samples.append((reader.device_id, reader.value))
+
+        assert [device_id for device_id, _ in samples] == [0, 0, 0, 0]
+        assert samples[-1][1] == metrics.distance.sum() == 10.0
+        assert metrics.distance.sum(7) == 4.0
+    finally:
+        metrics.broadcaster.close()
+        reader.close()
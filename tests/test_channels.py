@@ -0,0 +1,168 @@
+# tests/test_channels.py
+import collections
+import queue
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from openant.base.message import Message
+
+from app.channels import Backoff, ChannelManager, ChannelNode
+from app.clock import ManualClock
+
+
+def open_device(manager, device_id):
+    allowed, evict_id = manager.acquire(device_id)
+    assert allowed
+    if evict_id is not None:
+        manager.closed(evict_id)
+    manager.opened(device_id, SimpleNamespace(device_id=device_id), (device_id, 0, 0))
+    return evict_id
+
+
+# -------------------------
+# ChannelManager
+# -------------------------
+def test_channel_manager_keeps_scanner_channel_free():
+    manager = ChannelManager(capacity=3, reserved=1, clock=ManualClock())
+    open_device(manager, 1)
+    open_device(manager, 2)
+
+    assert manager.acquire(3) == (False, None)
+    assert manager.acquire(1) == (False, None)  # already open
+
+
+def test_channel_manager_preferred_device_evicts_longest_idle():
+    clock = ManualClock()
+    manager = ChannelManager(capacity=3, reserved=1, preferred=[9], clock=clock)
+    open_device(manager, 1)
+    clock.advance(1)
+    open_device(manager, 2)
+    clock.advance(1)
+    manager.touch(1)
+
+    assert open_device(manager, 9) == 2
+    assert sorted(d.device_id for d in manager.devices()) == [1, 9]
+
+    # preferred channels are never evicted
+    manager.preferred.add(8)
+    assert open_device(manager, 8) == 1
+    assert manager.acquire(7) == (False, None)
+    manager.preferred.add(7)
+    assert manager.acquire(7) == (False, None)
+
+
+def test_channel_manager_reports_idle_channels():
+    clock = ManualClock()
+    manager = ChannelManager(capacity=8, idle_timeout=30, clock=clock)
+    open_device(manager, 1)
+    open_device(manager, 2)
+
+    clock.advance(20)
+    manager.touch(2)
+    clock.advance(15)
+    assert manager.idle() == [1]
+
+    assert manager.closed(1).device_tuple == (1, 0, 0)
+    assert manager.idle() == []
+    assert manager.closed(1) is None
+
+
+# -------------------------
+# Backoff
+# -------------------------
+def test_backoff_grows_with_jitter_and_resets():
+    backoff = Backoff(base=0.5, maximum=4, rng=random.Random(1))
+    delays = [backoff.next_delay() for _ in range(6)]
+
+    for delay, limit in zip(delays, [0.5, 1, 2, 4, 4, 4]):
+        assert limit / 2 <= delay <= limit
+
+    backoff.reset()
+    assert backoff.next_delay() <= 0.5
+
+
+# -------------------------
+# ChannelNode
+# -------------------------
+class FakeAnt:
+    """Answers channel commands from another thread like the stick does."""
+
+    def __init__(self, node, silent=()):
+        self._node = node
+        self._silent = set(silent)
+        self._running = True
+        self.sent = []
+
+    def _respond(self, channel, event):
+        self.sent.append((event, channel))
+        if channel in self._silent:
+            return
+
+        def respond():
+            with self._node._responses_cond:
+                self._node._responses.append((channel, event, [0]))
+                self._node._responses_cond.notify_all()
+
+        threading.Timer(0.01, respond).start()
+
+    def close_channel(self, channel):
+        self._respond(channel, Message.ID.CLOSE_CHANNEL)
+
+    def unassign_channel(self, channel):
+        self._respond(channel, Message.ID.UNASSIGN_CHANNEL)
+
+    def stop(self):
+        self._running = False
+
+
+def make_node(open_channels, silent=()):
+    # skips Node.__init__, which opens the USB stick
+    node = ChannelNode.__new__(ChannelNode)
+    node._responses_cond = threading.Condition()
+    node._responses = collections.deque()
+    node._datas = queue.Queue()
+    node._running = True
+    node._worker_thread = threading.Thread(target=lambda: None)
+    node._worker_thread.start()
+    node.channels = [
+        SimpleNamespace(id=i) if i in open_channels else None for i in range(8)
+    ]
+    node.ant = FakeAnt(node, silent)
+    return node
+
+
+def test_close_all_sends_commands_back_to_back():
+    node = make_node({0, 2, 5})
+
+    started = time.monotonic()
+    assert node.close_all(timeout=1) == []
+
+    # one round trip for close and one for unassign, not two per channel
+    assert time.monotonic() - started < 0.1
+    assert node.open_channel_count() == 0
+    assert [event for event, _ in node.ant.sent] == [Message.ID.CLOSE_CHANNEL] * 3 + [
+        Message.ID.UNASSIGN_CHANNEL
+    ] * 3
+
+
+def test_close_all_reports_unconfirmed_channels():
+    node = make_node({1, 3}, silent={3})
+
+    assert node.close_all(timeout=0.05) == [3]
+    assert node.open_channel_count() == 0
+
+
+def test_stop_wakes_main_loop():
+    node = make_node(set())
+    thread = threading.Thread(target=node._main)
+    thread.start()
+    time.sleep(0.01)
+
+    started = time.monotonic()
+    node.stop()
+    thread.join(timeout=1)
+
+    assert not thread.is_alive()
+    assert time.monotonic() - started < 0.1
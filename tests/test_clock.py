@@ -0,0 +1,87 @@
+# tests/test_clock.py
+import time
+
+from app.clock import ManualClock
+from app.model import IntervalModel, MetricsSettingsModel
+from app.sim import SimulatedMetrics
+from app.util import TimedMap, TimedMovingAverage
+from app.workout import Timer
+
+
+# -------------------------
+# ManualClock
+# -------------------------
+def test_timed_map_expires_with_manual_clock():
+    clock = ManualClock()
+    time_map = TimedMap(ttl=15, clock=clock)
+    time_map.set("power", 200)
+
+    clock.advance(14.9)
+    assert time_map.get("power") == 200
+    clock.advance(0.2)
+    assert time_map.get("power") is None
+
+
+def test_timed_moving_average_window_with_manual_clock():
+    clock = ManualClock()
+    average = TimedMovingAverage(ttl=10, clock=clock)
+    average.add("power", 100)
+    clock.advance(5)
+    average.add("power", 200)
+    assert average.average("power") == 150
+
+    clock.advance(6)
+    assert average.average("power") == 200
+
+
+def test_timer_with_manual_clock():
+    clock = ManualClock()
+    timer = Timer(
+        [
+            IntervalModel(seconds=60, name="work"),
+            IntervalModel(seconds=30, name="rest"),
+        ],
+        clock=clock,
+    )
+    timer.start()
+    clock.advance(75)
+    progress = timer.current_interval()
+    assert progress.interval.name == "rest"
+    assert progress.time_remaining == 15
+    assert progress.round_number == 1
+
+
+# -------------------------
+# Fast-forward simulation
+# -------------------------
+def test_two_hour_workout_simulation():
+    clock = ManualClock()
+    settings = MetricsSettingsModel(
+        age=30, speed_wheel_circumference_m=2.096, distance_wheel_circumference_m=2.096
+    )
+    metrics = SimulatedMetrics(metrics_settings=settings, rate_hz=1, clock=clock)
+    timer = Timer(
+        [
+            IntervalModel(seconds=300, name="work"),
+            IntervalModel(seconds=120, name="rest"),
+        ],
+        clock=clock,
+    )
+
+    started = time.monotonic()
+    metrics.start()
+    timer.start()
+    metrics.fast_forward(2 * 60 * 60)
+
+    assert time.monotonic() - started < 30
+    snapshot = metrics.get_metrics()
+    assert snapshot.is_running is True
+    assert snapshot.power is not None
+    # 25-35 km/h for two hours
+    assert 50_000 < snapshot.ma_distance < 70_000
+    assert (snapshot.last_sensor_update - clock.now()).total_seconds() == 0
+
+    progress = timer.current_interval()
+    assert progress.total_time_spent == 2 * 60 * 60
+    assert progress.round_number == 18
+    metrics.stop()
@@ -0,0 +1,63 @@
+# tests/test_core.py
+import logging
+import logging.handlers
+import queue
+
+from app.core import DroppingQueueHandler, RateLimitFilter, setup_logging, stop_logging
+
+
+# -------------------------
+# Queued logging
+# -------------------------
+def test_setup_logging_uses_queue_handlers():
+    setup_logging()
+    try:
+        for handler in logging.getLogger("app").handlers:
+            assert isinstance(handler, logging.handlers.QueueHandler)
+    finally:
+        stop_logging()
+
+
+def test_dropping_queue_handler_never_blocks():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    logger = logging.getLogger("tests.dropping")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for i in range(5):
+            logger.warning("record %s", i)
+    finally:
+        logger.removeHandler(handler)
+    assert handler.dropped == 4
+
+
+def test_queued_record_keeps_message_and_traceback_of_log_time():
+    log_queue = queue.Queue()
+    handler = DroppingQueueHandler(log_queue)
+    logger = logging.getLogger("tests.prepare")
+    logger.propagate = False
+    logger.addHandler(handler)
+    devices = [1]
+    try:
+        logger.warning("devices %s", devices)
+        devices.append(2)  # changes before the listener formats the record
+        try:
+            raise ValueError("no stick")
+        except ValueError:
+            logger.exception("node error")
+    finally:
+        logger.removeHandler(handler)
+
+    formatter = logging.Formatter("%(message)s")
+    first, second = log_queue.get_nowait(), log_queue.get_nowait()
+    assert formatter.format(first) == "devices [1]"
+    assert second.exc_info is None  # no frames kept alive in the queue
+    assert formatter.format(second).startswith("node error\nTraceback")
+    assert "ValueError: no stick" in formatter.format(second)
+
+
+def test_rate_limit_filter():
+    rate_limit = RateLimitFilter(rate=3)
+    record = logging.makeLogRecord({"msg": "packet"})
+    passed = sum(rate_limit.filter(record) for _ in range(10))
+    assert passed <= 6
@@ -0,0 +1,100 @@
+# tests/test_energy.py
+import math
+from types import SimpleNamespace
+
+from openant.devices.power_meter import PowerData
+
+from app.ant import Metrics
+from app.clock import ManualClock
+from app.energy import EnergyAccumulator
+from app.model import LifecycleState, MetricsSettingsModel
+
+
+def ride(energy: EnergyAccumulator, clock: ManualClock, watts: float, seconds: int):
+    for _ in range(seconds * 4):
+        energy.add(watts)
+        clock.advance(0.25)
+
+
+# -------------------------
+# Work
+# -------------------------
+def test_work_integrates_real_sample_intervals():
+    clock = ManualClock()
+    energy = EnergyAccumulator(clock=clock)
+    energy.add(200)
+    clock.advance(0.5)
+    energy.add(300)
+    clock.advance(1.5)
+    energy.add(0)
+
+    work_kj, kcal, w_balance, percent = energy.snapshot()
+    assert math.isclose(work_kj, (200 * 0.5 + 300 * 1.5) / 1000)
+    assert math.isclose(kcal, work_kj / 4.184 / 0.24)
+    assert w_balance is None and percent is None  # no CP
+
+
+def test_dropout_holds_last_power_only_briefly():
+    clock = ManualClock()
+    energy = EnergyAccumulator(clock=clock, max_gap_s=5)
+    energy.add(250)
+    clock.advance(60)  # sensor out of range
+    energy.add(250)
+
+    assert math.isclose(energy.snapshot()[0], 250 * 5 / 1000)
+
+
+# -------------------------
+# W' balance
+# -------------------------
+def test_w_balance_depletes_above_cp_and_recovers_below():
+    clock = ManualClock()
+    energy = EnergyAccumulator(cp=250, w_prime=20000, clock=clock)
+
+    ride(energy, clock, 350, 60)
+    _, _, w_balance, percent = energy.snapshot()
+    assert math.isclose(w_balance, 20000 - 100 * (60 - 0.25))
+    assert math.isclose(percent, 100 * w_balance / 20000)
+
+    # recovery at 150 W has a time constant of W' / (CP - P) = 200 s
+    depleted = w_balance
+    ride(energy, clock, 150, 200)
+    expected = 20000 - (20000 - depleted) * math.exp(-1)
+    assert math.isclose(energy.snapshot()[2], expected, rel_tol=1e-3)
+
+
+def test_w_balance_never_goes_negative():
+    clock = ManualClock()
+    energy = EnergyAccumulator(cp=250, w_prime=5000, clock=clock)
+    ride(energy, clock, 600, 60)
+    assert energy.snapshot()[2] == 0
+
+
+def test_parameter_change_keeps_what_was_spent():
+    clock = ManualClock()
+    energy = EnergyAccumulator(cp=250, w_prime=20000, clock=clock)
+    ride(energy, clock, 350, 50)
+    spent = 20000 - energy.snapshot()[2]
+
+    energy.set_parameters(260, 25000)
+    assert math.isclose(energy.snapshot()[2], 25000 - spent)
+
+
+# -------------------------
+# Metrics
+# -------------------------
+def test_metrics_publish_work_and_w_balance_with_ftp_as_cp():
+    clock = ManualClock()
+    metrics = Metrics(MetricsSettingsModel(ftp=200, w_prime=10000), clock=clock)
+    metrics._lifecycle = LifecycleState.RUNNING
+    dev = SimpleNamespace(device_id=3, _power_update_event_count=[0, 0])
+
+    for n in range(40):
+        dev._power_update_event_count = [n, n + 1]
+        metrics._on_device_page(dev, 0x10, "power", PowerData(instantaneous_power=300))
+        clock.advance(0.25)
+
+    snapshot = metrics.get_metrics()
+    assert math.isclose(snapshot.work_kj, 300 * 39 * 0.25 / 1000)
+    assert math.isclose(snapshot.w_prime_balance, 10000 - 100 * 39 * 0.25)
+    assert math.isclose(snapshot.w_prime_balance_percent, 90.25)
@@ -0,0 +1,48 @@
+# tests/test_filters.py
+from app.filters import EmaFilter, FilterMap, KalmanFilter, MedianFilter
+from app.model import FilterSettingsModel, FilterType, MetricsSettingsModel
+from app.util import MetricsKey
+
+
+# -------------------------
+# Filters
+# -------------------------
+def test_ema_filter_time_constant():
+    f = EmaFilter(time_constant_s=1.0)
+    assert f.update(100, 0.0) == 100
+    # after one time constant ~63% of the step is reached
+    value = f.update(200, 1.0)
+    assert 162 < value < 164
+
+
+def test_median_filter_rejects_dropout():
+    f = MedianFilter(window=5)
+    for t, watts in enumerate([200, 205, 0, 210, 200]):
+        value = f.update(watts, t)
+    assert value == 200
+    assert len(f.values) == 5
+
+
+def test_kalman_filter_converges():
+    f = KalmanFilter(process_noise=1.0, measurement_noise=2.0)
+    f.update(10, 0.0)
+    for t in range(1, 30):
+        value = f.update(30, t * 0.25)
+    assert abs(value - 30) < 0.5
+
+
+def test_filter_map_from_settings():
+    settings = MetricsSettingsModel(
+        filters={"power": [{"type": "ema", "time_constant_s": 2}]}
+    )
+    filter_map = FilterMap(settings.filters)
+    assert filter_map.add(MetricsKey.POWER, 150) == 150
+    assert filter_map.get(MetricsKey.POWER) == 150
+    # metrics without a chain are not filtered
+    assert filter_map.add(MetricsKey.SPEED, 30) is None
+    assert filter_map.get(MetricsKey.SPEED) is None
+
+
+def test_filter_settings_validation():
+    settings = FilterSettingsModel(type=FilterType.MEDIAN, window=3)
+    assert settings.type == FilterType.MEDIAN
@@ -0,0 +1,145 @@
+# tests/test_hrv.py
+import math
+import statistics
+from types import SimpleNamespace
+
+from openant.devices.heart_rate import HeartRateData
+
+from app.ant import Metrics
+from app.clock import ManualClock
+from app.hrv import ArtifactFilter, HrvAccumulator, RollingHrv, RRExtractor
+from app.model import LifecycleState, MetricsSettingsModel
+
+
+class Beats:
+    """Raw beat time and count of a heart rate strap, with rollover."""
+
+    def __init__(self):
+        self.time = 0.0
+        self.count = 0
+
+    def beat(self, rr_ms: float):
+        self.time = (self.time + rr_ms / 1000) % 64
+        self.count = (self.count + 1) % 256
+        return self.time, self.count
+
+
+# -------------------------
+# RR intervals
+# -------------------------
+def test_rr_extractor_handles_rollover():
+    extractor = RRExtractor()
+    extractor.update(63.5, 255, now=0)
+
+    rr, follows = extractor.update(0.25, 0, now=1)
+    assert rr == 750
+    assert follows
+
+
+def test_rr_extractor_repeated_page_has_no_beat():
+    extractor = RRExtractor()
+    extractor.update(10.0, 5, now=0)
+    assert extractor.update(10.0, 5, now=0.25) == (None, False)
+
+
+def test_rr_extractor_missed_beats_use_previous_beat_time():
+    extractor = RRExtractor()
+    extractor.update(10.0, 5, now=0)
+
+    # two beats in lost pages, only the last interval is known from page 4
+    assert extractor.update(12.0, 8, now=2) == (None, False)
+    rr, follows = extractor.update(12.75, 9, now=3, previous_beat_time=12.0)
+    assert rr == 750
+    assert follows
+    rr, follows = extractor.update(14.5, 11, now=5, previous_beat_time=13.75)
+    assert rr == 750
+    assert not follows
+
+
+def test_rr_extractor_restarts_after_long_gap():
+    extractor = RRExtractor()
+    extractor.update(10.0, 5, now=0)
+    assert extractor.update(10.8, 6, now=100) == (None, False)
+
+
+# -------------------------
+# Artifacts
+# -------------------------
+def test_artifact_filter_rejects_ectopic_beat():
+    f = ArtifactFilter()
+    assert all(f.accept(rr) for rr in (800, 810, 790))
+    assert not f.accept(400)  # premature beat
+    assert not f.accept(2500)  # out of range
+    assert f.accept(805)
+
+
+def test_artifact_filter_follows_real_rhythm_change():
+    f = ArtifactFilter(max_rejects=3)
+    f.accept(1000)
+    accepted = [f.accept(500) for _ in range(5)]
+    assert accepted == [False, False, False, True, True]
+
+
+# -------------------------
+# Rolling RMSSD / SDNN
+# -------------------------
+def test_rolling_hrv_matches_direct_computation():
+    window = RollingHrv(capacity=8)
+    rrs = [800, 820, 790, 810, 805, 830, 780, 800, 815, 795, 805]
+    for t, rr in enumerate(rrs):
+        window.append(t, rr, follows=True)
+
+    kept = rrs[-8:]
+    diffs = [b - a for a, b in zip(kept, kept[1:])]
+    assert math.isclose(window.sdnn(), statistics.stdev(kept))
+    assert math.isclose(
+        window.rmssd(), math.sqrt(sum(d * d for d in diffs) / len(diffs))
+    )
+
+
+def test_rolling_hrv_does_not_diff_across_gaps():
+    window = RollingHrv()
+    window.append(0, 800, follows=True)
+    window.append(1, 900, follows=False)
+    assert window.rmssd() is None
+    window.append(2, 880, follows=True)
+    assert window.rmssd() == 20
+
+
+def test_hrv_accumulator_expires_window():
+    clock = ManualClock()
+    hrv = HrvAccumulator(window_s=10, clock=clock)
+    beats = Beats()
+    for rr in (800, 820, 800, 820):
+        hrv.add(1, *beats.beat(rr))
+        clock.advance(rr / 1000)
+
+    rr, rmssd, sdnn = hrv.snapshot()
+    assert math.isclose(rr, 820)
+    assert math.isclose(rmssd, 20)
+    assert sdnn is not None
+
+    clock.advance(11)
+    assert hrv.snapshot() == (None, None, None)
+
+
+# -------------------------
+# Metrics
+# -------------------------
+def test_metrics_publish_hrv_from_heart_rate_pages():
+    clock = ManualClock()
+    metrics = Metrics(MetricsSettingsModel(hrv_window_s=30), clock=clock)
+    metrics._lifecycle = LifecycleState.RUNNING
+    dev = SimpleNamespace(device_id=5)
+    beats = Beats()
+
+    for rr in [800, 850] * 10:
+        data = HeartRateData(heart_rate=72)
+        data.beat_time, data.beat_count = beats.beat(rr)
+        clock.advance(rr / 1000)
+        metrics._on_device_page(dev, 0, "heart_rate", data)
+
+    snapshot = metrics.get_metrics()
+    assert math.isclose(snapshot.rr_interval, 850, abs_tol=1e-6)
+    assert math.isclose(snapshot.rmssd, 50, abs_tol=1e-6)
+    assert 25 < snapshot.sdnn < 26
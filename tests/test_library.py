@@ -0,0 +1,123 @@
+# tests/test_library.py
+import json
+
+from app.library import SUMMARY_COLUMNS, WorkoutLibrary, _filters
+from app.model import IntervalModel, WorkoutDefinitionModel
+
+
+def definition(name, tags=(), seconds=(60, 30)):
+    return WorkoutDefinitionModel(
+        name=name,
+        tags=list(tags),
+        intervals=[
+            IntervalModel(name=f"i{n}", seconds=s) for n, s in enumerate(seconds)
+        ],
+    )
+
+
+# -------------------------
+# Listing
+# -------------------------
+def test_list_pages_by_name_without_intervals():
+    library = WorkoutLibrary()
+    for name in ["delta", "Alpha", "charlie", "bravo", "echo"]:
+        library.create(definition(name))
+
+    first = library.list(offset=0, limit=2)
+    second = library.list(offset=2, limit=2)
+
+    assert first.total == 5
+    assert [w.name for w in first.items] == ["Alpha", "bravo"]
+    assert [w.name for w in second.items] == ["charlie", "delta"]
+    assert first.items[0].interval_count == 2
+    assert first.items[0].total_seconds == 90
+    assert not hasattr(first.items[0], "intervals")
+
+
+def test_list_filters_by_tag_and_name_prefix():
+    library = WorkoutLibrary()
+    library.create(definition("Sweet spot 3x10", tags=["sweetspot", "indoor"]))
+    library.create(definition("Sweet spot 2x20", tags=["SweetSpot"]))
+    library.create(definition("VO2 5x3", tags=["vo2"]))
+    library.create(definition("100%_test", tags=["ftp"]))
+
+    by_tag = library.list(tag="sweetspot")
+    assert [w.name for w in by_tag.items] == ["Sweet spot 2x20", "Sweet spot 3x10"]
+    assert by_tag.items[1].tags == ["indoor", "sweetspot"]
+
+    assert [w.name for w in library.list(name="sweet").items] == [
+        "Sweet spot 2x20",
+        "Sweet spot 3x10",
+    ]
+    assert library.list(name="100%_").total == 1
+    assert library.list(name="100__").total == 0  # wildcards are literal
+    assert library.list(tag="vo2", name="sweet").total == 0
+
+
+def test_name_prefix_search_uses_the_name_index():
+    library = WorkoutLibrary()
+    clause, params = _filters(None, "sweet")
+
+    plan = library._db.execute(
+        f"EXPLAIN QUERY PLAN SELECT {SUMMARY_COLUMNS} FROM workouts w {clause} "
+        "ORDER BY w.name COLLATE NOCASE, w.id LIMIT 50",
+        params,
+    ).fetchall()
+
+    details = [row["detail"] for row in plan]
+    assert len(details) == 1
+    assert details[0].startswith("SEARCH w USING INDEX workouts_name")
+
+
+# -------------------------
+# Changes
+# -------------------------
+def test_update_replaces_tags_and_intervals():
+    library = WorkoutLibrary()
+    created = library.create(definition("Tempo", tags=["a", "b"]))
+
+    updated = library.update(
+        created.id, definition("Tempo long", tags=["c"], seconds=(600,))
+    )
+
+    assert updated.name == "Tempo long"
+    assert updated.tags == ["c"]
+    assert [i.seconds for i in updated.intervals] == [600]
+    assert library.list(tag="a").total == 0
+    assert library.update(999, definition("x")) is None
+
+
+def test_delete_removes_tags_and_intervals():
+    library = WorkoutLibrary()
+    created = library.create(definition("Tempo", tags=["a"]))
+
+    assert library.delete(created.id)
+    assert library.get(created.id) is None
+    assert library.list(tag="a").total == 0
+    assert not library.delete(created.id)
+
+
+def test_selection_survives_reopen_in_wal_mode(tmp_path):
+    path = str(tmp_path / "workouts.db")
+    library = WorkoutLibrary(path)
+    library.create(definition("Endurance"))
+    threshold = library.create(definition("Threshold", seconds=(1200,)))
+    assert library.select(threshold.id).intervals[0].seconds == 1200
+    library.close()
+
+    library = WorkoutLibrary(path)
+    assert library._db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert library.selected().name == "Threshold"
+    assert library.select(999) is None
+    assert library.selected_id() == threshold.id
+
+
+def test_import_json_of_earlier_versions(tmp_path):
+    path = tmp_path / "workout.json"
+    path.write_text(json.dumps([{"name": "warmup", "seconds": 300}]))
+    library = WorkoutLibrary()
+
+    imported = library.import_json(str(path))
+
+    assert library.selected_id() == imported.id
+    assert imported.intervals[0].name == "warmup"
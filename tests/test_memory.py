@@ -0,0 +1,51 @@
+# tests/test_memory.py
+import tracemalloc
+
+from app import soak
+from app.memory import MemoryProfiler
+
+
+# -------------------------
+# MemoryProfiler
+# -------------------------
+def test_report_without_tracing_only_has_rss():
+    report = MemoryProfiler().report()
+
+    assert report.tracing is False
+    assert report.top == []
+    assert report.rss_bytes is None or report.rss_bytes > 0
+
+
+def test_report_diffs_against_snapshot():
+    profiler = MemoryProfiler()
+    profiler.start()
+    try:
+        profiler.snapshot()
+        kept = [bytearray(1000) for _ in range(1000)]
+        report = profiler.report(limit=5)
+    finally:
+        profiler.stop()
+
+    assert report.tracing is True
+    assert report.baseline_age_s is not None
+    assert "test_memory.py" in report.top[0].location
+    assert report.top[0].size_diff >= 1_000_000
+    assert len(kept) == 1000
+    assert not tracemalloc.is_tracing()
+
+
+# -------------------------
+# Soak
+# -------------------------
+def test_short_soak_keeps_memory_and_structures_bounded():
+    report = soak.run(hours=3, rate_hz=1, poll_seconds=5, max_growth_mb=8)
+
+    assert len(report["rss_mb"]) == 3
+    assert report["passed"], report
+    assert report["unbounded"] == []
+    last = report["sizes"][-1]
+    assert last["session_samples"] == report["bounds"]["session_samples"]
+    assert last["session_marks"] == soak.MAX_MARKS
+    assert last["stream_subscribers"] == 0
+    assert last["poll_waiters"] == 0
+    assert report["long_polls_woken"] == 3 * 3600 / 5
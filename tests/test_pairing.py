@@ -0,0 +1,89 @@
+# tests/test_pairing.py
+from datetime import timedelta
+from types import SimpleNamespace
+
+import app.ant
+from app.ant import Metrics
+from app.clock import ManualClock
+from app.model import MetricsSettingsModel
+from app.pairing import PairingCache
+
+HEART_RATE = (12, 120, 1)
+POWER = (34, 11, 5)
+
+
+# -------------------------
+# PairingCache
+# -------------------------
+def test_pairing_cache_roundtrip(tmp_path):
+    path = str(tmp_path / "pairing.json")
+    cache = PairingCache(path, clock=ManualClock())
+    cache.seen([HEART_RATE, POWER])
+    cache.save()
+
+    loaded = PairingCache(path, clock=ManualClock())
+    loaded.load()
+    assert sorted(
+        (d.device_id, d.device_type, d.trans_type) for d in loaded.devices()
+    ) == [
+        HEART_RATE,
+        POWER,
+    ]
+
+
+def test_pairing_cache_expires_unseen_sensors(tmp_path):
+    clock = ManualClock()
+    cache = PairingCache(
+        str(tmp_path / "pairing.json"), max_age=timedelta(days=1), clock=clock
+    )
+    cache.seen([HEART_RATE])
+    clock.advance(20 * 3600)
+    cache.seen([POWER])
+    clock.advance(5 * 3600)
+
+    assert [d.device_id for d in cache.devices()] == [34]
+
+
+def test_pairing_cache_only_saves_changes(tmp_path):
+    path = tmp_path / "pairing.json"
+    clock = ManualClock()
+    cache = PairingCache(str(path), clock=clock)
+    cache.seen([HEART_RATE])
+    cache.save()
+    path.unlink()
+
+    clock.advance(60)
+    cache.seen([HEART_RATE])
+    cache.save()
+    assert not path.exists()
+
+    cache.seen([(12, 120, 5)])  # transmission type changed
+    cache.save()
+    assert path.exists()
+
+
+# -------------------------
+# Metrics start with paired sensors
+# -------------------------
+def test_paired_devices_are_opened_without_scanner(monkeypatch):
+    created = []
+
+    def fake_auto_create_device(node, device_id, device_type, trans_type):
+        created.append((device_id, device_type, trans_type))
+        return SimpleNamespace(device_id=device_id, device_type=device_type, name="x")
+
+    monkeypatch.setattr(app.ant, "auto_create_device", fake_auto_create_device)
+
+    clock = ManualClock()
+    cache = PairingCache(clock=clock)
+    cache.seen([HEART_RATE, POWER])
+    metrics = Metrics(
+        MetricsSettingsModel(device_ids=[34]), clock=clock, pairing_cache=cache
+    )
+    metrics.scanner = SimpleNamespace(found=set())
+
+    metrics._open_paired_devices()
+
+    assert created == [POWER]
+    assert metrics.scanner.found == {POWER}
+    assert metrics.channel_manager.is_open(34)
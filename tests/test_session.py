@@ -0,0 +1,169 @@
+# tests/test_session.py
+import math
+import time
+
+import numpy as np
+
+from app.clock import ManualClock
+from app.model import IntervalModel
+from app.session import SessionRecorder, build_report, peak_powers, resample
+from app.util import MetricsKey
+from app.workout import Timer
+
+
+def ride(recorder, clock, seconds, power, heart_rate=None, cadence=None, hz=4):
+    for _ in range(int(seconds * hz)):
+        now = clock.monotonic()
+        recorder.on_sample(MetricsKey.POWER, power, now)
+        if heart_rate is not None:
+            recorder.on_sample(MetricsKey.HEART_RATE, heart_rate, now)
+        if cadence is not None:
+            recorder.on_sample(MetricsKey.CADENCE, cadence, now)
+        clock.advance(1 / hz)
+
+
+# -------------------------
+# Resampling
+# -------------------------
+def test_resample_holds_last_sample_until_stale():
+    times = np.array([0.0, 0.5, 10.0])
+    values = np.array([100.0, 200.0, 300.0])
+    grid = np.arange(0.0, 12.0)
+
+    resampled = resample(times, values, grid)
+
+    assert list(resampled[:4]) == [100, 200, 200, 200]
+    assert np.isnan(resampled[4:10]).all()  # dropout
+    assert list(resampled[10:]) == [300, 300]
+
+
+def test_peak_powers_from_cumulative_sum():
+    power = np.full(600, 200.0)
+    power[100:105] = 800
+    power[300:360] = 400
+
+    peaks = {p.seconds: p.watts for p in peak_powers(power)}
+
+    assert peaks[5] == 800
+    assert peaks[60] == 400
+    assert math.isclose(peaks[300], (5 * 800 + 60 * 400 + 235 * 200) / 300)
+    assert 1200 not in peaks
+
+
+# -------------------------
+# Report
+# -------------------------
+def test_report_summaries_histograms_and_decoupling():
+    clock = ManualClock()
+    recorder = SessionRecorder(clock=clock)
+    ride(recorder, clock, 600, 200, heart_rate=140, cadence=90)
+    ride(recorder, clock, 600, 200, heart_rate=154, cadence=90)
+
+    report = build_report(recorder)
+
+    assert report.samples["power"] == 4800
+    assert report.power.avg == 200
+    assert report.heart_rate.max == 154
+    assert math.isclose(report.normalized_power, 200)
+    assert [(b.low, b.seconds) for b in report.power_histogram] == [(200, 1200)]
+    assert [b.low for b in report.heart_rate_histogram] == [140, 150]
+    # 200 / 140 against 200 / 154
+    assert math.isclose(report.decoupling_percent, 100 * (1 - 140 / 154), rel_tol=1e-3)
+    assert report.quadrants is None  # no FTP
+
+
+def test_report_quadrants_split_at_threshold_force_and_velocity():
+    clock = ManualClock()
+    recorder = SessionRecorder(clock=clock)
+    ride(recorder, clock, 100, 300, cadence=70)  # high force, low velocity
+    ride(recorder, clock, 100, 150, cadence=110)  # low force, high velocity
+
+    report = build_report(recorder, threshold_power=250)
+
+    quadrants = report.quadrants
+    velocity = 90 * 0.1725 * 2 * math.pi / 60
+    assert math.isclose(quadrants.threshold_velocity_m_s, velocity, rel_tol=1e-3)
+    assert math.isclose(quadrants.q2_percent, 50, abs_tol=1)
+    assert math.isclose(quadrants.q4_percent, 50, abs_tol=1)
+    assert quadrants.q1_percent == 0
+
+
+def test_report_summarizes_intervals_across_timer_restart():
+    clock = ManualClock()
+    timer = Timer(
+        [IntervalModel(seconds=60, name="on"), IntervalModel(seconds=30, name="off")],
+        clock=clock,
+    )
+    recorder = SessionRecorder(timer, clock=clock)
+    ride(recorder, clock, 10, 100)  # before the workout
+    timer.start()
+    ride(recorder, clock, 60, 300)
+    ride(recorder, clock, 30, 120)
+    ride(recorder, clock, 20, 310)
+    timer.stop()
+    ride(recorder, clock, 10, 100)
+
+    intervals = build_report(recorder).intervals
+
+    assert [(i.name, i.round_number) for i in intervals] == [
+        ("on", 1),
+        ("off", 1),
+        ("on", 2),
+    ]
+    assert [i.start_s for i in intervals] == [10, 70, 100]
+    assert [i.duration_s for i in intervals] == [60, 30, 20]
+    assert [i.avg_power for i in intervals] == [300, 120, 310]
+
+
+def test_recorder_caps_samples_and_reset_starts_over():
+    clock = ManualClock()
+    recorder = SessionRecorder(clock=clock, max_samples=10)
+    ride(recorder, clock, 5, 200)
+
+    assert build_report(recorder).samples["power"] == 10
+    assert recorder.dropped == 10
+
+    recorder.reset()
+    report = build_report(recorder)
+    assert report.samples["power"] == 0
+    assert report.power.avg is None
+    assert report.peak_power == []
+
+
+def test_recorder_keeps_only_the_latest_interval_marks():
+    clock = ManualClock()
+    timer = Timer([IntervalModel(seconds=1, name="sprint")], clock=clock)
+    recorder = SessionRecorder(timer, clock=clock, max_marks=3)
+    timer.start()
+    ride(recorder, clock, 10, 500)
+
+    marks = recorder.marks()
+    intervals = build_report(recorder).intervals
+
+    assert len(marks) == 3
+    assert [i.round_number for i in intervals] == [8, 9, 10]
+    assert [i.start_s for i in intervals] == [7, 8, 9]
+
+
+def test_report_of_four_hour_session_is_fast():
+    clock = ManualClock()
+    recorder = SessionRecorder(clock=clock)
+    seconds = 4 * 3600
+    times = np.arange(0, seconds, 0.25)
+    rng = np.random.default_rng(1)
+    for key, values in (
+        (MetricsKey.POWER, rng.normal(220, 40, len(times))),
+        (MetricsKey.HEART_RATE, rng.normal(145, 8, len(times))),
+        (MetricsKey.CADENCE, rng.normal(88, 5, len(times))),
+    ):
+        recorder._times[key].extend(times)
+        recorder._values[key].extend(values)
+    recorder.end = recorder.start + seconds
+
+    started = time.perf_counter()
+    report = build_report(recorder, threshold_power=250)
+    elapsed = time.perf_counter() - started
+
+    assert report.samples["power"] == len(times)
+    assert len(report.peak_power) == 4
+    assert elapsed < 0.5
@@ -0,0 +1,278 @@
+# tests/test_stream.py
+import asyncio
+import threading
+import time
+
+from app.stream import SequenceNotifier, StreamHub, TickScheduler
+
+
+def _data(frame: str) -> str:
+    event_id, produced, data = frame.split("\n", 2)
+    assert event_id.startswith("id: ")
+    assert produced.startswith(": produced=")
+    return data
+
+
+def _id(frame: str) -> str:
+    return frame.split("\n", 1)[0][len("id: ") :]
+
+
+def _count(frame: str) -> int:
+    return int(_data(frame)[len("data: ") :])
+
+
+async def _read(hub: StreamHub, key, produce, n: int, last_event_id=None):
+    frames = []
+    gen = hub.subscribe(key, 0.01, produce, last_event_id)
+    async for frame in gen:
+        frames.append(frame)
+        if len(frames) >= n:
+            break
+    await gen.aclose()
+    return frames
+
+
+# -------------------------
+# StreamHub
+# -------------------------
+async def test_identical_subscriptions_share_producer():
+    hub = StreamHub("test", asyncio.Event())
+    calls = {"power": 0, "all": 0}
+
+    def producer(name):
+        async def produce():
+            calls[name] += 1
+            return f"data: {name}\n\n"
+
+        return produce
+
+    results = await asyncio.gather(
+        _read(hub, "power", producer("power"), 3),
+        _read(hub, "power", producer("power"), 3),
+        _read(hub, "all", producer("all"), 3),
+    )
+
+    assert [_data(f) for f in results[0]] == ["data: power\n\n"] * 3
+    assert [_data(f) for f in results[2]] == ["data: all\n\n"] * 3
+    # two clients on the same key share one frame per tick
+    assert calls["power"] < 6
+    assert hub.group_count() == 0
+    assert hub.subscriber_count() == 0
+
+
+async def test_frames_carry_the_time_they_were_produced():
+    before = time.time()
+    frames = await _read(StreamHub("test", asyncio.Event()), "k", _counter(), 2)
+    produced = [float(f.split("\n")[1][len(": produced=") :]) for f in frames]
+
+    assert before <= produced[0] <= produced[1] <= time.time()
+
+
+async def test_shutdown_ends_subscription():
+    shutdown_event = asyncio.Event()
+    hub = StreamHub("test", shutdown_event)
+
+    async def produce():
+        shutdown_event.set()
+        return "data: {}\n\n"
+
+    frames = [frame async for frame in hub.subscribe("k", 0.01, produce)]
+    assert len(frames) <= 1
+
+
+async def test_shutdown_wakes_idle_streams_at_once():
+    shutdown_event = asyncio.Event()
+    hub = StreamHub("test", shutdown_event)
+
+    async def produce():
+        return "data: {}\n\n"
+
+    async def read(key):
+        return [frame async for frame in hub.subscribe(key, 60, produce)]
+
+    readers = [asyncio.create_task(read(key)) for key in ("a", "a", "b")]
+    await asyncio.sleep(0.01)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    shutdown_event.set()
+    results = await asyncio.wait_for(asyncio.gather(*readers), timeout=1)
+
+    assert loop.time() - started < 0.1
+    assert all(len(frames) == 1 for frames in results)
+    assert hub.group_count() == 0
+
+
+def _counter():
+    produced = [0]
+
+    async def produce():
+        produced[0] += 1
+        return f"data: {produced[0]}\n\n"
+
+    return produce
+
+
+async def test_reconnect_replays_missed_frames():
+    hub = StreamHub("test", asyncio.Event(), replay_seconds=1)
+    produce = _counter()
+
+    first = await _read(hub, "k", produce, 3)
+    await asyncio.sleep(0.05)  # disconnected, the producer keeps going
+    assert hub.group_count() == 1
+
+    resumed = await _read(hub, "k", produce, 6, last_event_id=_id(first[-1]))
+
+    counts = [_count(f) for f in first + resumed]
+    assert counts == list(range(1, len(counts) + 1))  # no gap, no repeat
+
+
+async def test_unknown_or_too_old_id_gets_only_the_latest_frame():
+    hub = StreamHub("test", asyncio.Event(), replay_seconds=0.05)  # 5 frames
+    produce = _counter()
+    first = await _read(hub, "k", produce, 1)
+    await asyncio.sleep(0.1)
+    token = _id(first[0]).rpartition(":")[0]
+
+    for last_id in (f"{token}:1", "0-1:1", "garbage"):
+        keyframe, live = await _read(hub, "k", produce, 2, last_event_id=last_id)
+        assert _count(live) == _count(keyframe) + 1
+
+
+async def test_workout_reconnect_gets_one_keyframe_instead_of_a_burst():
+    hub = StreamHub("workout", asyncio.Event(), replay_seconds=1, keyframes_only=True)
+    produce = _counter()
+    first = await _read(hub, "k", produce, 3)
+    await asyncio.sleep(0.1)  # disconnected while about ten frames went by
+
+    keyframe, live = await _read(hub, "k", produce, 2, last_event_id=_id(first[-1]))
+
+    assert _count(keyframe) > _count(first[-1]) + 1  # stale frames skipped
+    assert _count(live) == _count(keyframe) + 1
+
+
+async def test_group_without_replay_ends_with_last_subscriber():
+    hub = StreamHub("test", asyncio.Event())
+    await _read(hub, "k", _counter(), 2)
+    assert hub.group_count() == 0
+
+
+async def test_lingering_group_ends_after_replay_window():
+    hub = StreamHub("test", asyncio.Event(), replay_seconds=0.05)
+    await _read(hub, "k", _counter(), 2)
+    assert hub.group_count() == 1
+    await asyncio.sleep(0.1)
+    assert hub.group_count() == 0
+
+
+# -------------------------
+# TickScheduler
+# -------------------------
+def test_tick_deadlines_are_period_boundaries():
+    assert TickScheduler.next_deadline(10.02, 0.5) == 10.5
+    assert TickScheduler.next_deadline(10.5, 0.5) == 11.0
+
+
+async def test_ticks_do_not_drift_with_processing_time():
+    ticks = TickScheduler(asyncio.Event())
+    loop = asyncio.get_running_loop()
+    deadlines = []
+    for _ in range(5):
+        deadlines.append(await ticks.wait(0.05))
+        assert loop.time() - deadlines[-1] < 0.02
+        await asyncio.sleep(0.02)  # work within the period
+
+    steps = [round(b - a, 6) for a, b in zip(deadlines, deadlines[1:])]
+    assert steps == [0.05] * 4
+
+
+async def test_late_waiter_skips_missed_ticks():
+    ticks = TickScheduler(asyncio.Event())
+    first = await ticks.wait(0.05)
+    await asyncio.sleep(0.12)  # misses two ticks
+
+    assert round(await ticks.wait(0.05) - first, 6) == 0.15
+
+
+async def test_streams_of_the_same_rate_share_ticks():
+    shutdown_event = asyncio.Event()
+    ticks = TickScheduler(shutdown_event)
+    hubs = [StreamHub(name, shutdown_event, ticks) for name in ("metrics", "workout")]
+    loop = asyncio.get_running_loop()
+
+    async def read(hub):
+        times = []
+
+        async def produce():
+            times.append(loop.time())
+            return "data: {}\n\n"
+
+        gen = hub.subscribe("k", 0.05, produce)
+        async for _ in gen:
+            if len(times) >= 3:
+                break
+        await gen.aclose()
+        return times
+
+    first = asyncio.create_task(read(hubs[0]))
+    await asyncio.sleep(0.021)  # subscribe out of phase
+    times = await asyncio.gather(first, read(hubs[1]))
+
+    # the first frame is immediate, later frames are on common boundaries
+    ticks_of = [{round(t / 0.05) for t in stream[1:]} for stream in times]
+    assert ticks_of[0] & ticks_of[1]
+    for stream in times:
+        assert all(abs(t - round(t / 0.05) * 0.05) < 0.005 for t in stream[1:])
+
+
+async def test_fired_ticks_of_any_period_are_forgotten():
+    ticks = TickScheduler(asyncio.Event())
+    periods = [0.01 + n / 1000 for n in range(20)]  # clients asking odd rates
+
+    await asyncio.gather(*(ticks.wait(period) for period in periods))
+
+    assert ticks.pending_count() == 0
+
+
+async def test_shutdown_releases_tick_waiters():
+    shutdown_event = asyncio.Event()
+    ticks = TickScheduler(shutdown_event)
+    waiter = asyncio.create_task(ticks.wait(60))
+    await asyncio.sleep(0.01)
+
+    shutdown_event.set()
+    await asyncio.wait_for(waiter, timeout=0.1)
+
+
+# -------------------------
+# SequenceNotifier
+# -------------------------
+async def test_sequence_notifier_wakes_on_publish_from_thread():
+    notifier = SequenceNotifier()
+    loop = asyncio.get_running_loop()
+    loop.call_later(
+        0.01, lambda: threading.Thread(target=notifier.publish, args=(1,)).start()
+    )
+
+    assert await notifier.wait(0, timeout=5)
+    assert notifier.seq() == 1
+
+
+async def test_sequence_notifier_times_out_without_update():
+    notifier = SequenceNotifier()
+    notifier.publish(3)
+
+    assert not await notifier.wait(3, timeout=0.01)
+    # older and newer (e.g. after a restart) sequences return at once
+    assert await notifier.wait(2, timeout=5)
+    assert await notifier.wait(9, timeout=5)
+
+
+async def test_sequence_notifier_close_releases_waiters():
+    notifier = SequenceNotifier()
+    waiter = asyncio.create_task(notifier.wait(0, timeout=5))
+    await asyncio.sleep(0)
+    notifier.close()
+
+    assert await asyncio.wait_for(waiter, 1) is False
+    assert await notifier.wait(0, timeout=5) is False
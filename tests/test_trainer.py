@@ -0,0 +1,145 @@
+# tests/test_trainer.py
+from openant.devices.fitness_equipment import ResistenceMode
+
+from app.clock import ManualClock
+from app.model import (
+    IntervalModel,
+    MetricsSettingsModel,
+    TargetModel,
+    TargetType,
+)
+from app.sim import SimulatedMetrics, SimulatedTrainer
+from app.trainer import (
+    MAX_RETRIES,
+    RELEASE,
+    TrainerCommand,
+    TrainerController,
+    command_for,
+)
+from app.util import MetricsKey
+from app.workout import Timer, WorkoutTracker
+
+
+def power(low, high=None):
+    return TargetModel(type=TargetType.POWER, low=low, high=high or low)
+
+
+def workout():
+    return [
+        IntervalModel(seconds=60, name="warmup", target=power(150)),
+        IntervalModel(seconds=30, name="on", target=power(280, 320)),
+    ]
+
+
+def controller(clock, trainer, intervals, **settings):
+    timer = Timer(intervals, clock=clock)
+    settings = MetricsSettingsModel(**settings)
+    return timer, TrainerController(timer, lambda: trainer, lambda: settings, clock)
+
+
+# -------------------------
+# Commands
+# -------------------------
+def test_command_for_targets():
+    assert command_for(power(200, 250), None) == TrainerCommand(
+        ResistenceMode.TargetPower, 225
+    )
+    ftp_percent = TargetModel(type=TargetType.FTP_PERCENT, low=90, high=100)
+    assert command_for(ftp_percent, 200).value == 190
+    assert command_for(ftp_percent, None) is None
+    resistance = TargetModel(type=TargetType.RESISTANCE, low=30, high=35)
+    assert command_for(resistance, None) == TrainerCommand(ResistenceMode.Basic, 32.5)
+    heart_rate = TargetModel(type=TargetType.HEART_RATE, low=130, high=140)
+    assert command_for(heart_rate, None) is None
+
+
+# -------------------------
+# Scheduling
+# -------------------------
+def test_sends_next_target_lead_seconds_before_the_boundary():
+    clock = ManualClock()
+    trainer = SimulatedTrainer(7)
+    timer, control = controller(clock, trainer, workout(), trainer_lead_s=2)
+    timer.start()
+
+    assert control.poll() == 1.0  # rechecks at least every second
+    assert trainer.commands == [(ResistenceMode.TargetPower, 150)]
+    trainer.tick(0, 0.25)  # confirms the command
+
+    clock.advance(57.5)
+    assert control.poll() == 0.5  # wakes exactly at the lead boundary
+    clock.advance(0.5)
+    control.poll()
+    assert trainer.commands[-1] == (ResistenceMode.TargetPower, 300)
+
+    for _ in range(20):
+        trainer.tick(0, 0.25)  # confirms the command
+        clock.advance(0.25)
+        control.poll()
+    assert len(trainer.commands) == 2  # no retransmits
+
+
+def test_unconfirmed_command_is_retried_a_few_times():
+    clock = ManualClock()
+    trainer = SimulatedTrainer(7)
+    trainer.tick = None  # never confirms
+    timer, control = controller(clock, trainer, workout())
+    timer.start()
+
+    for _ in range(40):
+        control.poll()
+        clock.advance(0.5)
+
+    assert len(trainer.commands) == 1 + MAX_RETRIES
+
+
+def test_releases_after_stop_and_resends_to_reconnected_trainer():
+    clock = ManualClock()
+    trainer = SimulatedTrainer(7)
+    devices = [trainer]
+    timer = Timer(workout(), clock=clock)
+    control = TrainerController(timer, lambda: devices[0], clock=clock)
+    timer.start()
+    control.poll()
+
+    devices[0] = SimulatedTrainer(7)  # channel closed and opened again
+    control.poll()
+    assert devices[0].commands == [(ResistenceMode.TargetPower, 150)]
+
+    timer.stop()
+    control.poll()
+    control.poll()
+    assert devices[0].commands[1:] == [(RELEASE.mode, RELEASE.value)]
+
+
+# -------------------------
+# Simulated trainer
+# -------------------------
+def test_simulated_trainer_follows_erg_target():
+    clock = ManualClock()
+    trainer = SimulatedTrainer(1001)
+    metrics = SimulatedMetrics(devices=[trainer], clock=clock)
+    timer = Timer([IntervalModel(seconds=600, name="on", target=power(320))], clock)
+    control = TrainerController(timer, metrics.get_trainer, clock=clock)
+    metrics.start()
+    timer.start()
+
+    metrics.fast_forward(15, on_tick=control.poll)
+
+    assert metrics.get_trainer() is trainer
+    assert metrics.time_map.get(MetricsKey.POWER) == 320
+    assert trainer.commands == [(ResistenceMode.TargetPower, 320)]
+    metrics.stop()
+    assert metrics.get_trainer() is None
+
+
+def test_resistance_target_has_no_compliance():
+    clock = ManualClock()
+    target = TargetModel(type=TargetType.RESISTANCE, low=20, high=20)
+    timer = Timer([IntervalModel(seconds=60, name="hill", target=target)], clock)
+    tracker = WorkoutTracker(timer)
+    timer.start()
+
+    tracker.on_sample(MetricsKey.POWER, 250, clock.monotonic())
+
+    assert tracker.progress().compliance is None
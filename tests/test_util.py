@@ -0,0 +1,83 @@
+# tests/test_util.py
+from app.clock import ManualClock
+from app.util import DistanceAccumulator, TimedMovingAverage
+
+
+# -------------------------
+# DistanceAccumulator
+# -------------------------
+def test_distance_first_sample_is_baseline():
+    acc = DistanceAccumulator()
+    assert acc.sum() is None
+
+    assert acc.add(1, 5000, 2.0) == 0.0
+    assert acc.sum() == 0.0
+
+    acc.add(1, 5010, 2.0)
+    assert acc.sum() == 20.0
+    assert acc.sum(1) == 20.0
+
+
+def test_distance_counter_rollover():
+    acc = DistanceAccumulator()
+    acc.add(1, 65530, 1.0)
+    acc.add(1, 4, 1.0)
+    assert acc.sum() == 10.0
+
+
+def test_distance_sensor_reset():
+    acc = DistanceAccumulator()
+    acc.add(1, 30000, 1.0)
+    acc.add(1, 30010, 1.0)
+    # counter restarted at zero, 5 revolutions since the reset
+    acc.add(1, 5, 1.0)
+    assert acc.sum() == 15.0
+
+
+def test_distance_per_device_totals():
+    acc = DistanceAccumulator()
+    acc.add(1, 100, 1.0)
+    acc.add(2, 200, 2.0)
+    acc.add(1, 110, 1.0)
+    acc.add(2, 205, 2.0)
+
+    assert acc.device_totals() == {1: 10.0, 2: 10.0}
+    assert acc.sum() == 20.0
+
+    acc.clear(1)
+    assert acc.sum() == 10.0
+
+
+def test_distance_forgets_longest_silent_device():
+    clock = ManualClock()
+    acc = DistanceAccumulator(clock=clock, max_devices=2)
+    acc.add(1, 100, 1.0)
+    clock.advance(1)
+    acc.add(2, 100, 1.0)
+    clock.advance(0.5)
+    acc.add(1, 110, 1.0)
+    clock.advance(1)
+    acc.add(3, 100, 1.0)
+
+    assert sorted(acc.device_totals()) == [1, 3]
+    assert acc.sum() == 10.0
+
+
+# -------------------------
+# TimedMovingAverage
+# -------------------------
+def test_moving_average_expires_and_caps_samples():
+    clock = ManualClock()
+    average = TimedMovingAverage(ttl=10, clock=clock, max_samples=3)
+    for value in (100, 200, 300, 400):
+        average.add("power", value)
+        clock.advance(1)
+
+    # only the newest three samples are kept
+    assert average.average("power") == 300
+
+    clock.advance(8)
+    assert average.average("power") == 400
+    clock.advance(1)
+    assert average.average("power") is None
+    assert average.store == {}
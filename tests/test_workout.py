@@ -0,0 +1,166 @@
+# tests/test_workout.py
+import pytest
+from pydantic import ValidationError
+
+from app.clock import ManualClock
+from app.model import IntervalModel, MetricsSettingsModel, TargetModel, TargetType
+from app.util import MetricsKey
+from app.workout import Timer, WorkoutTracker
+
+
+def _timer(clock, intervals):
+    timer = Timer(intervals, clock=clock)
+    timer.start()
+    return timer
+
+
+# -------------------------
+# Timer position
+# -------------------------
+def test_timer_position():
+    clock = ManualClock()
+    timer = _timer(
+        clock,
+        [IntervalModel(seconds=10, name="a"), IntervalModel(seconds=20, name="b")],
+    )
+    clock.advance(45)
+    position = timer.position()
+    assert position.round_number == 2
+    assert position.index == 1
+    assert position.time_spent == 5
+
+    timer.stop()
+    assert timer.position() is None
+
+
+# -------------------------
+# Compliance
+# -------------------------
+def test_compliance_time_in_target():
+    clock = ManualClock()
+    target = TargetModel(type=TargetType.POWER, low=200, high=250)
+    timer = _timer(clock, [IntervalModel(seconds=60, name="work", target=target)])
+    tracker = WorkoutTracker(timer)
+
+    # 10 s in target, 10 s 50 W below
+    for watts in [220] * 10 + [150] * 10 + [220]:
+        tracker.on_sample(MetricsKey.POWER, watts, clock.monotonic())
+        tracker.on_sample(MetricsKey.HEART_RATE, 150, clock.monotonic())
+        clock.advance(1)
+
+    compliance = tracker.progress().compliance
+    assert compliance.actual == 220
+    assert compliance.time_with_data == 20
+    assert compliance.time_in_target == 10
+    assert compliance.score == 50
+    assert compliance.average_deviation == 25
+
+
+def test_compliance_resets_on_interval_change():
+    clock = ManualClock()
+    target = TargetModel(type=TargetType.CADENCE, low=80, high=100)
+    timer = _timer(
+        clock,
+        [
+            IntervalModel(seconds=5, name="a", target=target),
+            IntervalModel(seconds=5, name="b", target=target),
+        ],
+    )
+    tracker = WorkoutTracker(timer)
+    for _ in range(8):
+        tracker.on_sample(MetricsKey.CADENCE, 90, clock.monotonic())
+        clock.advance(1)
+
+    progress = tracker.progress()
+    assert progress.interval.name == "b"
+    assert progress.compliance.time_in_target == 2
+
+
+def test_compliance_ftp_percent_target():
+    clock = ManualClock()
+    target = TargetModel(type=TargetType.FTP_PERCENT, low=90, high=100)
+    timer = _timer(clock, [IntervalModel(seconds=60, name="ftp", target=target)])
+
+    tracker = WorkoutTracker(timer, lambda: MetricsSettingsModel(ftp=300))
+    compliance = tracker.progress().compliance
+    assert compliance.target_low == 270
+    assert compliance.target_high == 300
+    assert compliance.score is None
+
+    # without FTP there is no power target
+    tracker = WorkoutTracker(timer)
+    assert tracker.progress().compliance is None
+
+
+def test_target_range_must_not_be_inverted():
+    assert TargetModel(type=TargetType.POWER, low=250, high=250).low == 250
+    with pytest.raises(ValidationError, match="above high"):
+        TargetModel(type=TargetType.POWER, low=300, high=250)
+
+
+# -------------------------
+# Laps
+# -------------------------
+def test_laps_per_interval():
+    clock = ManualClock()
+    timer = _timer(
+        clock,
+        [IntervalModel(seconds=10, name="work"), IntervalModel(seconds=5, name="rest")],
+    )
+    tracker = WorkoutTracker(timer)
+
+    distance = 0.0
+    for second in range(16):
+        watts = 300 if second < 10 else 100
+        tracker.on_sample(MetricsKey.POWER, watts + second % 2, clock.monotonic())
+        tracker.on_sample(MetricsKey.DISTANCE, distance, clock.monotonic())
+        distance += 10
+        clock.advance(1)
+
+    laps = tracker.laps()
+    assert [lap.name for lap in laps] == ["work", "rest"]
+    work, rest = laps
+    assert work.lap_number == 1
+    assert work.duration == 10
+    assert work.power.count == 10
+    assert work.power.min == 300
+    assert work.power.max == 301
+    assert work.power.avg == 300.5
+    assert work.distance == 90
+    assert work.heart_rate.count == 0
+    assert work.heart_rate.avg is None
+    assert rest.power.avg == 100.4
+
+    timer.stop()
+    laps = tracker.laps()
+    assert len(laps) == 3
+    assert laps[-1].round_number == 2
+    assert laps[-1].duration == 1
+
+
+def test_laps_reset_on_new_run():
+    clock = ManualClock()
+    timer = _timer(clock, [IntervalModel(seconds=5, name="a")])
+    tracker = WorkoutTracker(timer)
+    tracker.on_sample(MetricsKey.POWER, 100, clock.monotonic())
+    clock.advance(6)
+    assert len(tracker.laps()) == 1
+
+    timer.start()
+    assert tracker.laps() == []
+
+
+def test_lap_numbers_keep_counting_past_max_laps():
+    clock = ManualClock()
+    timer = _timer(clock, [IntervalModel(seconds=1, name="sprint")])
+    tracker = WorkoutTracker(timer, max_laps=3)
+    for _ in range(6):
+        tracker.on_sample(MetricsKey.POWER, 500, clock.monotonic())
+        clock.advance(1)
+
+    assert [lap.lap_number for lap in tracker.laps()] == [4, 5, 6]
+
+    timer.start()
+    tracker.on_sample(MetricsKey.POWER, 500, clock.monotonic())
+    clock.advance(1)
+    assert [lap.lap_number for lap in tracker.laps()] == [1]